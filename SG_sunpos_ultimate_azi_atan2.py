@@ -10,11 +10,70 @@ import pandas as pd
 
 from datetime import datetime
 
+J2000 = datetime(2000, 1, 1, 12)  # epoch of the almanac day count
+J2000_EPOCH_SECONDS = 946728000.0  # J2000.0 in seconds from the unix epoch 1970-01-01 00:00 UTC
+
 
 def modulo(A, P):
     return A - math.floor(A / P) * P
 
 
+class Observer:
+    """
+    An observer position with the terms of the solar angle equations that
+    depend only on the observer computed once: the sine and cosine of the
+    latitude and the longitude in radians. Pass an Observer in place of the
+    latitude, and no longitude, to solar_geometry and the solar angle functions
+    to evaluate many times for one place.
+
+    latitude and longitude may be numpy arrays to describe many observers.
+    """
+    __slots__ = ("latitude", "longitude", "sin_lat", "cos_lat", "lon_rad")
+
+    def __init__(self, latitude, longitude=0.0):
+        self.latitude = latitude
+        self.longitude = longitude
+        if is_scalar(latitude) and is_scalar(longitude):
+            PHIo = math.radians(latitude)
+            self.sin_lat = math.sin(PHIo)
+            self.cos_lat = math.cos(PHIo)
+            self.lon_rad = math.radians(longitude)
+        else:
+            PHIo = np.radians(np.asarray(latitude, dtype=np.float64))
+            self.sin_lat = np.sin(PHIo)
+            self.cos_lat = np.cos(PHIo)
+            self.lon_rad = np.radians(np.asarray(longitude, dtype=np.float64))
+
+    def take(self, index):
+        """
+        The observers at index of an Observer of arrays. A single observer returns itself.
+        """
+        if is_scalar(self.latitude) and is_scalar(self.longitude):
+            return self
+        observer = Observer.__new__(Observer)
+        for name, value in zip(Observer.__slots__, np.broadcast_arrays(
+                self.latitude, self.longitude, self.sin_lat, self.cos_lat, self.lon_rad)):
+            setattr(observer, name, value[index])
+        return observer
+
+    def __repr__(self):
+        return "Observer(%r, %r)" % (self.latitude, self.longitude)
+
+
+def is_scalar(x):
+    # isinstance first: np.ndim costs more than the solar equations of one sample
+    return isinstance(x, (int, float)) or np.ndim(x) == 0
+
+
+def as_observer(latitude, longitude):
+    """
+    Return latitude if it is already an Observer, else the Observer at latitude, longitude
+    """
+    if isinstance(latitude, Observer):
+        return latitude
+    return Observer(latitude, longitude)
+
+
 def constants():
     """ The standard constants in the solar equations.  """
 
@@ -35,10 +94,19 @@ def astronomical_almanac(date):
     :       : esd   - earth-sun distance in a.u.
     :       : eot   - equation of time in mysterious units
     """
+    return astronomical_almanac_j2000(days_since_j2000(date))
+
+
+def astronomical_almanac_j2000(n):
+    """
+    astronomical_almanac for a time given as a float number of days from J2000.0
+
+    :param n: number of days from J2000.0 as a float
+    :return : delta, esd, eot as in astronomical_almanac
+    """
 
     pi, rpd, dpr = constants()
 
-    n = (date - datetime(2000, 1, 1, 12)).total_seconds() / 86400                                                 #       n: Number of days from J2000.0.
     L = modulo(280.460 + 0.9856474 * n, 360.0)                                                                    #       L: Mean longitude of the Sun, corrected for aberration, in deg.
     g = modulo(357.528 + 0.9856003 * n, 360.0)                                                                    #       g: Mean anomaly, in deg.
     lamb = modulo(L + 1.915 * math.sin(g * rpd) + 0.020 * math.sin(2 * g * rpd), 360.0)                           #    lamb: Ecliptic longitude, in deg.
@@ -51,6 +119,46 @@ def astronomical_almanac(date):
     return delta, esd, eot
 
 
+def days_since_j2000(date):
+    """
+    Given a datetime return the number of days from J2000.0 as a float.
+    """
+    return (date - J2000).total_seconds() / 86400
+
+
+def days_since_j2000_of_epoch(seconds):
+    """
+    Given seconds from the unix epoch as a float or numpy array
+    return the number of days from J2000.0
+    """
+    return (np.asarray(seconds, dtype=np.float64) - J2000_EPOCH_SECONDS) / 86400
+
+
+def astronomical_almanac_array(n):
+    """
+    Vectorized astronomical_almanac. The same equations evaluated with numpy
+    over any number of times at once.
+
+    :param n: number of days from J2000.0 as a float or numpy array
+    :return : delta - solar declination in degrees
+    :       : esd   - earth-sun distance in a.u.
+    :       : eot   - equation of time in degrees (range: -180, 180)
+    """
+    pi, rpd, dpr = constants()
+
+    n = np.asarray(n, dtype=np.float64)
+    L = np.mod(280.460 + 0.9856474 * n, 360.0)
+    g = np.mod(357.528 + 0.9856003 * n, 360.0)
+    lamb = np.mod(L + 1.915 * np.sin(g * rpd) + 0.020 * np.sin(2 * g * rpd), 360.0)
+    epsilon = 23.439 - 0.0000004 * n
+    alpha = np.mod(np.arctan2(np.cos(epsilon * rpd) * np.sin(lamb * rpd), np.cos(lamb * rpd)) / rpd, 360.0)
+    delta = np.arcsin(np.sin(epsilon * rpd) * np.sin(lamb * rpd)) / rpd
+    esd = 1.00014 - 0.01671 * np.cos(g * rpd) - 0.00014 * np.cos(2 * g * rpd)
+    eot = np.mod((L - alpha) + 180.0, 360.0) - 180.0
+
+    return delta, esd, eot
+
+
 def solar_angle_equations(delta, sunlon, latitude, longitude):
     """
     Creates the solar zenith angle and solar azimuth angle values.
@@ -121,7 +229,7 @@ def solar_geometry_dataframe(date, latitudes, longitudes):
     return ds, delta, sunlon, esd, eot
 
 
-def solar_angle_equations_no_df(delta, sunlon, latitude, longitude):
+def solar_angle_equations_no_df(delta, sunlon, latitude, longitude=None):
     """
     Creates the solar zenith angle and solar azimuth angle values.
     This function uses math functions and not numpy.
@@ -129,12 +237,15 @@ def solar_angle_equations_no_df(delta, sunlon, latitude, longitude):
 
     :param     delta: coaltitude (declination) of sun in degrees, same as sunlat.
     :param    sunlon: the longitude of the subsolar point in degrees
-    :param  latitude: observer latitude in degrees float
-    :param longitude: observer longitude in degrees float
+    :param  latitude: observer latitude in degrees float, or an Observer
+    :param longitude: observer longitude in degrees float. Not used with an Observer
 
     :return : sza - solar zenith angle (coaltitude) in degrees
     :       : saa - solar azimuth angle in degrees
     """
+    if isinstance(latitude, Observer):
+        return solar_angle_equations_observer(delta, sunlon, latitude)
+
     sunlat = delta
 
     PHIo = math.radians(latitude)
@@ -153,14 +264,58 @@ def solar_angle_equations_no_df(delta, sunlon, latitude, longitude):
     return sza, saa
 
 
-def solar_geometry(date, latitude, longitude):
+def solar_angle_equations_observer(delta, sunlon, observer):
+    """
+    solar_angle_equations_no_df for an Observer. Only the sun's terms are computed per call.
+
+    :param    delta: declination of sun in degrees
+    :param   sunlon: the longitude of the subsolar point in degrees
+    :param observer: Observer with float latitude and longitude
+
+    :return : sza, saa in degrees as in solar_angle_equations_no_df
+    """
+    PHIs = math.radians(delta)
+    dLAM = math.radians(sunlon) - observer.lon_rad
+
+    sin_PHIs = math.sin(PHIs)
+    cos_PHIs = math.cos(PHIs)
+    cos_dLAM = math.cos(dLAM)
+
+    Sx = cos_PHIs * math.sin(dLAM)
+    Sy = observer.cos_lat * sin_PHIs - observer.sin_lat * cos_PHIs * cos_dLAM
+    Sz = observer.sin_lat * sin_PHIs + observer.cos_lat * cos_PHIs * cos_dLAM
+
+    sza = math.degrees(math.acos(Sz))
+    saa = math.degrees(math.atan2(Sx, Sy))  # North-Clockwise Convention.
+
+    return sza, saa
+
+
+def solar_cos_zenith_observer(delta, sunlon, observer):
+    """
+    Cosine of the solar zenith angle for an Observer, the Sz of solar_angle_equations_observer.
+    Classifying the sun against zenith angle limits needs no angle: compare Sz with
+    the cosines of the limits instead of paying for acos and the degree conversions.
+
+    :param    delta: declination of sun in degrees
+    :param   sunlon: the longitude of the subsolar point in degrees
+    :param observer: Observer with float latitude and longitude
+
+    :return : cos(sza), 1 with the sun at the zenith and -1 at the nadir
+    """
+    PHIs = math.radians(delta)
+    return observer.sin_lat * math.sin(PHIs) + \
+        observer.cos_lat * math.cos(PHIs) * math.cos(math.radians(sunlon) - observer.lon_rad)
+
+
+def solar_geometry(date, latitude, longitude=None):
     """ solar_geometry
 
     Given a time, observer lat and lon, return solar azimuth and elevation
 
     :param : date - observation time as datetime object
-    :param : latitude - observer latitude in floating degrees
-    :param : longitude - observer longitude in floating degrees
+    :param : latitude - observer latitude in floating degrees, or an Observer
+    :param : longitude - observer longitude in floating degrees. Not used with an Observer
 
     :return
     :    : results from observer's position
@@ -182,6 +337,247 @@ def solar_geometry(date, latitude, longitude):
     return sza, saa, sunlat, sunlon, esd, eot
 
 
+def solar_angle_equations_array(delta, sunlon, latitude, longitude=None):
+    """
+    Numpy version of solar_angle_equations_no_df. Arguments broadcast
+    against each other so one observer may be evaluated at many times
+    or many observers at one time.
+
+    :param     delta: declination of sun in degrees
+    :param    sunlon: the longitude of the subsolar point in degrees
+    :param  latitude: observer latitude in degrees, or an Observer
+    :param longitude: observer longitude in degrees. Not used with an Observer
+
+    :return : sza - solar zenith angle in degrees
+    :       : saa - solar azimuth angle in degrees, north-clockwise
+    """
+    observer = as_observer(latitude, longitude)
+    PHIs = np.radians(delta)
+    dLAM = np.radians(sunlon) - observer.lon_rad
+
+    sin_PHIs = np.sin(PHIs)
+    cos_PHIs = np.cos(PHIs)
+    cos_dLAM = np.cos(dLAM)
+
+    Sx = cos_PHIs * np.sin(dLAM)
+    Sy = observer.cos_lat * sin_PHIs - observer.sin_lat * cos_PHIs * cos_dLAM
+    Sz = observer.sin_lat * sin_PHIs + observer.cos_lat * cos_PHIs * cos_dLAM
+
+    sza = np.degrees(np.arccos(np.clip(Sz, -1.0, 1.0)))
+    saa = np.degrees(np.arctan2(Sx, Sy))
+
+    return sza, saa
+
+
+def solar_cos_zenith_array(delta, sunlon, latitude, longitude=None):
+    """
+    Numpy version of solar_cos_zenith_observer. Arguments broadcast as in solar_angle_equations_array.
+
+    :param     delta: declination of sun in degrees
+    :param    sunlon: the longitude of the subsolar point in degrees
+    :param  latitude: observer latitude in degrees, or an Observer
+    :param longitude: observer longitude in degrees. Not used with an Observer
+
+    :return : cos(sza), clipped to -1..1
+    """
+    observer = as_observer(latitude, longitude)
+    PHIs = np.radians(delta)
+    cos_dLAM = np.cos(np.radians(sunlon) - observer.lon_rad)
+
+    Sz = observer.sin_lat * np.sin(PHIs) + observer.cos_lat * np.cos(PHIs) * cos_dLAM
+    return np.clip(Sz, -1.0, 1.0)
+
+
+def solar_cos_zenith_grid(delta, sunlon, latitudes, longitudes):
+    """
+    Cosines of the solar zenith angles at one instant over a latitude x longitude grid.
+    cos(zenith) = sin(lat) sin(delta) + cos(lat) cos(delta) cos(lon - sunlon)
+    separates into a latitude column and a longitude row, so the full grid
+    costs one multiply-add per point.
+
+    :param     delta: declination of sun in degrees
+    :param    sunlon: the longitude of the subsolar point in degrees
+    :param latitudes: 1-D numpy array of latitudes in degrees, the grid rows
+    :param longitudes: 1-D numpy array of longitudes in degrees, the grid columns
+
+    :return : cos(sza) shaped (len(latitudes), len(longitudes)), clipped to -1..1
+    """
+    PHIo = np.radians(np.asarray(latitudes, dtype=np.float64))[:, np.newaxis]
+    PHIs = math.radians(delta)
+    cos_dLAM = np.cos(np.radians(np.asarray(longitudes, dtype=np.float64) - sunlon))[np.newaxis, :]
+
+    Sz = np.sin(PHIo) * math.sin(PHIs) + (np.cos(PHIo) * math.cos(PHIs)) * cos_dLAM
+    return np.clip(Sz, -1.0, 1.0, out=Sz)
+
+
+def solar_zenith_grid(delta, sunlon, latitudes, longitudes):
+    """
+    Solar zenith angles at one instant over a latitude x longitude grid,
+    the arccos of solar_cos_zenith_grid.
+
+    :return : sza in degrees shaped (len(latitudes), len(longitudes))
+    """
+    return np.degrees(np.arccos(solar_cos_zenith_grid(delta, sunlon, latitudes, longitudes)))
+
+
+def solar_geometry_grid(n, latitudes, longitudes, sun_position=None):
+    """
+    Solar zenith and azimuth angles over a time x latitude x longitude grid.
+    The almanac is evaluated once per time and the observer terms once per latitude.
+
+    :param : n - 1-D numpy array of days from J2000.0
+    :param : latitudes - 1-D numpy array of latitudes in degrees
+    :param : longitudes - 1-D numpy array of longitudes in degrees
+    :param : sun_position - optional function of n returning sunlat, sunlon in degrees,
+    :                       such as an ephemeris backend's. Default the almanac.
+
+    :return : sza, saa in degrees, each shaped (len(n), len(latitudes), len(longitudes))
+    """
+    n = np.asarray(n, dtype=np.float64)
+    if sun_position is None:
+        sunlat, esd, eot = astronomical_almanac_array(n)
+        sunlon = sunlon_of_j2000(n, eot)
+    else:
+        sunlat, sunlon = sun_position(n)
+    observer = Observer(np.asarray(latitudes, dtype=np.float64)[:, np.newaxis],
+                        np.asarray(longitudes, dtype=np.float64)[np.newaxis, :])
+    return solar_angle_equations_array(sunlat[:, np.newaxis, np.newaxis], sunlon[:, np.newaxis, np.newaxis],
+                                       observer)
+
+
+def culmination_zeniths(latitude, dec_min, dec_max):
+    """
+    Bounds on the solar zenith angle at a latitude while the declination stays
+    within dec_min..dec_max. The sun is highest at upper culmination, zenith
+    |latitude - dec|, and lowest at lower culmination, zenith 180 - |latitude + dec|.
+    Arguments broadcast, so per-day declination ranges give per-day bounds.
+
+    :param latitude: observer latitude in degrees
+    :param  dec_min: least declination in degrees
+    :param  dec_max: greatest declination in degrees
+
+    :return : zenith_min, zenith_max in degrees
+    """
+    zenith_min = np.where((dec_min <= latitude) & (latitude <= dec_max), 0.0,
+                          np.minimum(np.abs(latitude - dec_min), np.abs(latitude - dec_max)))
+    zenith_max = 180.0 - np.where((dec_min <= -latitude) & (-latitude <= dec_max), 0.0,
+                                  np.minimum(np.abs(latitude + dec_min), np.abs(latitude + dec_max)))
+    return zenith_min, zenith_max
+
+
+def rounded_hour_of_j2000(n):
+    """
+    Hour of the day at n days from J2000.0 as solar_geometry takes it from a datetime:
+    the whole hours plus the minutes and seconds rounded to 1/1000 hour.
+    """
+    seconds = np.round(np.mod(np.asarray(n, dtype=np.float64) + 0.5, 1.0) * 86400.0)
+    return np.floor(seconds / 3600.0) + np.round(np.mod(seconds, 3600.0) / 3600.0, 3)
+
+
+def sunlon_of_j2000(n, eot, rounded_hour=False):
+    """
+    Longitude of the subsolar point at n days from J2000.0.
+    J2000.0 is noon GMT so the hour of the day is the fraction
+    of (n + 0.5) scaled to 24 hours. With rounded_hour the hour
+    is rounded like solar_geometry's, see rounded_hour_of_j2000.
+    """
+    if rounded_hour:
+        hour = rounded_hour_of_j2000(n)
+    else:
+        hour = np.mod(np.asarray(n, dtype=np.float64) + 0.5, 1.0) * 24.0
+    return -15.0 * (hour - 12.0 + eot * 4 / 60)  # eot*4 is Equation of Time in minutes.
+
+
+def solar_geometry_array(n, latitude, longitude=None):
+    """
+    Vectorized solar_geometry. Times are given as days from J2000.0
+    so callers build one numpy array of times instead of a datetime per sample.
+
+    :param : n - days from J2000.0, float or numpy array
+    :param : latitude - observer latitude in floating degrees, or an Observer
+    :param : longitude - observer longitude in floating degrees. Not used with an Observer
+
+    :return : sza, saa, sunlat, sunlon, esd, eot as in solar_geometry
+    """
+    sunlat, esd, eot = astronomical_almanac_array(n)
+    sunlon = sunlon_of_j2000(n, eot)
+    sza, saa = solar_angle_equations_array(sunlat, sunlon, latitude, longitude)
+
+    return sza, saa, sunlat, sunlon, esd, eot
+
+
+def solar_geometry_j2000(n, latitude, longitude=None):
+    """
+    solar_geometry for times given as days from J2000.0 instead of a datetime.
+    A float time with a single observer is computed with math functions,
+    arrays of times or observers with numpy. The hour of the day is taken from n
+    as is and not rounded to the millisecond-hour as solar_geometry does.
+
+    :param : n - days from J2000.0, float or numpy array
+    :param : latitude - observer latitude in floating degrees, or an Observer
+    :param : longitude - observer longitude in floating degrees. Not used with an Observer
+
+    :return : sza, saa, sunlat, sunlon, esd, eot as in solar_geometry
+    """
+    observer = as_observer(latitude, longitude)
+    if not (is_scalar(n) and isinstance(observer.sin_lat, float) and isinstance(observer.lon_rad, float)):
+        return solar_geometry_array(n, observer)
+
+    n = float(n)
+    hour = modulo(n + 0.5, 1.0) * 24.0  # J2000.0 is noon GMT
+
+    sunlat, esd, eot = astronomical_almanac_j2000(n)
+
+    sunlon = -15.0 * (hour - 12.0 + eot * 4 / 60)  # eot*4 is Equation of Time in minutes.
+    sza, saa = solar_angle_equations_observer(sunlat, sunlon, observer)
+
+    return sza, saa, sunlat, sunlon, esd, eot
+
+
+def solar_cos_zenith_j2000(n, latitude, longitude=None):
+    """
+    Cosine of the solar zenith angle for times given as days from J2000.0,
+    for callers that only classify the sun against zenith angle limits.
+    A float time with a single observer is computed with math functions,
+    arrays of times or observers with numpy, as in solar_geometry_j2000.
+
+    :param : n - days from J2000.0, float or numpy array
+    :param : latitude - observer latitude in floating degrees, or an Observer
+    :param : longitude - observer longitude in floating degrees. Not used with an Observer
+
+    :return : cos(sza)
+    """
+    observer = as_observer(latitude, longitude)
+    if not (is_scalar(n) and isinstance(observer.sin_lat, float) and isinstance(observer.lon_rad, float)):
+        sunlat, esd, eot = astronomical_almanac_array(n)
+        return solar_cos_zenith_array(sunlat, sunlon_of_j2000(n, eot), observer)
+
+    n = float(n)
+    hour = modulo(n + 0.5, 1.0) * 24.0  # J2000.0 is noon GMT
+
+    sunlat, esd, eot = astronomical_almanac_j2000(n)
+
+    sunlon = -15.0 * (hour - 12.0 + eot * 4 / 60)  # eot*4 is Equation of Time in minutes.
+    return solar_cos_zenith_observer(sunlat, sunlon, observer)
+
+
+def solar_geometry_epoch(seconds, latitude, longitude=None):
+    """
+    solar_geometry_j2000 for times given as seconds from the unix epoch (UTC),
+    for example time.time() or numpy datetime64 values cast to float seconds.
+
+    :param : seconds - seconds from 1970-01-01 00:00 UTC, float or numpy array
+    :param : latitude - observer latitude in floating degrees, or an Observer
+    :param : longitude - observer longitude in floating degrees. Not used with an Observer
+
+    :return : sza, saa, sunlat, sunlon, esd, eot as in solar_geometry
+    """
+    n = days_since_j2000_of_epoch(seconds)
+    if n.ndim == 0:
+        n = float(n)
+    return solar_geometry_j2000(n, latitude, longitude)
+
+
 if __name__ == '__main__':
 
     # My Single Case
@@ -75,6 +75,8 @@ import math
 import sys
 from math import sin, cos, asin, acos, radians, degrees
 
+import numpy as np
+
 
 class SolarLat:
     def __init__(self, obliquity_deg=23.44):
@@ -125,6 +127,31 @@ class SolarLat:
 
         raise Exception('bad version', 'bad version')
 
+    def lat_of_day_array(self, day_numbers):
+        """
+        Vectorized lat_of_day. Given a numpy array of day numbers N
+        return the latitude of the sun in degrees for each.
+        """
+        day_numbers = np.asarray(day_numbers, dtype=np.float64)
+        if self.computational_model == 1:
+            return -self.obliquity_deg * \
+                   np.cos(self.orbital_radians_per_day *
+                          (day_numbers + self.jan1_days_since_winter_solstice))
+
+        if self.computational_model == 2:
+            return -np.degrees(np.arcsin(self.sin_of_obliquity *
+                                         np.cos(self.orbital_radians_per_day *
+                                                (day_numbers + self.jan1_days_since_winter_solstice) +
+                                                (self.eccentricity_const_rad *
+                                                 np.sin(self.orbital_radians_per_day *
+                                                        (day_numbers - self.jan1_days_before_perihelion))
+                                                 )
+                                                )
+                                         )
+                               )
+
+        raise Exception('bad version', 'bad version')
+
     @staticmethod
     def solve_for_a(A, b, c):
         """
@@ -5,7 +5,11 @@
 
 # developed with ffmpeg version 6.0.1
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from optparse import OptionParser
+import os
 import subprocess
+import sys
 
 do_1 = True  # generate year-view png files
 do_2 = True  # render year-view mp4
@@ -17,22 +21,97 @@ do_6 = False  # render polar day-views mp4
 day_views_lats = [0.0, 42.5]
 
 
+# twilight.py keeps the static chrome of each view here between batches
+chrome_cache = "chrome-cache"
+
+
+def split_range(first, last, parts):
+    """
+    Split the integers first..last into up to parts contiguous (first, last) ranges
+    """
+    count = last - first + 1
+    parts = max(1, min(parts, count))
+    bounds = [first + count * k // parts for k in range(parts + 1)]
+    return [(bounds[k], bounds[k + 1] - 1) for k in range(parts)]
+
+
+def render_batch(name, cmd):
+    """
+    Render a batch of frames with one twilight.py process.
+    Its per-frame progress is passed through to stdout and its errors go to stderr.
+    twilight.py goes on past a frame that fails and prints 'FAILED filename' for it.
+    Return (name, returncode, failed filenames)
+    """
+    failed = []
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True) as process:
+        for line in process.stdout:
+            print(line, end="", flush=True)
+            if line.startswith("FAILED "):
+                failed.append(line[len("FAILED "):].strip())
+    return name, process.returncode, failed
+
+
+def render_batches(batches, jobs):
+    """
+    Render a list of (name, cmd) twilight.py batches with up to jobs processes
+    running at once. Each batch renders a disjoint range of frames into
+    deterministic filenames so the order in which batches finish does not matter.
+    Return the failed frame filenames and the names of failed batches that named none,
+    such as a batch that could not start.
+    """
+    failed_frames = []
+    failed_batches = []
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(render_batch, name, cmd) for name, cmd in batches]
+        for future in as_completed(futures):
+            name, returncode, failed = future.result()
+            failed_frames += failed
+            if returncode != 0 and not failed:
+                failed_batches.append(name)
+                print("%s FAILED with exit status %d" % (name, returncode))
+    return sorted(failed_frames), sorted(failed_batches)
+
+
+def twilight_cmd(*args):
+    """
+    A twilight.py batch command line with the shared writer and chrome cache options
+    """
+    return ["python", "../twilight.py", "--writers", "%d" % options.writers,
+            "--chrome-cache", chrome_cache] + list(args)
+
+
+parser = OptionParser()
+parser.add_option("-j", "--jobs", action="store", type="int", dest="jobs", default=os.cpu_count(),
+                  help="Number of twilight.py batch processes to run concurrently. default=number of CPUs")
+parser.add_option("-w", "--writers", action="store", type="int", dest="writers", default=1,
+                  help="Threads per twilight.py process that encode and write frames. default=1")
+(options, args) = parser.parse_args()
+
+if options.jobs < 1:
+    parser.error("--jobs must be at least 1")
+if options.writers < 1:
+    parser.error("--writers must be at least 1")
+
+failed_frames = []
+failed_batches = []
+
 if do_1:
     print("Generating year-view png files")
-    
+
     # Generate year-view .png files for latitudes -90..90
     # Files are named <prefix>_110..<prefix>_290, centered on 200
 
     base_n = 200
 
-    for i in range(-90, 91):
-        file_n = base_n + i
-        filename = "twilight_year_%03d.png" % (base_n + i)
-        print("Generating file for latitude ", i, "as file ", filename)
-    
-        cmd = ["python", "../twilight.py", "-o", "%d" % i, "-f", filename, "--no-autoview"]
+    batches = []
+    for first, last in split_range(-90, 90, options.jobs):
+        cmd = twilight_cmd("--o-lat-range", "%d:%d" % (first, last), "--first-index", "%d" % (base_n + first),
+                           "--filename-template", "twilight_year_{index:03d}.png")
+        batches.append(("year-view latitudes %d..%d" % (first, last), cmd))
 
-        subprocess.run(cmd)
+    frames, failed = render_batches(batches, options.jobs)
+    failed_frames += frames
+    failed_batches += failed
 
 if do_2:
     print("Rendering year-view mp4")
@@ -45,16 +124,19 @@ if do_2:
     subprocess.run(cmd)
 
 if do_3:
+    batches = []
     for observer_lat in day_views_lats:
         print("generate cartesian day-view files for at latitude %f"  % observer_lat)
 
-        for day in range(365):
-            filename = "twilight_day_%03d_lat_%04.1f.png" % (day, observer_lat)
-            print("Generating file for day ", day, "as file ", filename)
-            cmd = ["python", "../twilight.py", "-o", "%f" % observer_lat,
-                   "--show-day", "-d", "%d" % day, "-f", filename, "--no-autoview"]
+        template = "twilight_day_{day:03d}_lat_%04.1f.png" % observer_lat
+        for first, last in split_range(0, 364, options.jobs):
+            cmd = twilight_cmd("-o", "%f" % observer_lat, "--show-day", "--day-range", "%d:%d" % (first, last),
+                               "--filename-template", template)
+            batches.append(("cartesian day-view latitude %.1f days %d..%d" % (observer_lat, first, last), cmd))
 
-            subprocess.run(cmd)
+    frames, failed = render_batches(batches, options.jobs)
+    failed_frames += frames
+    failed_batches += failed
 
 if do_4:
     for observer_lat in day_views_lats:
@@ -70,16 +152,19 @@ if do_4:
         subprocess.run(cmd)
 
 if do_5:
+    batches = []
     for observer_lat in day_views_lats:
         print("generate polar day-view files for at latitude %f"  % observer_lat)
 
-        for day in range(365):
-            filename = "twilight_day_polar_%03d_lat_%04.1f.png" % (day, observer_lat)
-            print("Generating file for day ", day, "as file ", filename)
-            cmd = ["python", "../twilight.py", "-o", "%f" % observer_lat, "--show-day",
-                   "--polar", "-d", "%d" % day, "-f", filename, "--no-autoview"]
+        template = "twilight_day_polar_{day:03d}_lat_%04.1f.png" % observer_lat
+        for first, last in split_range(0, 364, options.jobs):
+            cmd = twilight_cmd("-o", "%f" % observer_lat, "--show-day", "--polar",
+                               "--day-range", "%d:%d" % (first, last), "--filename-template", template)
+            batches.append(("polar day-view latitude %.1f days %d..%d" % (observer_lat, first, last), cmd))
 
-            subprocess.run(cmd)
+    frames, failed = render_batches(batches, options.jobs)
+    failed_frames += frames
+    failed_batches += failed
 
 if do_6:
     for observer_lat in day_views_lats:
@@ -92,3 +177,14 @@ if do_6:
                "twilight-day-polar-lat-%04.1f.mp4" % observer_lat]
 
         subprocess.run(cmd)
+
+if failed_frames:
+    print("%d frames failed:" % len(failed_frames))
+    for filename in failed_frames:
+        print("  %s" % filename)
+if failed_batches:
+    print("%d batches failed:" % len(failed_batches))
+    for name in failed_batches:
+        print("  %s" % name)
+if failed_frames or failed_batches:
+    sys.exit(1)
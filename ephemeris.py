@@ -0,0 +1,425 @@
+#!/usr/bin/python
+# ephemeris - interchangeable solar position models
+#
+# The project has two independent models of where the sun is:
+#
+#  * almanac   - SG.astronomical_almanac, the 'Astronomical Almanac' equations
+#                with declination, equation of time and earth-sun distance.
+#  * solarlat1 - SolarLat computational_model 1, a cosine of the day number.
+#  * solarlat2 - SolarLat computational_model 2, with orbital eccentricity.
+#  * chebyshev - Chebyshev polynomials fitted to the almanac over 32 day segments.
+#                A few multiply-adds per sample instead of the trig series.
+#
+# The SolarLat models give only the declination. They have no equation of time
+# so the sun crosses the prime meridian at exactly 12:00 GMT every day.
+#
+# Every backend takes times as days from J2000.0 in numpy arrays and returns
+# numpy arrays. Views and research scripts pick one with --ephemeris NAME.
+#
+# Compare the backends' speed and accuracy:
+#
+# > python ephemeris.py --report --tolerance 0.5
+#
+# Fit and save Chebyshev coefficients for a range of years:
+#
+# > python ephemeris.py --fit-chebyshev --year 2019 --years 12 -f chebyshev-2019-2030.npz
+#
+# Views and research scripts use saved coefficients with --chebyshev FILE,
+# which selects the chebyshev ephemeris. Segments outside the file are fitted
+# when first needed.
+#
+# > python twilight.py --chebyshev chebyshev-2019-2030.npz
+#
+
+from optparse import OptionParser
+import datetime
+import sys
+import time
+import traceback
+
+import numpy as np
+
+import SG_sunpos_ultimate_azi_atan2 as SG
+from SolarLat import SolarLat
+from numpy.polynomial import chebyshev
+
+J2000_DT64 = np.datetime64(SG.J2000.isoformat(), 'us')
+
+
+def day_of_year_numbers(n):
+    """
+    Given days from J2000.0 return the SolarLat day number N:
+    days since midnight GMT as January 1 of the same year begins.
+    """
+    t = J2000_DT64 + np.round(np.asarray(n, dtype=np.float64) * 86400e6).astype('timedelta64[us]')
+    jan1 = t.astype('datetime64[Y]').astype('datetime64[us]')
+    return (t - jan1) / np.timedelta64(1, 'D')
+
+
+class Ephemeris:
+    """
+    Solar position as a function of time.
+    Subclasses provide almanac(); the rest is shared.
+    """
+    name = None
+    description = ""
+
+    def almanac(self, n):
+        """
+        :param n: days from J2000.0, float or numpy array
+        :return : delta - solar declination in degrees
+        :       : esd   - earth-sun distance in a.u.
+        :       : eot   - equation of time in degrees
+        """
+        raise NotImplementedError()
+
+    def sun_position(self, n, rounded_hour=False):
+        """
+        Return the subsolar point: sunlat, sunlon in degrees.
+        With rounded_hour the subsolar longitude takes the hour rounded
+        to 1/1000 hour like SG.solar_geometry.
+        """
+        delta, esd, eot = self.almanac(n)
+        return delta, SG.sunlon_of_j2000(n, eot, rounded_hour)
+
+    def solar_geometry(self, n, latitude, longitude=None):
+        """
+        Return solar zenith and azimuth angles in degrees seen by an observer.
+        latitude may be an SG.Observer in place of latitude and longitude.
+        """
+        sunlat, sunlon = self.sun_position(n)
+        return SG.solar_angle_equations_array(sunlat, sunlon, latitude, longitude)
+
+
+class AlmanacEphemeris(Ephemeris):
+    name = "almanac"
+    description = "Astronomical Almanac equations (SG module)"
+
+    def almanac(self, n):
+        return SG.astronomical_almanac_array(n)
+
+
+class SolarLatEphemeris(Ephemeris):
+    def __init__(self, computational_model):
+        self.solar_lat = SolarLat()
+        self.solar_lat.computational_model = computational_model
+        self.name = "solarlat%d" % computational_model
+        self.description = "SolarLat computational model %d, no equation of time" % computational_model
+
+    def almanac(self, n):
+        delta = self.solar_lat.lat_of_day_array(day_of_year_numbers(n))
+        zeros = np.zeros_like(delta)
+        return delta, zeros + 1.0, zeros
+
+
+class ChebyshevEphemeris(Ephemeris):
+    """
+    Declination, earth-sun distance and equation of time as Chebyshev series
+    fitted to a reference ephemeris. Time is cut into segments of segment_days
+    days aligned on J2000.0. Each segment is fitted the first time it is needed
+    and remembers its largest error against the reference.
+    """
+    name = "chebyshev"
+    description = "Chebyshev series fitted to the almanac per 32 day segment"
+
+    # samples per segment when measuring the fit error
+    ERROR_SAMPLES = 4096
+
+    def __init__(self, segment_days=32, degree=8, reference=None):
+        self.segment_days = segment_days
+        self.degree = degree
+        self.reference = reference if reference is not None else AlmanacEphemeris()
+        # segment number -> coefficients shaped (3, degree + 1) for delta, esd, eot
+        self.coefficients = {}
+        # segment number -> largest absolute errors of delta, esd, eot
+        self.errors = {}
+
+    def fit_segment(self, k):
+        """
+        Fit segment k, days k*segment_days .. (k+1)*segment_days from J2000.0
+        """
+        # interpolate at the Chebyshev points of the first kind
+        x = np.cos(np.pi * (np.arange(self.degree + 1) + 0.5) / (self.degree + 1))
+        values = self.reference.almanac(self.segment_n(k, x))
+        coefficients = np.array([chebyshev.chebfit(x, value, self.degree) for value in values])
+
+        x = np.linspace(-1.0, 1.0, ChebyshevEphemeris.ERROR_SAMPLES)
+        values = self.reference.almanac(self.segment_n(k, x))
+        errors = [float(np.max(np.abs(chebyshev.chebval(x, c) - value)))
+                  for c, value in zip(coefficients, values)]
+
+        self.coefficients[k] = coefficients
+        self.errors[k] = np.array(errors)
+
+    def segment_n(self, k, x):
+        # days from J2000.0 of segment k at segment coordinates x in -1..1
+        return (k + (x + 1.0) / 2.0) * self.segment_days
+
+    def fit(self, n_first, n_last):
+        """
+        Fit every segment from day n_first to day n_last from J2000.0
+        """
+        for k in range(int(np.floor(n_first / self.segment_days)), int(np.floor(n_last / self.segment_days)) + 1):
+            if k not in self.coefficients:
+                self.fit_segment(k)
+
+    def max_errors(self):
+        """
+        Largest absolute errors of delta (degrees), esd (a.u.) and eot (degrees)
+        over all fitted segments
+        """
+        return np.max(np.array(list(self.errors.values())), axis=0)
+
+    def almanac(self, n):
+        n = np.asarray(n, dtype=np.float64)
+        flat = n.ravel()
+        order = None
+        if flat.size > 1 and np.any(flat[1:] < flat[:-1]):
+            # evaluate in time order so each segment is one contiguous slice
+            order = np.argsort(flat, kind='stable')
+            flat = flat[order]
+
+        segments = np.floor(flat / self.segment_days)
+        x = 2.0 * (flat / self.segment_days - segments) - 1.0
+        result = np.empty((3, flat.size))
+        bounds = np.flatnonzero(np.diff(segments)) + 1
+        for first, last in zip(np.concatenate(([0], bounds)), np.concatenate((bounds, [flat.size]))):
+            k = int(segments[first])
+            if k not in self.coefficients:
+                self.fit_segment(k)
+            for q, c in enumerate(self.coefficients[k]):
+                result[q, first:last] = self.clenshaw(c, x[first:last])
+
+        if order is not None:
+            unsorted = np.empty_like(result)
+            unsorted[:, order] = result
+            result = unsorted
+        return result[0].reshape(n.shape), result[1].reshape(n.shape), result[2].reshape(n.shape)
+
+    @staticmethod
+    def clenshaw(c, x):
+        """
+        Evaluate the Chebyshev series c at x with Clenshaw's recurrence:
+        two multiply-adds per coefficient
+        """
+        b1 = np.zeros_like(x)
+        b2 = np.zeros_like(x)
+        x2 = 2.0 * x
+        for j in range(len(c) - 1, 0, -1):
+            b1, b2 = x2 * b1 - b2 + c[j], b1
+        return x * b1 - b2 + c[0]
+
+    def save(self, filename):
+        """
+        Write the fitted coefficients and their errors to a .npz file
+        """
+        ks = sorted(self.coefficients)
+        np.savez(filename, segment_days=self.segment_days, degree=self.degree,
+                 segments=np.array(ks, dtype=np.int64),
+                 coefficients=np.array([self.coefficients[k] for k in ks]),
+                 errors=np.array([self.errors[k] for k in ks]))
+
+    @staticmethod
+    def load(filename):
+        """
+        Read coefficients written by save()
+        """
+        with np.load(filename) as npz:
+            ephemeris = ChebyshevEphemeris(int(npz["segment_days"]), int(npz["degree"]))
+            for k, coefficients, errors in zip(npz["segments"], npz["coefficients"], npz["errors"]):
+                ephemeris.coefficients[int(k)] = coefficients
+                ephemeris.errors[int(k)] = errors
+        return ephemeris
+
+
+class TabulatedEphemeris(Ephemeris):
+    """
+    A reference ephemeris tabulated once over a time range and interpolated
+    linearly. Many observers over the same days then share one almanac
+    computation. Hourly steps keep the declination and equation of time within
+    a few millionths of a degree of the reference.
+    """
+    def __init__(self, reference, n_first, n_last, step_days=1.0 / 24):
+        self.reference = reference
+        self.name = reference.name
+        self.description = "%s tabulated every %g days" % (reference.description, step_days)
+        self.n_first = n_first
+        self.step_days = step_days
+        count = int(np.ceil((n_last - n_first) / step_days)) + 2
+        self.table = np.array(reference.almanac(n_first + np.arange(count) * step_days))
+
+    def almanac(self, n):
+        x = (np.asarray(n, dtype=np.float64) - self.n_first) / self.step_days
+        if np.any(x < 0) or np.any(x > self.table.shape[1] - 1):
+            raise Exception("Time outside the tabulated range of the %s ephemeris" % self.name)
+        i = np.minimum(x.astype(np.int64), self.table.shape[1] - 2)
+        t = x - i
+        return tuple(row[i] + (row[i + 1] - row[i]) * t for row in self.table)
+
+
+EPHEMERIDES = {e.name: e for e in [AlmanacEphemeris(), ChebyshevEphemeris(), SolarLatEphemeris(2), SolarLatEphemeris(1)]}
+
+DEFAULT_EPHEMERIS = "almanac"
+
+# The reference for accuracy comparisons
+MOST_ACCURATE_EPHEMERIS = "almanac"
+
+
+def load_chebyshev(filename):
+    """
+    Read Chebyshev coefficients written by --fit-chebyshev and make them
+    the chebyshev backend returned by get_ephemeris("chebyshev")
+    """
+    ephemeris = ChebyshevEphemeris.load(filename)
+    ephemeris.description = "Chebyshev series read from %s, %d segments of %d days" \
+                            % (filename, len(ephemeris.coefficients), ephemeris.segment_days)
+    EPHEMERIDES[ephemeris.name] = ephemeris
+    return ephemeris
+
+
+def get_ephemeris(name=DEFAULT_EPHEMERIS, filename=None):
+    """
+    Return the ephemeris backend called name.
+    With a filename, name must be chebyshev and its coefficients are read from the file.
+    """
+    if filename is not None:
+        if name != ChebyshevEphemeris.name:
+            raise Exception("Only the %s ephemeris is read from a file, not '%s'" % (ChebyshevEphemeris.name, name))
+        return load_chebyshev(filename)
+    if name not in EPHEMERIDES:
+        raise Exception("Unknown ephemeris '%s'. Choose one of: %s" % (name, ", ".join(EPHEMERIDES)))
+    return EPHEMERIDES[name]
+
+
+def year_minutes_j2000(year, days=365):
+    """
+    J2000.0 day numbers of every minute of a year shaped (days, 1440)
+    """
+    n0 = SG.days_since_j2000(datetime.datetime(year, 1, 1))
+    return n0 + np.arange(days)[:, np.newaxis] + np.arange(24 * 60)[np.newaxis, :] / float(24 * 60)
+
+
+def fit_chebyshev(year, years, filename, out=sys.stdout):
+    """
+    Fit Chebyshev coefficients for the given years, save them and print their largest errors
+    """
+    ephemeris = ChebyshevEphemeris()
+    n_first = SG.days_since_j2000(datetime.datetime(year, 1, 1))
+    n_last = SG.days_since_j2000(datetime.datetime(year + years, 1, 1))
+    ephemeris.fit(n_first, n_last)
+    ephemeris.save(filename)
+    max_delta, max_esd, max_eot = ephemeris.max_errors()
+    print("Fitted %d segments of %d days at degree %d for %d..%d"
+          % (len(ephemeris.coefficients), ephemeris.segment_days, ephemeris.degree, year, year + years - 1),
+          file=out)
+    print("Max error vs %s: declination %.3g deg, earth-sun distance %.3g au, equation of time %.3g deg"
+          % (ephemeris.reference.name, max_delta, max_esd, max_eot), file=out)
+    return ephemeris
+
+
+def throughput(ephemeris, n, latitude=42.6, repeats=3):
+    """
+    Return zenith/azimuth samples per second computed by ephemeris over times n
+    """
+    best = None
+    for i in range(repeats):
+        start = time.perf_counter()
+        ephemeris.solar_geometry(n, latitude, 0.0)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return n.size / best
+
+
+def max_errors(ephemeris, reference, n, latitudes):
+    """
+    Return the largest absolute declination and zenith angle differences in degrees
+    between ephemeris and reference over times n and the given observer latitudes
+    """
+    delta = ephemeris.almanac(n)[0]
+    ref_delta = reference.almanac(n)[0]
+    max_delta = float(np.max(np.abs(delta - ref_delta)))
+
+    sunlat, sunlon = ephemeris.sun_position(n)
+    ref_sunlat, ref_sunlon = reference.sun_position(n)
+    max_zenith = 0.0
+    for latitude in latitudes:
+        zenith = SG.solar_angle_equations_array(sunlat, sunlon, latitude, 0.0)[0]
+        ref_zenith = SG.solar_angle_equations_array(ref_sunlat, ref_sunlon, latitude, 0.0)[0]
+        max_zenith = max(max_zenith, float(np.max(np.abs(zenith - ref_zenith))))
+    return max_delta, max_zenith
+
+
+def report(year, tolerance=None, out=sys.stdout):
+    """
+    Print each backend's throughput and its maximum declination and zenith
+    errors against the most accurate backend over every minute of a year.
+    With a tolerance in degrees also name the fastest backend within it.
+    """
+    n = year_minutes_j2000(year)
+    reference = get_ephemeris(MOST_ACCURATE_EPHEMERIS)
+    latitudes = range(-80, 81, 10)
+
+    rows = []
+    for name, ephemeris in EPHEMERIDES.items():
+        rate = throughput(ephemeris, n)
+        max_delta, max_zenith = max_errors(ephemeris, reference, n, latitudes)
+        rows.append((name, rate, max_delta, max_zenith))
+
+    print("Year %d, errors against %s at latitudes -80..80" % (year, reference.name), file=out)
+    print("Ephemeris, Samples/s, Max declination error (deg), Max zenith error (deg)", file=out)
+    for name, rate, max_delta, max_zenith in rows:
+        print("%s, %.0f, %.4f, %.4f" % (name, rate, max_delta, max_zenith), file=out)
+
+    if tolerance is not None:
+        within = [row for row in rows if row[3] <= tolerance]
+        if within:
+            best = max(within, key=lambda row: row[1])
+            print("Fastest ephemeris within %g degrees zenith error: %s" % (tolerance, best[0]), file=out)
+        else:
+            print("No ephemeris is within %g degrees zenith error" % tolerance, file=out)
+    return rows
+
+
+def main_except(argv):
+    parser = OptionParser()
+    parser.add_option("--report", action="store_true", dest="report", default=False,
+                      help="Compare throughput and accuracy of the ephemeris backends")
+    parser.add_option("--year", action="store", type="int", dest="year", default=2019,
+                      help="Year to compare over. default=2019")
+    parser.add_option("--tolerance", action="store", type="float", dest="tolerance", default=None,
+                      help="Name the fastest backend whose zenith error is within TOLERANCE degrees",
+                      metavar="TOLERANCE")
+    parser.add_option("--fit-chebyshev", action="store_true", dest="fit_chebyshev", default=False,
+                      help="Fit Chebyshev coefficients for --years years from --year and write them to FILE")
+    parser.add_option("--years", action="store", type="int", dest="years", default=1,
+                      help="With --fit-chebyshev, the number of years to fit. default=1")
+    parser.add_option("-f", "--filename", action="store", type="string", dest="filename",
+                      help="With --fit-chebyshev, write the coefficients to .npz FILE", metavar="FILE",
+                      default=None)
+    parser.add_option("-l", "--list", action="store_true", dest="list", default=False,
+                      help="List the ephemeris backends")
+
+    (options, args) = parser.parse_args(argv[1:])
+
+    if options.list or not (options.report or options.fit_chebyshev):
+        for name, ephemeris in EPHEMERIDES.items():
+            print("%-10s %s" % (name, ephemeris.description))
+    if options.fit_chebyshev:
+        if options.filename is None:
+            raise Exception("Specify the coefficient file with -f/--filename")
+        fit_chebyshev(options.year, options.years, options.filename)
+    if options.report:
+        report(options.year, options.tolerance)
+
+
+def main(argv):
+    try:
+        main_except(argv)
+        return 0
+    except Exception as e:
+        traceback.print_exc()
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
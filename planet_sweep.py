@@ -0,0 +1,361 @@
+#!/usr/bin/python
+# planet_sweep - daylight and twilight over a grid of planets
+#
+# SolarLat takes any axial tilt, but comparing planets with it means one
+# object per tilt and a loop over days in Python. This evaluates the yearly
+# share of daylight, civil, nautical and astronomical twilight, and night
+# for every combination of obliquity, orbital eccentricity, year length
+# and latitude as numpy arrays in one pass.
+#
+# The declination follows SolarLat model 2 with the season measured as the
+# phase p of the year, 0..1 from the northern winter solstice:
+#   dec = -asin(sin(obliquity) * cos(2 pi p + 2 e sin(2 pi (p - perihelion phase))))
+# The planet turns many times a year, so within one local day the declination
+# is held constant and the time the sun spends above zenith angle Z is the
+# hour angle H0 where
+#   cos(H0) = (cos(Z) - sin(lat) sin(dec)) / (cos(lat) cos(dec))
+# No day is sampled minute by minute. Durations are in local solar days.
+# Mercury and Venus turn only once or twice a year and break that assumption.
+#
+# In this model the year length stretches the seasons without changing their
+# shape, so the yearly share of each category does not depend on it. The
+# year length axis of the cube scales the shares to local days per year.
+#
+# Example: compare Uranus and Mars, then sweep Earth-like orbits over all tilts
+#
+# > python planet_sweep.py --planets Uranus,Mars
+# > python planet_sweep.py --obliquity 0:90:1 --eccentricity 0,0.1,0.2 -f sweep.npz --plot sweep
+#
+
+from optparse import OptionParser
+import sys
+import traceback
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+import twilight_cube as TC
+
+# name: (obliquity degrees, eccentricity, year length in local solar days).
+# Obliquities are those of SolarLat; retrograde Venus is taken as 2.64.
+PLANETS = {
+    "Mercury": (0.03, 0.2056, 0.5),
+    "Venus": (2.64, 0.0068, 1.92),
+    "Earth": (23.44, 0.0167, 365.24),
+    "Mars": (25.19, 0.0934, 668.6),
+    "Jupiter": (3.13, 0.0489, 10476.0),
+    "Saturn": (26.73, 0.0565, 24491.0),
+    "Uranus": (82.23, 0.0457, 42718.0),
+    "Neptune": (28.32, 0.0113, 89666.0),
+    "Pluto": (57.47, 0.2488, 14178.0),
+}
+
+# Earth's perihelion comes 12 days after the December solstice.
+# SolarLat's jan1_days_since_winter_solstice plus jan1_days_before_perihelion.
+EARTH_PERIHELION_PHASE = 12.0 / 365.24
+
+# Largest block of (obliquity, eccentricity, latitude, season) values evaluated at once
+BLOCK_ELEMENTS = 1 << 22
+
+
+def declinations(obliquities, eccentricities, phases, perihelion_phase=EARTH_PERIHELION_PHASE):
+    """
+    Solar declination in radians shaped (obliquities, eccentricities, phases)
+    """
+    sin_obliquity = np.sin(np.radians(np.asarray(obliquities, dtype=np.float64)))[:, None, None]
+    e = np.asarray(eccentricities, dtype=np.float64)[None, :, None]
+    theta = 2 * np.pi * np.asarray(phases, dtype=np.float64)[None, None, :]
+    return -np.arcsin(sin_obliquity * np.cos(theta + 2 * e * np.sin(theta - 2 * np.pi * perihelion_phase)))
+
+
+def fraction_above(cos_zenith, sin_lat, cos_lat, sin_dec, cos_dec):
+    """
+    Share of a local day the sun spends at or above a zenith angle
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        c = (cos_zenith - sin_lat * sin_dec) / (cos_lat * cos_dec)
+    # at a pole cos_lat is 0: all day above or below, by the sign of the numerator
+    c = np.where(cos_lat * cos_dec == 0.0, np.where(cos_zenith - sin_lat * sin_dec > 0, 1.0, -1.0), c)
+    return np.arccos(np.clip(c, -1.0, 1.0)) / np.pi
+
+
+def category_fractions(dec, latitudes, zenith_limits=TC.ZENITH_LIMITS_DEG):
+    """
+    Share of each local day in each category.
+    :param dec: declinations in radians shaped (..., phases)
+    :param latitudes: latitudes in degrees
+    :return: shaped dec.shape[:-1] + (latitudes, phases, categories)
+    """
+    lat = np.radians(np.asarray(latitudes, dtype=np.float64))[:, None]
+    sin_lat, cos_lat = np.sin(lat), np.cos(lat)
+    sin_dec, cos_dec = np.sin(dec)[..., None, :], np.cos(dec)[..., None, :]
+    fractions = np.empty(dec.shape[:-1] + (len(lat), dec.shape[-1], len(TC.CATEGORIES)), dtype=np.float32)
+    below = 0.0
+    for category, zenith in enumerate(zenith_limits):
+        above = fraction_above(np.cos(np.radians(zenith)), sin_lat, cos_lat, sin_dec, cos_dec)
+        fractions[..., category] = above - below
+        below = above
+    fractions[..., len(zenith_limits)] = 1.0 - below
+    return fractions
+
+
+class PlanetSweep:
+    """
+    Daylight, twilight and night over obliquity x eccentricity x latitude.
+    share is the yearly mean share of a local day in each category and
+    longest the largest share of any one day, each shaped
+    (obliquities, eccentricities, latitudes, categories).
+    """
+    def __init__(self, obliquities, eccentricities, year_lengths, latitudes, share, longest,
+                 samples, perihelion_phase):
+        self.obliquities = np.asarray(obliquities, dtype=np.float64)
+        self.eccentricities = np.asarray(eccentricities, dtype=np.float64)
+        self.year_lengths = np.atleast_1d(np.asarray(year_lengths, dtype=np.float64))
+        self.latitudes = np.asarray(latitudes, dtype=np.float64)
+        self.share = share
+        self.longest = longest
+        self.samples = samples
+        self.perihelion_phase = perihelion_phase
+
+    @staticmethod
+    def compute(obliquities, eccentricities, year_lengths, latitudes, samples=365,
+                perihelion_phase=EARTH_PERIHELION_PHASE, zenith_limits=TC.ZENITH_LIMITS_DEG):
+        """
+        :param obliquities: axial tilts in degrees
+        :param eccentricities: orbital eccentricities
+        :param year_lengths: local solar days per year
+        :param latitudes: latitudes in degrees
+        :param samples: days sampled per year, evenly in phase
+        :param perihelion_phase: phase of the year from the northern winter solstice to perihelion
+        :param zenith_limits: zenith angles bounding the categories
+        """
+        obliquities = np.atleast_1d(np.asarray(obliquities, dtype=np.float64))
+        eccentricities = np.atleast_1d(np.asarray(eccentricities, dtype=np.float64))
+        latitudes = np.atleast_1d(np.asarray(latitudes, dtype=np.float64))
+        phases = (np.arange(samples) + 0.5) / samples
+        shape = (len(obliquities), len(eccentricities), len(latitudes), len(TC.CATEGORIES))
+        share = np.empty(shape, dtype=np.float32)
+        longest = np.empty(shape, dtype=np.float32)
+
+        # obliquities in blocks bound the memory of the (block, e, lat, phase, category) arrays
+        block = max(1, BLOCK_ELEMENTS // (len(eccentricities) * len(latitudes) * samples))
+        for first in range(0, len(obliquities), block):
+            dec = declinations(obliquities[first:first + block], eccentricities, phases, perihelion_phase)
+            fractions = category_fractions(dec, latitudes, zenith_limits)
+            share[first:first + block] = fractions.mean(axis=-2)
+            longest[first:first + block] = fractions.max(axis=-2)
+        return PlanetSweep(obliquities, eccentricities, year_lengths, latitudes, share, longest,
+                           samples, perihelion_phase)
+
+    def days_per_year(self):
+        """
+        Local days per year in each category shaped
+        (obliquities, eccentricities, year lengths, latitudes, categories)
+        """
+        return self.share[:, :, None] * self.year_lengths[None, None, :, None, None]
+
+    def twilight_share(self):
+        """
+        Yearly share of civil, nautical and astronomical twilight together
+        """
+        return self.share[..., TC.CIVIL:TC.NIGHT].sum(axis=-1)
+
+    def latitude_index(self, latitude):
+        return int(np.argmin(np.abs(self.latitudes - latitude)))
+
+    def save(self, filename):
+        np.savez_compressed(filename,
+                            obliquities=self.obliquities,
+                            eccentricities=self.eccentricities,
+                            year_lengths=self.year_lengths,
+                            latitudes=self.latitudes,
+                            share=self.share,
+                            longest=self.longest,
+                            days_per_year=self.days_per_year(),
+                            samples=self.samples,
+                            perihelion_phase=self.perihelion_phase,
+                            categories=np.array(TC.CATEGORIES))
+
+    @staticmethod
+    def load(filename):
+        with np.load(filename) as npz:
+            return PlanetSweep(npz["obliquities"], npz["eccentricities"], npz["year_lengths"], npz["latitudes"],
+                               npz["share"], npz["longest"], int(npz["samples"]), float(npz["perihelion_phase"]))
+
+
+def planet_sweeps(names, latitudes, samples=365):
+    """
+    One PlanetSweep per named planet, each with its own obliquity, eccentricity and year length
+    """
+    sweeps = {}
+    for name in names:
+        if name not in PLANETS:
+            raise Exception("Unknown planet '%s'. Choose from %s" % (name, ", ".join(PLANETS)))
+        obliquity, eccentricity, year_length = PLANETS[name]
+        sweeps[name] = PlanetSweep.compute(obliquity, eccentricity, year_length, latitudes, samples)
+    return sweeps
+
+
+def color_ramp(values, top):
+    """
+    Map values 0..top to RGB from dark blue through orange to white
+    """
+    stops = np.array([[16, 24, 64], [40, 96, 160], [240, 160, 48], [255, 255, 255]], dtype=np.float64)
+    x = np.clip(np.asarray(values, dtype=np.float64) / top, 0.0, 1.0) * (len(stops) - 1)
+    i = np.minimum(x.astype(int), len(stops) - 2)
+    t = (x - i)[..., None]
+    return (stops[i] * (1 - t) + stops[i + 1] * t).astype(np.uint8)
+
+
+def plot_heatmap(sweep, eccentricity_index, filename, cell=4):
+    """
+    Yearly twilight share by obliquity (across) and latitude (down, north at the top)
+    """
+    values = sweep.twilight_share()[:, eccentricity_index, :].T[::-1] * 100.0
+    # a few polar cells of near zero tilt reach 100%; leave them out of the color scale
+    top = max(float(np.percentile(values, 99)), 1.0)
+    l_margin, t_margin, r_margin, b_margin = 60, 50, 110, 40
+    plot_w, plot_h = values.shape[1] * cell, values.shape[0] * cell
+    W, H = l_margin + plot_w + r_margin, t_margin + plot_h + b_margin
+    pixels = np.full((H, W, 3), 255, dtype=np.uint8)
+    pixels[t_margin:t_margin + plot_h, l_margin:l_margin + plot_w] = \
+        np.repeat(np.repeat(color_ramp(values, top), cell, axis=0), cell, axis=1)
+    ramp = color_ramp(np.linspace(top, 0.0, plot_h), top)
+    pixels[t_margin:t_margin + plot_h, W - r_margin + 20:W - r_margin + 40] = ramp[:, None, :]
+    img = Image.fromarray(pixels, "RGB")
+    draw = ImageDraw.Draw(img)
+
+    draw.text((2, 2), "Yearly share of twilight (civil + nautical + astronomical), percent of time", "black")
+    draw.text((2, 14), "eccentricity %g" % sweep.eccentricities[eccentricity_index], "black")
+    for k in range(0, len(sweep.obliquities), max(1, len(sweep.obliquities) // 8)):
+        x = l_margin + k * cell + cell // 2
+        draw.line((x, t_margin + plot_h, x, t_margin + plot_h + 4), "black")
+        draw.text((x - 8, t_margin + plot_h + 6), "%g" % sweep.obliquities[k], "black")
+    draw.text((l_margin, H - 14), "obliquity, degrees", "black")
+    for k in range(0, len(sweep.latitudes), max(1, len(sweep.latitudes) // 12)):
+        y = t_margin + (len(sweep.latitudes) - 1 - k) * cell + cell // 2
+        draw.line((l_margin - 4, y, l_margin, y), "black")
+        draw.text((4, y - 6), "%6g" % sweep.latitudes[k], "black")
+    draw.text((4, t_margin - 14), "latitude", "black")
+    draw.text((W - r_margin + 44, t_margin), ">= %.1f%%" % top, "black")
+    draw.text((W - r_margin + 44, t_margin + plot_h - 12), "0%", "black")
+    img.save(filename, "PNG")
+
+
+def plot_planets(sweeps, filename, width=900, height=500):
+    """
+    Yearly twilight share by latitude, one line per planet
+    """
+    colors = ["red", "blue", "green", "orange", "purple", "brown", "black", "magenta", "teal"]
+    l_margin, t_margin, r_margin, b_margin = 60, 40, 120, 40
+    plot_w, plot_h = width - l_margin - r_margin, height - t_margin - b_margin
+    top = max(max(float(s.twilight_share().max()) for s in sweeps.values()), 0.01)
+    img = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(img)
+    draw.text((2, 2), "Yearly share of twilight (civil + nautical + astronomical) by latitude", "black")
+    draw.rectangle((l_margin, t_margin, l_margin + plot_w, t_margin + plot_h), outline="black")
+    for lat in range(-90, 91, 30):
+        x = l_margin + (lat + 90) * plot_w / 180.0
+        draw.line((x, t_margin + plot_h, x, t_margin + plot_h + 4), "black")
+        draw.text((x - 8, t_margin + plot_h + 6), "%d" % lat, "black")
+    draw.text((l_margin + plot_w / 2 - 40, height - 14), "latitude, degrees", "black")
+    for k in range(5):
+        y = t_margin + plot_h - k * plot_h / 4.0
+        draw.text((4, y - 6), "%5.1f%%" % (top * 100 * k / 4.0), "black")
+    for i, (name, sweep) in enumerate(sweeps.items()):
+        color = colors[i % len(colors)]
+        share = sweep.twilight_share()[0, 0]
+        points = [(l_margin + (lat + 90) * plot_w / 180.0, t_margin + plot_h - s / top * plot_h)
+                  for lat, s in zip(sweep.latitudes, share)]
+        draw.line(points, color, width=2)
+        draw.text((l_margin + plot_w + 10, t_margin + 14 * i), name, color)
+    img.save(filename, "PNG")
+
+
+def parse_values(values_string, value_type=float):
+    """
+    Given "A,B,C" or "START:STOP[:STEP]" (inclusive) return the list of values
+    """
+    if ":" not in values_string:
+        return [value_type(v) for v in values_string.split(",")]
+    fields = values_string.split(":")
+    if len(fields) not in (2, 3):
+        raise Exception("Range '%s' is not in the form START:STOP[:STEP]" % values_string)
+    start, stop = value_type(fields[0]), value_type(fields[1])
+    step = value_type(fields[2]) if len(fields) == 3 else value_type(1)
+    if step <= 0:
+        raise Exception("Range '%s' step must be positive" % values_string)
+    count = int(round((stop - start) / step)) + 1
+    return [start + i * step for i in range(max(count, 0))]
+
+
+def main_except(argv):
+    parser = OptionParser()
+
+    parser.add_option("--planets", action="store", type="string", dest="planets", default=None,
+                      help="Compare these comma separated planets: %s" % ", ".join(PLANETS), metavar="NAMES")
+    parser.add_option("--obliquity", action="store", type="string", dest="obliquity", default="0:90:1",
+                      help="Obliquities in degrees, A,B,C or START:STOP[:STEP]. default=0:90:1")
+    parser.add_option("--eccentricity", action="store", type="string", dest="eccentricity", default="0.0167",
+                      help="Eccentricities, A,B,C or START:STOP:STEP. default=0.0167")
+    parser.add_option("--year-length", action="store", type="string", dest="year_length", default="365.24",
+                      help="Year lengths in local solar days, A,B,C. default=365.24")
+    parser.add_option("--lat-step", action="store", type="float", dest="lat_step", default=1.0,
+                      help="Latitude step in degrees. default=1.0")
+    parser.add_option("--samples", action="store", type="int", dest="samples", default=365,
+                      help="Days sampled per year. default=365")
+    parser.add_option("-f", "--filename", action="store", type="string", dest="filename", default=None,
+                      help="Save the sweep cube as a .npz file", metavar="FILE")
+    parser.add_option("--plot", action="store", type="string", dest="plot", default=None,
+                      help="Write summary plots to PREFIX_*.png", metavar="PREFIX")
+    parser.add_option("--report-lats", action="store", type="string", dest="report_lats", default="0,45,66.6,80,90",
+                      help="Latitudes in the printed summary. default=0,45,66.6,80,90")
+
+    (options, args) = parser.parse_args(argv[1:])
+
+    if options.lat_step <= 0 or options.samples < 1:
+        raise Exception("--lat-step and --samples must be positive")
+    latitudes = np.arange(-90.0, 90.0 + options.lat_step / 2, options.lat_step)
+    report_lats = parse_values(options.report_lats)
+
+    if options.planets is not None:
+        sweeps = planet_sweeps(options.planets.split(","), latitudes, options.samples)
+        print("%-8s %7s %6s %9s %9s  %s" % ("Planet", "Tilt", "Ecc", "Year", "Lat", "Days per year: "
+                                             + ", ".join(TC.CATEGORIES)))
+        for name, sweep in sweeps.items():
+            days = sweep.days_per_year()[0, 0, 0]
+            for lat in report_lats:
+                print("%-8s %7.2f %6.4f %9.1f %9.1f  %s"
+                      % (name, sweep.obliquities[0], sweep.eccentricities[0], sweep.year_lengths[0], lat,
+                         ", ".join("%.1f" % d for d in days[sweep.latitude_index(lat)])))
+        if options.plot is not None:
+            plot_planets(sweeps, options.plot + "_planets.png")
+        return
+
+    sweep = PlanetSweep.compute(parse_values(options.obliquity), parse_values(options.eccentricity),
+                                parse_values(options.year_length), latitudes, options.samples)
+    twilight = sweep.twilight_share()
+    print("Yearly twilight share, percent, by obliquity (rows) and latitude (columns), eccentricity %g"
+          % sweep.eccentricities[0])
+    print("%9s  %s" % ("Tilt", " ".join("%7.1f" % lat for lat in report_lats)))
+    for k in range(0, len(sweep.obliquities), max(1, len(sweep.obliquities) // 10)):
+        print("%9.2f  %s" % (sweep.obliquities[k], " ".join("%7.2f" % (100 * twilight[k, 0, sweep.latitude_index(lat)])
+                                                           for lat in report_lats)))
+    if options.filename is not None:
+        sweep.save(options.filename)
+    if options.plot is not None:
+        for e in range(len(sweep.eccentricities)):
+            plot_heatmap(sweep, e, "%s_twilight_e%d.png" % (options.plot, e))
+
+
+def main(argv):
+    try:
+        main_except(argv)
+        return 0
+    except Exception as e:
+        traceback.print_exc()
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
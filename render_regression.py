@@ -0,0 +1,327 @@
+#!/usr/bin/python
+# render_regression - golden image and timing checks for the twilight.py views
+#
+# A speedup of a view must not move a pixel. This renders a fixed set of
+# year, day, polar and world views, compares each with its reference image
+# in a golden directory, and times it against a stored baseline.
+#
+# A case fails when
+#   more than --max-diff-pixels pixels differ from the reference image, or
+#   its best render time is more than --max-slowdown times the baseline time
+#   and more than --min-slowdown-ms slower.
+# Images that differ are written to --diff-dir with the changed pixels in red.
+# A few twilight.py command lines are also run in a scratch directory and must
+# exit with their expected status, print their expected lines and leave their
+# expected files.
+# The exit code is 1 when any case fails.
+#
+# The reference images are kept in the repository's golden-renders directory.
+# They are not renders of the current tree. The year, day and polar references
+# were rendered by the original per-minute twilight.py of the baseline commit
+# baf146e, before any of the array speedups. The world view did not exist then;
+# its reference was rendered by 77c901f, the commit that added it. So every
+# speedup since is checked against the pixels of the code it replaced.
+# Regenerate them the same way with --reference-twilight:
+#
+# > git worktree add /tmp/solar-lat-baf146e baf146e
+# > git worktree add /tmp/solar-lat-77c901f 77c901f
+# > python render_regression.py --update --reference-twilight /tmp/solar-lat-baf146e/twilight.py -k year,day,polar
+# > python render_regression.py --update --reference-twilight /tmp/solar-lat-77c901f/twilight.py -k world
+#
+# Timings only compare on the machine that recorded them, so they stay local:
+# record them on a known-good tree before changing a view and check after.
+# --update without --reference-twilight takes the current tree's renders as the
+# references, for a change that is meant to move pixels; review their diffs first.
+#
+# > python render_regression.py --update-timings
+# > python render_regression.py
+#
+
+import datetime
+import json
+from optparse import OptionParser
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+
+from PIL import Image, ImageChops
+
+import twilight as TW
+
+# name, view, latitude, day of year. The world case's day is rendered at 12:00 UTC.
+CASES = [
+    ("year_lat_42.6", "year", 42.6, None),
+    ("year_lat_0.0", "year", 0.0, None),
+    ("year_lat_-66.6", "year", -66.6, None),
+    ("year_lat_89.0", "year", 89.0, None),
+    ("day_010_lat_42.6", "day", 42.6, 10),
+    ("day_171_lat_0.0", "day", 0.0, 171),
+    ("day_171_lat_70.0", "day", 70.0, 171),
+    ("polar_010_lat_42.6", "polar", 42.6, 10),
+    ("polar_200_lat_-42.6", "polar", -42.6, 200),
+    ("polar_355_lat_80.0", "polar", 80.0, 355),
+    ("world_079", "world", None, 79),
+]
+
+# name, twilight.py arguments, expected exit status, directories made in the
+# scratch directory first, lines expected on stdout, files expected afterwards
+COMMAND_CASES = [
+    ("batch_missing_chebyshev", ["--o-lat-range", "0:1", "--chebyshev", "missing-chebyshev.npz"], 1,
+     [], [], []),
+    ("view_missing_chebyshev", ["--chebyshev", "missing-chebyshev.npz", "--no-autoview"], 1,
+     [], [], []),
+    # a directory in the way of the middle frame fails it and the batch goes on
+    ("batch_failed_frame", ["--show-day", "--day-range", "0:4", "--filename-template", "frame_{day}.png"], 1,
+     ["frame_1.png"], ["FAILED frame_1.png"], ["frame_0.png", "frame_2.png", "frame_3.png", "frame_4.png"]),
+]
+
+WORLD_SIZE = (1440, 720)
+TIMINGS_FILE = "timings.json"
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden-renders")
+
+
+def render_case(ctx, view, lat, day):
+    if view == "year":
+        return TW.render_year(ctx, lat)
+    if view == "day":
+        return TW.render_day_cartesian(ctx, lat, day)
+    if view == "polar":
+        return TW.render_day_polar(ctx, lat, day)
+    if view == "world":
+        when = TW.year_start_dt() + datetime.timedelta(days=day, hours=12)
+        return TW.render_world(ctx, when, *WORLD_SIZE)
+    raise Exception("Unknown view '%s'" % view)
+
+
+def time_case(view, lat, day, repeat):
+    """
+    Render one case repeat times in a fresh RenderContext.
+    The first render builds the context's almanac and chrome; later ones reuse them.
+    :return: (image, seconds of the first render, best seconds of all renders)
+    """
+    ctx = TW.RenderContext()
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        img = render_case(ctx, view, lat, day)
+        times.append(time.perf_counter() - start)
+    return img, times[0], min(times)
+
+
+def reference_args(view, lat, day):
+    # twilight.py options that render one case
+    if view == "year":
+        return ["-o", "%r" % lat]
+    if view == "day":
+        return ["-o", "%r" % lat, "--show-day", "-d", "%d" % day]
+    if view == "polar":
+        return ["-o", "%r" % lat, "--show-day", "--polar", "-d", "%d" % day]
+    if view == "world":
+        return ["--world", "-d", "%d" % day, "--utc", "12:00", "--world-size", "%dx%d" % WORLD_SIZE]
+    raise Exception("Unknown view '%s'" % view)
+
+
+def render_reference(twilight_py, golden_dir, name, view, lat, day):
+    """
+    Render one case's reference image into golden_dir by running another twilight.py.
+    It imports the modules beside it, so give it a checkout of its own commit.
+    """
+    filename = os.path.join(golden_dir, name + ".png")
+    if os.path.exists(filename):
+        os.remove(filename)
+    # twilight.py takes a plain file name, so it runs in the golden directory
+    cmd = [sys.executable, os.path.abspath(twilight_py)] + reference_args(view, lat, day) + \
+          ["-f", name + ".png", "--no-autoview"]
+    result = subprocess.run(cmd, cwd=golden_dir, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0 or not os.path.exists(filename):
+        raise Exception("%s could not render %s:\n%s" % (twilight_py, name, result.stderr))
+
+
+def run_command_case(args, dirs, files):
+    """
+    Run twilight.py with args in a scratch directory holding the directories dirs
+    :return: (exit status, stdout lines, the files missing afterwards, stderr text)
+    """
+    twilight_py = os.path.join(os.path.dirname(os.path.abspath(__file__)), "twilight.py")
+    with tempfile.TemporaryDirectory() as scratch:
+        for d in dirs:
+            os.makedirs(os.path.join(scratch, d))
+        result = subprocess.run([sys.executable, twilight_py] + args, cwd=scratch,
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        missing = [f for f in files if not os.path.isfile(os.path.join(scratch, f))]
+    return result.returncode, result.stdout.splitlines(), missing, result.stderr
+
+
+def image_difference(img, reference):
+    """
+    :return: (pixels that differ, largest channel difference, mask image of the differing pixels),
+             all pixels differing when the sizes do not match
+    """
+    if img.size != reference.size or img.mode != reference.mode:
+        return img.size[0] * img.size[1], 255, None
+    diff = ImageChops.difference(img.convert("RGB"), reference.convert("RGB"))
+    if diff.getbbox() is None:
+        return 0, 0, None
+    mask = diff.convert("L").point(lambda v: 255 if v else 0)
+    pixels = mask.histogram()[255]
+    return pixels, max(high for low, high in diff.getextrema()), mask
+
+
+def write_diff_image(filename, img, mask):
+    # the new image, darkened, with the changed pixels in red
+    faded = Image.blend(img.convert("RGB"), Image.new("RGB", img.size, (0, 0, 0)), 0.6)
+    faded.paste((255, 0, 0), mask=mask)
+    faded.save(filename, "PNG")
+
+
+def machine_description():
+    return "%s %s python %s" % (platform.node(), platform.machine(), platform.python_version())
+
+
+def main_except(argv):
+    parser = OptionParser()
+
+    parser.add_option("-d", "--golden-dir", action="store", type="string", dest="golden_dir",
+                      default=GOLDEN_DIR,
+                      help="Directory of reference images and timings. default=golden-renders beside this script",
+                      metavar="DIR")
+    parser.add_option("--update", action="store_true", dest="update", default=False,
+                      help="Write the renders and timings as the new references")
+    parser.add_option("--reference-twilight", action="store", type="string", dest="reference_twilight",
+                      default=None, metavar="FILE",
+                      help="With --update, render the reference images with FILE, an earlier twilight.py, "
+                           "and compare this tree's renders with them")
+    parser.add_option("--update-timings", action="store_true", dest="update_timings", default=False,
+                      help="Write the timings as the new baseline and compare the images")
+    parser.add_option("-r", "--repeat", action="store", type="int", dest="repeat", default=15,
+                      help="Renders per case. The best time is compared. default=15")
+    parser.add_option("--max-slowdown", action="store", type="float", dest="max_slowdown", default=1.5,
+                      help="Fail a case whose best time exceeds its baseline by this factor. default=1.5")
+    parser.add_option("--min-slowdown-ms", action="store", type="float", dest="min_slowdown_ms", default=20.0,
+                      help="Do not fail a case that is slower by less than this, for timer noise. default=20.0")
+    parser.add_option("--max-diff-pixels", action="store", type="int", dest="max_diff_pixels", default=0,
+                      help="Fail a case with more differing pixels than this. default=0")
+    parser.add_option("--diff-dir", action="store", type="string", dest="diff_dir", default=None,
+                      help="Write an image of each differing case to DIR", metavar="DIR")
+    parser.add_option("--no-timing", action="store_true", dest="no_timing", default=False,
+                      help="Compare images only")
+    parser.add_option("-k", "--cases", action="store", type="string", dest="cases", default=None,
+                      help="Run only the cases whose names contain one of these comma separated words",
+                      metavar="WORDS")
+
+    (options, args) = parser.parse_args(argv[1:])
+
+    if options.repeat < 1:
+        raise Exception("--repeat must be at least 1")
+    if options.reference_twilight is not None and not options.update:
+        raise Exception("--reference-twilight is used with --update")
+    cases = CASES
+    command_cases = COMMAND_CASES
+    if options.cases is not None:
+        words = options.cases.split(",")
+        cases = [case for case in CASES if any(word in case[0] for word in words)]
+        command_cases = [case for case in COMMAND_CASES if any(word in case[0] for word in words)]
+        if not cases and not command_cases:
+            raise Exception("No case matches '%s'" % options.cases)
+
+    timings_file = os.path.join(options.golden_dir, TIMINGS_FILE)
+    recording = options.update or options.update_timings
+    if options.update:
+        os.makedirs(options.golden_dir, exist_ok=True)
+    elif not os.path.isdir(options.golden_dir):
+        raise Exception("No reference images in '%s'. Record them with --update" % options.golden_dir)
+    baseline = {"machine": None, "cases": {}}
+    if os.path.exists(timings_file):
+        with open(timings_file, "r") as f:
+            baseline = json.load(f)
+    elif not recording and not options.no_timing:
+        print("No baseline timings in %s. Record them with --update-timings" % options.golden_dir)
+    if not recording and not options.no_timing and baseline["machine"] not in (None, machine_description()):
+        print("Warning: baseline timings were recorded on %s" % baseline["machine"])
+    if options.diff_dir is not None:
+        os.makedirs(options.diff_dir, exist_ok=True)
+
+    failures = 0
+    if cases:
+        print("%-22s %10s %10s %10s %8s  %s" % ("Case", "First s", "Best s", "Baseline s", "Ratio", "Pixels"))
+    for name, view, lat, day in cases:
+        img, first, best = time_case(view, lat, day, options.repeat)
+        golden = os.path.join(options.golden_dir, name + ".png")
+        if options.update:
+            baseline["cases"][name] = {"first_s": first, "best_s": best}
+            if options.reference_twilight is None:
+                img.save(golden, "PNG")
+                print("%-22s %10.3f %10.3f %10s %8s  recorded" % (name, first, best, "", ""))
+                continue
+            render_reference(options.reference_twilight, options.golden_dir, name, view, lat, day)
+
+        problems = []
+        if not os.path.exists(golden):
+            pixels, pixels_text = None, "no reference"
+            problems.append("no reference image")
+        else:
+            with Image.open(golden) as reference:
+                reference.load()
+                pixels, largest, mask = image_difference(img, reference)
+            pixels_text = "%d" % pixels if pixels == 0 else "%d differ, up to %d" % (pixels, largest)
+            if pixels > options.max_diff_pixels:
+                problems.append("%d pixels differ" % pixels)
+                if options.diff_dir is not None and mask is not None:
+                    write_diff_image(os.path.join(options.diff_dir, name + ".diff.png"), img, mask)
+
+        if options.update_timings:
+            baseline["cases"][name] = {"first_s": first, "best_s": best}
+        reference_s = baseline["cases"].get(name, {}).get("best_s")
+        ratio_text = ""
+        if reference_s is not None and not options.update_timings:
+            ratio = best / reference_s
+            ratio_text = "%.2f" % ratio
+            if not options.no_timing and ratio > options.max_slowdown and \
+                    best - reference_s > options.min_slowdown_ms / 1000.0:
+                problems.append("%.2fx slower" % ratio)
+        print("%-22s %10.3f %10.3f %10s %8s  %s%s"
+              % (name, first, best, "%.3f" % reference_s if reference_s is not None else "", ratio_text,
+                 pixels_text, "  FAIL: " + ", ".join(problems) if problems else ""))
+        failures += 1 if problems else 0
+
+    for name, args, expected, dirs, lines, files in command_cases:
+        status, output, missing, stderr = run_command_case(args, dirs, files)
+        problems = []
+        if status != expected:
+            problems.append("expected exit %d" % expected)
+        for line in lines:
+            if line not in output:
+                problems.append("no line '%s'" % line)
+        if missing:
+            problems.append("missing %s" % ", ".join(missing))
+        print("%-22s exit %d%s" % (name, status, "  FAIL: " + ", ".join(problems) if problems else ""))
+        if problems:
+            failures += 1
+            if stderr:
+                print(stderr.rstrip())
+
+    if recording:
+        baseline["machine"] = machine_description()
+        baseline["recorded"] = datetime.datetime.now().isoformat(timespec="seconds")
+        baseline["repeat"] = options.repeat
+        with open(timings_file, "w") as f:
+            json.dump(baseline, f, indent=1)
+        print("%s written to %s" % ("References" if options.update else "Timings", options.golden_dir))
+    print("%d of %d cases failed" % (failures, len(cases) + len(command_cases)))
+    return 1 if failures else 0
+
+
+def main(argv):
+    try:
+        return main_except(argv)
+    except Exception as e:
+        traceback.print_exc()
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
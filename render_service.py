@@ -0,0 +1,302 @@
+#!/usr/bin/python
+# render_service - serve twilight.py views to many clients from one process
+#
+# Clients ask for a view over local HTTP and get a .png back:
+#
+#   GET /render?view=day&lat=42.5&day=10     cartesian day view
+#   GET /render?view=polar&lat=42.5&day=10   polar day view
+#   GET /render?view=year&lat=42.5           year view
+#   GET /metrics                             queue depth, counters and latencies as JSON
+#
+# Renders run on a bounded pool of worker threads. Waiting jobs are started
+# day views first since they take a fraction of the time of a year view.
+# A request for a view that is already queued or rendering does not start
+# a second render; it waits for the first one and gets the same image.
+#
+# Example: serve on port 8019 with four render threads
+#
+# > python render_service.py --port 8019 --jobs 4
+# > curl -o day.png "http://127.0.0.1:8019/render?view=day&lat=42.5&day=10"
+#
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import io
+import itertools
+import json
+from optparse import OptionParser
+import os
+import sys
+import threading
+import time
+import traceback
+from urllib.parse import urlsplit, parse_qs
+
+import ephemeris as EPH
+import twilight as TW
+
+# view name: (priority, render function). Lower priorities start first.
+VIEWS = {
+    "day": (0, TW.render_day_cartesian),
+    "polar": (0, TW.render_day_polar),
+    "year": (1, TW.render_year),
+}
+
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+class QueueFull(Exception):
+    pass
+
+
+class LatencyStats:
+    """
+    Count, mean and maximum of a series of durations in seconds
+    """
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def as_dict(self):
+        return {"count": self.count,
+                "mean_s": self.total / self.count if self.count else 0.0,
+                "max_s": self.max}
+
+
+class RenderJob:
+    def __init__(self, key, priority, future):
+        self.key = key
+        self.priority = priority
+        self.future = future
+        self.submitted = time.monotonic()
+        self.started = None
+
+
+class RenderService:
+    """
+    Asyncio job manager for twilight renders.
+    Call start() from a running event loop, then await render(view, lat, day).
+    """
+    def __init__(self, jobs=os.cpu_count(), max_queue=0, ephemeris_name=EPH.DEFAULT_EPHEMERIS):
+        """
+        :param jobs: renders running at once
+        :param max_queue: jobs allowed to wait before new ones are refused. 0 is unlimited
+        :param ephemeris_name: solar position model used by every render
+        """
+        self.jobs = jobs
+        self.max_queue = max_queue
+        self.ephemeris_name = ephemeris_name
+        self.in_flight = {}
+        self.sequence = itertools.count()
+        self.local = threading.local()
+        self.counters = {"submitted": 0, "deduplicated": 0, "completed": 0, "failed": 0, "rejected": 0}
+        self.wait_latency = {view: LatencyStats() for view in VIEWS}
+        self.total_latency = {view: LatencyStats() for view in VIEWS}
+        self.running = 0
+        self.queue = None
+        self.executor = None
+        self.workers = []
+
+    async def start(self):
+        self.queue = asyncio.PriorityQueue()
+        self.executor = ThreadPoolExecutor(max_workers=self.jobs, thread_name_prefix="render")
+        self.workers = [asyncio.create_task(self.worker()) for _ in range(self.jobs)]
+
+    async def stop(self):
+        for task in self.workers:
+            task.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.executor.shutdown(wait=True)
+
+    @staticmethod
+    def job_key(view, lat, day):
+        """
+        Validate a request and return the key that identifies its image
+        """
+        if view not in VIEWS:
+            raise ValueError("view must be one of %s" % ", ".join(VIEWS))
+        lat = float(lat)
+        if not -90.0 <= lat <= 90.0:
+            raise ValueError("lat must be in -90..90")
+        if view == "year":
+            return view, round(lat, 6), None
+        day = int(day)
+        if not 0 <= day <= 364:
+            raise ValueError("day must be in 0..364")
+        return view, round(lat, 6), day
+
+    def submit(self, view, lat, day=0):
+        """
+        Queue a render, or join the identical one already queued or running.
+        :return: asyncio future of the .png bytes
+        """
+        key = self.job_key(view, lat, day)
+        job = self.in_flight.get(key)
+        if job is not None:
+            self.counters["deduplicated"] += 1
+            return job.future
+        if self.max_queue and self.queue.qsize() >= self.max_queue:
+            self.counters["rejected"] += 1
+            raise QueueFull("%d jobs are waiting" % self.queue.qsize())
+        job = RenderJob(key, VIEWS[view][0], asyncio.get_running_loop().create_future())
+        self.in_flight[key] = job
+        self.counters["submitted"] += 1
+        self.queue.put_nowait((job.priority, next(self.sequence), job))
+        return job.future
+
+    async def render(self, view, lat, day=0):
+        # shield the shared job from a client that goes away
+        return await asyncio.shield(self.submit(view, lat, day))
+
+    def render_png(self, key):
+        # runs in an executor thread, each with its own RenderContext
+        ctx = getattr(self.local, "ctx", None)
+        if ctx is None:
+            ctx = self.local.ctx = TW.RenderContext(self.ephemeris_name)
+        view, lat, day = key
+        if view == "year":
+            img = VIEWS[view][1](ctx, lat)
+        else:
+            img = VIEWS[view][1](ctx, lat, day)
+        png = io.BytesIO()
+        img.save(png, "PNG")
+        return png.getvalue()
+
+    async def worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            priority, seq, job = await self.queue.get()
+            job.started = time.monotonic()
+            self.running += 1
+            try:
+                png = await loop.run_in_executor(self.executor, self.render_png, job.key)
+                job.future.set_result(png)
+                self.counters["completed"] += 1
+            except asyncio.CancelledError:
+                job.future.cancel()
+                raise
+            except Exception as e:
+                job.future.set_exception(e)
+                self.counters["failed"] += 1
+            finally:
+                self.running -= 1
+                del self.in_flight[job.key]
+                view = job.key[0]
+                self.wait_latency[view].add(job.started - job.submitted)
+                self.total_latency[view].add(time.monotonic() - job.submitted)
+                self.queue.task_done()
+
+    def metrics(self):
+        return {"queue_depth": self.queue.qsize(),
+                "running": self.running,
+                "jobs": self.jobs,
+                "max_queue": self.max_queue,
+                "counters": dict(self.counters),
+                "wait_latency": {view: stats.as_dict() for view, stats in self.wait_latency.items()},
+                "total_latency": {view: stats.as_dict() for view, stats in self.total_latency.items()}}
+
+
+async def write_response(writer, status, content_type, body):
+    writer.write(("HTTP/1.0 %d %s\r\nContent-Type: %s\r\nContent-Length: %d\r\nConnection: close\r\n\r\n"
+                  % (status, HTTP_REASONS[status], content_type, len(body))).encode("ascii"))
+    writer.write(body)
+    await writer.drain()
+
+
+async def handle_request(service, method, target):
+    """
+    Answer one HTTP request.
+    :return: (status, content type, body bytes)
+    """
+    url = urlsplit(target)
+    if method != "GET":
+        return 405, "text/plain", b"Only GET is supported\n"
+    if url.path == "/metrics":
+        return 200, "application/json", (json.dumps(service.metrics(), indent=2) + "\n").encode("utf-8")
+    if url.path != "/render":
+        return 404, "text/plain", b"Use /render or /metrics\n"
+    query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+    try:
+        png = await service.render(query.get("view", "day"), query.get("lat", TW.Constants.OBSERVER_LAT_DEG),
+                                   query.get("day", 0))
+    except ValueError as e:
+        return 400, "text/plain", ("%s\n" % e).encode("utf-8")
+    except QueueFull as e:
+        return 503, "text/plain", ("Queue full: %s\n" % e).encode("utf-8")
+    except Exception as e:
+        traceback.print_exc()
+        return 500, "text/plain", ("Render failed: %s\n" % e).encode("utf-8")
+    return 200, "image/png", png
+
+
+async def handle_connection(service, reader, writer):
+    try:
+        request_line = (await reader.readline()).decode("latin-1").split()
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass  # headers are not used
+        if len(request_line) != 3:
+            await write_response(writer, 400, "text/plain", b"Malformed request\n")
+        else:
+            await write_response(writer, *await handle_request(service, request_line[0], request_line[1]))
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(host, port, jobs, max_queue, ephemeris_name):
+    service = RenderService(jobs, max_queue, ephemeris_name)
+    await service.start()
+    server = await asyncio.start_server(lambda r, w: handle_connection(service, r, w), host, port)
+    print("Serving twilight renders on http://%s:%d with %d render threads" % (host, port, jobs))
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.stop()
+
+
+def main_except(argv):
+    parser = OptionParser()
+
+    parser.add_option("--host", action="store", type="string", dest="host", default="127.0.0.1",
+                      help="Address to listen on. default=127.0.0.1")
+    parser.add_option("--port", action="store", type="int", dest="port", default=8019,
+                      help="TCP port to listen on. default=8019")
+    parser.add_option("-j", "--jobs", action="store", type="int", dest="jobs", default=os.cpu_count(),
+                      help="Number of renders to run concurrently. default=number of CPUs")
+    parser.add_option("--max-queue", action="store", type="int", dest="max_queue", default=0,
+                      help="Refuse new renders with 503 when this many are waiting. default=0 (no limit)")
+    parser.add_option("--ephemeris", action="store", type="choice", dest="ephemeris",
+                      choices=list(EPH.EPHEMERIDES), default=EPH.DEFAULT_EPHEMERIS,
+                      help="Solar position model: %s. default=%s"
+                           % (", ".join(EPH.EPHEMERIDES), EPH.DEFAULT_EPHEMERIS))
+
+    (options, args) = parser.parse_args(argv[1:])
+
+    if options.jobs < 1:
+        raise Exception("--jobs must be at least 1")
+    try:
+        asyncio.run(serve(options.host, options.port, options.jobs, options.max_queue, options.ephemeris))
+    except KeyboardInterrupt:
+        pass
+
+
+def main(argv):
+    try:
+        main_except(argv)
+        return 0
+    except Exception as e:
+        traceback.print_exc()
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
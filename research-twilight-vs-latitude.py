@@ -16,12 +16,50 @@
 # Observation: What is up with the odd double peaks in the nautical and astronomical
 # twilight plots at the polar latitudes?
 #
+# A full run over fine latitude steps takes a while. With -o FILE each latitude is
+# appended to FILE and flushed as soon as it is done. If the run is interrupted,
+# running the same command again computes only the latitudes missing from FILE and
+# rebuilds the maximums from all rows in FILE.
+#
+# > python research-twilight-vs-latitude.py --year 2024 --lat-step 0.1 -o twilight-vs-latitude-2024.csv
+#
+# The maximums above are only as fine as the latitude step. With --refine TOL each
+# category's maximums, the double peaks too, are located to within TOL degrees.
+# The minute-sampled counts cannot be refined: a latitude change of 0.01 degrees can
+# let the sun graze a limit at one more noon and add a dozen minutes at once. The
+# refinement instead uses planet_sweep's hour angle formula with the year's own
+# declinations, which is smooth in latitude. Every peak of that on the latitude grid
+# at least --min-prominence percent above its surroundings brackets a golden-section
+# search. The formula holds the declination constant through each day, so its minutes
+# differ from the sampled ones by up to tens of minutes a year, most near the poles.
+# The maximums are flat: 0.01 degrees from one the minutes drop by a few hundredths,
+# close to the ripple left by sampling the declination every 5 minutes, so a
+# tolerance below about 0.005 degrees narrows the bracket without adding accuracy.
+#
+# > python research-twilight-vs-latitude.py --cube twilight-cube-2024.npz --refine 0.01
+#
+
+import math
+import os
+import sys
+from optparse import OptionParser
 
-import datetime as datetime
-import SG_sunpos_ultimate_azi_atan2 as SG
+import numpy as np
+
+import ephemeris as EPH
+import planet_sweep as PS
+import twilight_cube as TC
 
 observer_lon = 0.0
 
+CSV_HEADER = "Latitude, Day, Twilight, Night, T-Civil, T-Nautical, T-Astronomical"
+REPORT_CATEGORIES = ["Daylight", "Twilight", "Night", "Twilight-civil", "Twilight-nautical", "Twilight-astronomical"]
+
+# The refinement samples the declination every this many minutes of the year
+REFINE_SAMPLE_MINUTES = 5
+
+GOLDEN_RATIO = (math.sqrt(5.0) - 1.0) / 2.0
+
 
 class max_tw():
     def __init__(self, category):
@@ -35,6 +73,249 @@ class max_tw():
             self.minutes = minutes
 
 
+def format_row(row):
+    observer_lat, c_d, c_t, c_n, t_c, t_n, t_a = row
+    return "%s, %d, %d, %d, %d, %d, %d" % ("%g" % observer_lat, c_d, c_t, c_n, t_c, t_n, t_a)
+
+
+def run_parameters(options):
+    """
+    The line that identifies the computation in a checkpoint file
+    """
+    return "# year=%d ephemeris=%s longitude=%g zenith-limits=%s" % (
+        options.year, options.ephemeris, observer_lon, ",".join("%g" % z for z in options.zenith_limits))
+
+
+def read_checkpoint(filename, parameters):
+    """
+    Read the complete rows of a checkpoint file.
+    A partly written last row from an interrupted run is cut off the file.
+    :return: list of (latitude, day, twilight, night, civil, nautical, astronomical)
+    """
+    with open(filename, "r") as f:
+        text = f.read()
+    lines = text.split("\n")
+    if lines[0] != parameters:
+        raise Exception("%s was written with '%s', not '%s'. Use another output file."
+                        % (filename, lines[0], parameters))
+    complete = len(text) if text.endswith("\n") else text.rfind("\n") + 1
+    if complete < len(text):
+        print("Discarding partial row '%s' in %s" % (text[complete:], filename), file=sys.stderr)
+        with open(filename, "r+") as f:
+            f.truncate(complete)
+    rows = []
+    for line in text[:complete].split("\n")[2:-1]:
+        fields = line.split(",")
+        rows.append((float(fields[0]),) + tuple(int(field) for field in fields[1:]))
+    return rows
+
+
+def compute_rows(latitudes, options, out, done):
+    """
+    Compute the yearly totals of each latitude not in done, writing and
+    flushing one row per latitude to out.
+    """
+    todo = [lat for lat in latitudes if round(lat, 6) not in done]
+    if not todo:
+        return
+    print("%d latitudes done, %d to compute" % (len(latitudes) - len(todo), len(todo)), file=sys.stderr)
+    sunlat, sunlon = TC.year_almanac(options.year, ephemeris_name=options.ephemeris)
+    for observer_lat in todo:
+        totals = TC.latitude_day_minutes(observer_lat, sunlat, sunlon, observer_lon,
+                                         options.zenith_limits).sum(axis=0, dtype=np.int64)
+        out.write(format_row((observer_lat, totals[TC.DAY], TC.twilight_minutes(totals), totals[TC.NIGHT],
+                              totals[TC.CIVIL], totals[TC.NAUTICAL], totals[TC.ASTRONOMICAL])) + "\n")
+        out.flush()
+        os.fsync(out.fileno())
+        print("latitude %6.2f done" % observer_lat, file=sys.stderr)
+
+
+def checkpointed_rows(latitudes, options):
+    """
+    Resume or start the output file and return all of its rows in latitude order
+    """
+    parameters = run_parameters(options)
+    if os.path.exists(options.output):
+        rows = read_checkpoint(options.output, parameters)
+    else:
+        with open(options.output, "w") as out:
+            out.write(parameters + "\n" + CSV_HEADER + "\n")
+        rows = []
+    with open(options.output, "a") as out:
+        compute_rows(latitudes, options, out, set(round(row[0], 6) for row in rows))
+    return sorted(read_checkpoint(options.output, parameters))
+
+
+def year_declinations(year, ephemeris_name, days=TC.DAYS_PER_YEAR):
+    """
+    Solar declinations in radians every REFINE_SAMPLE_MINUTES of a year
+    """
+    n = EPH.year_minutes_j2000(year, days)[:, ::REFINE_SAMPLE_MINUTES]
+    sunlat, sunlon = EPH.get_ephemeris(ephemeris_name).sun_position(n.ravel())
+    return np.radians(sunlat)
+
+
+def analytic_minutes(latitudes, dec, zenith_limits, days=TC.DAYS_PER_YEAR):
+    """
+    Minutes per year in each report column at each latitude from the hour angle
+    the sun spends above each zenith limit at each sampled declination.
+    :return: numpy array shaped (latitudes, 6) in CSV_HEADER column order
+    """
+    lat = np.radians(np.atleast_1d(np.asarray(latitudes, dtype=np.float64)))[:, None]
+    sin_lat, cos_lat = np.sin(lat), np.cos(lat)
+    sin_dec, cos_dec = np.sin(dec)[None, :], np.cos(dec)[None, :]
+    above = np.stack([PS.fraction_above(math.cos(math.radians(zenith)), sin_lat, cos_lat, sin_dec, cos_dec)
+                      .mean(axis=-1) for zenith in zenith_limits], axis=-1) * (days * TC.MINUTES_PER_DAY)
+    civil, nautical, astronomical = (above[:, k + 1] - above[:, k] for k in range(3))
+    return np.column_stack((above[:, 0], above[:, -1] - above[:, 0], days * TC.MINUTES_PER_DAY - above[:, -1],
+                            civil, nautical, astronomical))
+
+
+def prominent_peaks(values, min_prominence):
+    """
+    Indexes of the local maximums of values whose prominence is at least
+    min_prominence percent of their value. The prominence is the drop from
+    the peak to the lowest point on the way to the nearest higher value,
+    taking the side with the smaller drop. The largest value's prominence
+    is its drop to the smallest value.
+    """
+    peaks = []
+    n = len(values)
+    for i in range(n):
+        if (i > 0 and values[i - 1] >= values[i]) or (i < n - 1 and values[i + 1] > values[i]):
+            continue
+        bases = []
+        higher = np.nonzero(values[:i] > values[i])[0]
+        if len(higher):
+            bases.append(values[higher[-1]:i].min())
+        higher = np.nonzero(values[i + 1:] > values[i])[0]
+        if len(higher):
+            bases.append(values[i + 1:i + 2 + higher[0]].min())
+        base = max(bases) if bases else values.min()
+        if values[i] - base >= values[i] * min_prominence / 100.0:
+            peaks.append(i)
+    return peaks
+
+
+def golden_section_max(f, a, b, tolerance):
+    """
+    Golden-section search for the maximum of a function unimodal on a..b.
+    Each step keeps the part of the bracket that holds the larger of two inner
+    points and evaluates f once, shrinking the bracket by GOLDEN_RATIO.
+    :return: (x, f(x), evaluations) with x within tolerance of the maximum
+    """
+    c, d = b - GOLDEN_RATIO * (b - a), a + GOLDEN_RATIO * (b - a)
+    fc, fd = f(c), f(d)
+    evaluations = 2
+    while b - a > tolerance:
+        if fc >= fd:
+            b, d, fd = d, c, fc
+            c = b - GOLDEN_RATIO * (b - a)
+            fc = f(c)
+        else:
+            a, c, fc = c, d, fd
+            d = a + GOLDEN_RATIO * (b - a)
+            fd = f(d)
+        evaluations += 1
+    return (c, fc, evaluations) if fc >= fd else (d, fd, evaluations)
+
+
+def refine_maximums(latitudes, year, ephemeris_name, zenith_limits, tolerance, min_prominence):
+    """
+    Locate the maximums of each report column to within tolerance degrees
+    :return: list of (category, latitude, minutes, grid latitude, evaluations, largest)
+    """
+    dec = year_declinations(year, ephemeris_name)
+    latitudes = np.asarray(latitudes, dtype=np.float64)
+    grid = analytic_minutes(latitudes, dec, zenith_limits)
+    results = []
+    for column, category in enumerate(REPORT_CATEGORIES):
+        found = []
+        for i in prominent_peaks(grid[:, column], min_prominence):
+            lat, minutes, evaluations = golden_section_max(
+                lambda x: analytic_minutes(x, dec, zenith_limits)[0, column],
+                latitudes[max(i - 1, 0)], latitudes[min(i + 1, len(latitudes) - 1)], tolerance)
+            found.append([category, lat, minutes, latitudes[i], evaluations, False])
+        if found:
+            max(found, key=lambda peak: peak[2])[5] = True
+        results.extend(found)
+    return results
+
+
+def parse_zenith_limits(option, opt_str, value, parser):
+    try:
+        limits = [float(z) for z in value.split(",")]
+    except ValueError:
+        limits = []
+    if len(limits) != len(TC.ZENITH_LIMITS_DEG) or limits != sorted(limits):
+        parser.error("%s needs %d increasing zenith angles, got '%s'" % (opt_str, len(TC.ZENITH_LIMITS_DEG), value))
+    setattr(parser.values, option.dest, limits)
+
+
+parser = OptionParser()
+parser.add_option("--year", action="store", type="int", dest="year", default=2024,
+                  help="Calendar year to compute. default=2024")
+parser.add_option("--lat-start", action="store", type="float", dest="lat_start", default=-90.0,
+                  help="First latitude in degrees. default=-90.0")
+parser.add_option("--lat-stop", action="store", type="float", dest="lat_stop", default=90.0,
+                  help="Last latitude in degrees. default=90.0")
+parser.add_option("--lat-step", action="store", type="float", dest="lat_step", default=1.0,
+                  help="Latitude step in degrees. default=1.0")
+parser.add_option("--zenith-limits", action="callback", type="string", dest="zenith_limits",
+                  callback=parse_zenith_limits, default=TC.ZENITH_LIMITS_DEG, metavar="D,C,N,A",
+                  help="Upper zenith angles in degrees of day, civil, nautical and astronomical twilight. "
+                       "default=90,96,102,108")
+parser.add_option("-o", "--output", action="store", type="string", dest="output", default=None, metavar="FILE",
+                  help="Append each latitude's row to CSV FILE as it is computed. "
+                       "If FILE exists resume it, computing only the missing latitudes.")
+parser.add_option("--cube", action="store", type="string", dest="cube", default=None, metavar="FILE",
+                  help="Read the latitude x day twilight cube from .npz FILE. "
+                       "If FILE does not exist compute the cube and save it there.")
+parser.add_option("--ephemeris", action="store", type="choice", dest="ephemeris",
+                  choices=list(EPH.EPHEMERIDES), default=EPH.DEFAULT_EPHEMERIS,
+                  help="Solar position model: %s. default=%s" % (", ".join(EPH.EPHEMERIDES), EPH.DEFAULT_EPHEMERIS))
+parser.add_option("--chebyshev", action="store", type="string", dest="chebyshev", default=None, metavar="FILE",
+                  help="Use the chebyshev ephemeris with coefficients written by "
+                       "ephemeris.py --fit-chebyshev to .npz FILE")
+parser.add_option("--refine", action="store", type="float", dest="refine", default=None, metavar="TOL",
+                  help="Also locate each category's maximums to within TOL degrees of latitude")
+parser.add_option("--min-prominence", action="store", type="float", dest="min_prominence", default=1.0,
+                  metavar="PERCENT",
+                  help="With --refine, refine only peaks at least PERCENT of their minutes above "
+                       "their surroundings. default=1.0")
+(options, args) = parser.parse_args()
+
+if options.cube is not None and options.output is not None:
+    parser.error("--cube and --output are alternatives")
+if options.cube is not None and options.zenith_limits != TC.ZENITH_LIMITS_DEG:
+    parser.error("--cube uses the default zenith limits")
+if options.refine is not None and not options.refine > 0.0:
+    parser.error("--refine needs a positive tolerance")
+if options.chebyshev is not None:
+    if options.ephemeris not in (EPH.DEFAULT_EPHEMERIS, EPH.ChebyshevEphemeris.name):
+        parser.error("--chebyshev selects the chebyshev ephemeris, not '%s'" % options.ephemeris)
+    options.ephemeris = EPH.get_ephemeris(EPH.ChebyshevEphemeris.name, options.chebyshev).name
+
+latitudes = [float(lat) for lat in TC.latitude_range(options.lat_start, options.lat_stop, options.lat_step)]
+# the rows' latitudes, year and ephemeris; an existing --cube supplies its own
+year, ephemeris_name = options.year, options.ephemeris
+
+if options.output is not None:
+    rows = checkpointed_rows(latitudes, options)
+    wanted = set(round(lat, 6) for lat in latitudes)
+    rows = [row for row in rows if round(row[0], 6) in wanted]
+else:
+    if options.cube is not None and os.path.exists(options.cube):
+        cube = TC.TwilightCube.load(options.cube)
+        latitudes = [float(lat) for lat in cube.latitudes]
+        year, ephemeris_name = cube.year, cube.ephemeris_name
+    else:
+        cube = TC.compute_cube(latitudes, options.year, observer_lon, verbose=True,
+                               ephemeris_name=options.ephemeris, zenith_limits=options.zenith_limits)
+        if options.cube is not None:
+            cube.save(options.cube)
+    rows = cube.yearly_report_rows()
+
 max_d = max_tw("Daylight")
 max_t = max_tw("Twilight")
 max_n = max_tw("Night")
@@ -42,28 +323,10 @@ max_tc = max_tw("Twilight-civil")
 max_tn = max_tw("Twilight-nautical")
 max_ta = max_tw("Twilight-astronomical")
 
-print("Latitude, Day, Twilight, Night, T-Civil, T-Nautical, T-Astronomical")
-for observer_lat in range(-90, 91):
-    c_d = c_n = t_c = t_n = t_a = 0
-    tod_base_year = datetime.datetime(2024, 1, 1)
-    for pday in range(0, 365):
-        tod_base_day = tod_base_year + datetime.timedelta(days=pday)
-        for pminute in range(24 * 60):
-            tod_now = tod_base_day + datetime.timedelta(minutes=pminute)
-            s_coalt, s_az, sunlat, sunlon, esd, eot = SG.solar_geometry(tod_now, observer_lat, observer_lon)
-
-            if s_coalt <= 90.0:
-                c_d += 1
-            elif s_coalt <= 96.0:
-                t_c += 1
-            elif s_coalt <= 102.0:
-                t_n += 1
-            elif s_coalt <= 108.0:
-                t_a += 1
-            else:
-                c_n += 1
-    c_t = t_c + t_n + t_a
-    print("%s, %d, %d, %d, %d, %d, %d" % (observer_lat, c_d, c_t, c_n, t_c, t_n, t_a))
+print(CSV_HEADER)
+for row in rows:
+    observer_lat, c_d, c_t, c_n, t_c, t_n, t_a = row
+    print(format_row(row))
 
     max_d.accumulate(observer_lat, c_d)
     max_t.accumulate(observer_lat, c_t)
@@ -75,4 +338,13 @@ for observer_lat in range(-90, 91):
 print("Observed maximums")
 print("Category, Latitude, Minutes")
 for maxx in [max_d, max_t, max_n, max_tc, max_tn, max_ta]:
-    print("%s, %d, %d" % (maxx.category, maxx.lat, maxx.minutes))
+    print("%s, %g, %d" % (maxx.category, maxx.lat, maxx.minutes))
+
+if options.refine is not None:
+    print("Refined maximums, latitude within %g degrees" % options.refine)
+    print("Category, Latitude, Minutes, Grid latitude, Evaluations, Peak")
+    for category, lat, minutes, grid_lat, evaluations, largest in refine_maximums(
+            latitudes, year, ephemeris_name, options.zenith_limits, options.refine,
+            options.min_prominence):
+        print("%s, %.4f, %.1f, %g, %d, %s" % (category, lat, minutes, grid_lat, evaluations,
+                                               "largest" if largest else "local"))
@@ -0,0 +1,82 @@
+#!/usr/bin/python
+# shared_array - numpy arrays that worker processes fill in place
+#
+# Results computed in a process pool normally travel back to the parent pickled
+# through a pipe, a copy for every tile. Here the parent allocates the output once,
+# in multiprocessing.shared_memory or in a memory-mapped .npy file, and passes
+# only a small description of it to the workers. Each worker maps the same
+# memory and writes its tile in place. The parent reads the result as a numpy
+# array on the same memory.
+#
+
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class SharedArray:
+    """
+    A numpy array in multiprocessing.shared_memory.
+    The creating process passes spec() to workers, which attach() to the same memory.
+    numpy arrays made from .array do not keep the memory mapped: drop them
+    before close(). Use the SharedArray as a context manager to close it.
+    """
+    def __init__(self, shape, dtype, name=None):
+        """
+        Create a new shared array, or attach to the existing one called name
+        """
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.owner = name is None
+        size = max(int(np.prod(self.shape)) * self.dtype.itemsize, 1)
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=size if self.owner else 0)
+        self.array = np.ndarray(self.shape, self.dtype, buffer=self.shm.buf)
+
+    def spec(self):
+        """
+        Picklable description for attach() in another process
+        """
+        return "shm", self.shm.name, self.shape, self.dtype.str
+
+    def close(self):
+        """
+        Unmap the memory. The creating process also frees it.
+        """
+        self.array = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+
+def npy_spec(filename):
+    """
+    Picklable description of a .npy file for attach() in another process
+    """
+    return "npy", filename
+
+
+def create_npy(filename, shape, dtype):
+    """
+    Create a .npy file of zeros and return it as a writable memory map
+    """
+    return np.lib.format.open_memmap(filename, mode="w+", dtype=dtype, shape=tuple(shape))
+
+
+def attach(spec):
+    """
+    In a worker, map the array described by SharedArray.spec() or npy_spec().
+    :return: (numpy array, handle to keep open while the array is in use, or None)
+    """
+    if spec[0] == "shm":
+        kind, name, shape, dtype = spec
+        shared = SharedArray(shape, dtype, name)
+        return shared.array, shared
+    if spec[0] == "npy":
+        return np.lib.format.open_memmap(spec[1], mode="r+"), None
+    raise Exception("Unknown shared array kind '%s'" % spec[0])
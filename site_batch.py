@@ -0,0 +1,286 @@
+#!/usr/bin/python
+# site_batch - twilight events and durations for many observers at once
+#
+# twilight_events.py solves one site's year in milliseconds, but a loop over
+# thousands of sites would evaluate the almanac thousands of times for the
+# same days. Here the almanac is tabulated once, hourly over the date range,
+# and every site interpolates in that table. Sites are solved in blocks:
+# all days of a block of sites are one set of numpy arrays small enough to
+# stay in cache, and memory does not grow with the number of sites.
+#
+# Per site and day the result holds the UTC times of the nine events of
+# twilight_events.py, the sun up / sun down flags, and the minutes of daylight,
+# civil, nautical and astronomical twilight, and night.
+#
+# Example: 10000 random sites over 2019, saved to a .npz file. Solving them
+# takes about 20 seconds on one CPU and compressing the file as long again.
+#
+# > python site_batch.py --random 10000 --year 2019 -f sites-2019.npz
+#
+# Sites from a CSV file of latitude, longitude lines
+#
+# > python site_batch.py --sites sites.csv --first-day 0 --last-day 30
+#
+
+import datetime
+from optparse import OptionParser
+import sys
+import time
+import traceback
+
+import numpy as np
+
+import SG_sunpos_ultimate_azi_atan2 as SG
+import ephemeris as EPH
+import twilight_cube as TC
+import twilight_events as TE
+
+# Sites per block. A block of 32 sites by 365 days is 12k observer days,
+# about 90 KB per array, which stays in cache through each iteration.
+BLOCK_SITES = 32
+
+MINUTES_PER_DAY = 24 * 60
+
+# Local noon moves from 12:00 mean solar time by the equation of time, under 17 minutes
+EOT_MARGIN_HOURS = 0.5
+
+# Sites for --check, on and off the prime meridian: latitude, longitude
+CHECK_SITES = [(42.6, 0.0), (65.0, -150.0), (-70.0, 170.0), (80.0, 90.0), (-60.0, -100.0), (0.0, 179.0)]
+
+# --check counts the cube's categories over each site's own day, local noon - 12 h
+# to noon + 12 h, every 10 seconds. Sampling leaves under half a minute a day;
+# the yearly totals, where it mostly cancels, agree within a few minutes.
+CHECK_DAY_MINUTES = 1.0
+CHECK_YEAR_MINUTES = 5.0
+CHECK_SAMPLES_PER_MINUTE = 6
+# Step of the daily sampling phase, in samples: the golden ratio spreads the phases evenly
+CHECK_PHASE_STEP = (np.sqrt(5.0) - 1.0) / 2.0
+
+
+class SiteEvents:
+    """
+    Events of a range of days for many observers.
+    hours is shaped (sites, days, 9) and flags (sites, days, 4), each site's
+    rows as in twilight_events.EventTable.
+    """
+    def __init__(self, latitudes, longitudes, year, days, hours, flags):
+        self.latitudes = np.asarray(latitudes, dtype=np.float64)
+        self.longitudes = np.asarray(longitudes, dtype=np.float64)
+        self.year = year
+        self.days = np.asarray(days)
+        self.hours = hours
+        self.flags = flags
+
+    def site(self, index):
+        """
+        One site's events as a twilight_events.EventTable
+        """
+        return TE.EventTable(self.latitudes[index], self.longitudes[index], self.year, self.days,
+                             self.hours[index], self.flags[index])
+
+    def minutes_above(self):
+        """
+        Minutes per day the sun spends at or above each of TE.EVENT_ZENITHS_DEG,
+        shaped (sites, days, 4). The time from dawn to dusk, all or none of the day
+        when the sun does not cross, and on a day with only one crossing the part
+        of the day after the dawn or before the dusk. The events are solved around
+        each site's local noon, so the day runs from 12 hours before noon to 12 after.
+        """
+        noon = self.hours[..., TE.NOON:TE.NOON + 1]
+        dawn = self.hours[..., :TE.NOON]
+        dusk = self.hours[..., TE.NOON + 1:][..., ::-1]
+        span = np.where(np.isnan(dusk), noon + 12.0, dusk) - np.where(np.isnan(dawn), noon - 12.0, dawn)
+        minutes = np.clip(span * 60.0, 0.0, MINUTES_PER_DAY)
+        minutes = np.where(self.flags == TE.SUN_UP_ALL_DAY, MINUTES_PER_DAY, minutes)
+        return np.where(self.flags == TE.SUN_DOWN_ALL_DAY, 0.0, minutes)
+
+    def minutes_per_category(self):
+        """
+        Minutes of each twilight_cube.CATEGORIES per site and day, shaped (sites, days, 5)
+        """
+        above = self.minutes_above()[..., ::-1]  # brightest category first
+        minutes = np.empty(above.shape[:-1] + (len(TC.CATEGORIES),))
+        minutes[..., TC.DAY] = above[..., 0]
+        minutes[..., TC.CIVIL:TC.NIGHT] = np.maximum(np.diff(above, axis=-1), 0.0)
+        minutes[..., TC.NIGHT] = MINUTES_PER_DAY - above[..., -1]
+        return minutes
+
+    def save(self, filename):
+        np.savez_compressed(filename, latitudes=self.latitudes, longitudes=self.longitudes, year=self.year,
+                            days=self.days, hours=self.hours.astype(np.float32), flags=self.flags,
+                            minutes=self.minutes_per_category().astype(np.float32),
+                            events=np.array(TE.EVENTS), categories=np.array(TC.CATEGORIES))
+
+    @staticmethod
+    def load(filename):
+        with np.load(filename) as npz:
+            return SiteEvents(npz["latitudes"], npz["longitudes"], int(npz["year"]), npz["days"],
+                              npz["hours"].astype(np.float64), npz["flags"])
+
+
+def site_declination_ranges(ephemeris, n0, longitudes):
+    """
+    Least and greatest declination over each site day, widened by TE.DECLINATION_MARGIN_DEG.
+    A site's day runs from local midnight to local midnight, up to 12 hours either side
+    of the UTC day, so the UTC day's range can miss a midnight sun or a noon below the horizon.
+    :param n0: J2000.0 day numbers of midnight UTC of each site day
+    :param longitudes: longitude of each site day in degrees, east positive
+    """
+    start = n0 - (longitudes / 15.0 + EOT_MARGIN_HOURS) / 24.0
+    dec_start = ephemeris.almanac(start)[0]
+    dec_end = ephemeris.almanac(start + (24.0 + 2.0 * EOT_MARGIN_HOURS) / 24.0)[0]
+    return (np.minimum(dec_start, dec_end) - TE.DECLINATION_MARGIN_DEG,
+            np.maximum(dec_start, dec_end) + TE.DECLINATION_MARGIN_DEG)
+
+
+def find_site_events(latitudes, longitudes, year=2019, first_day=0, last_day=364,
+                     ephemeris_name=EPH.DEFAULT_EPHEMERIS, block_sites=BLOCK_SITES):
+    """
+    Find the events of days first_day..last_day of year for every site.
+    :param latitudes: site latitudes in degrees
+    :param longitudes: site longitudes in degrees, east positive
+    :param year: calendar year
+    :param first_day: first day of year, 0 is January 1
+    :param last_day: last day of year, inclusive
+    :param ephemeris_name: solar position model, tabulated once for all sites
+    :param block_sites: sites solved together
+    :return: SiteEvents
+    """
+    latitudes, longitudes = np.broadcast_arrays(np.asarray(latitudes, dtype=np.float64),
+                                                np.asarray(longitudes, dtype=np.float64))
+    latitudes, longitudes = latitudes.ravel(), longitudes.ravel()
+    if np.any(np.abs(latitudes) > 90.0):
+        raise Exception("Site latitudes must be in -90..90")
+    days = np.arange(first_day, last_day + 1)
+    n0 = SG.days_since_j2000(datetime.datetime(year, 1, 1)) + days.astype(np.float64)
+
+    # Event times fall within a day and a half of UTC midnight at any longitude
+    ephemeris = EPH.TabulatedEphemeris(EPH.get_ephemeris(ephemeris_name), n0[0] - 2.0, n0[-1] + 3.0)
+
+    hours = np.empty((len(latitudes), len(days), len(TE.EVENTS)))
+    flags = np.empty((len(latitudes), len(days), len(TE.EVENT_ZENITHS_DEG)), dtype=np.int8)
+    for first in range(0, len(latitudes), block_sites):
+        last = min(first + block_sites, len(latitudes))
+        sites = last - first
+        # one observer per site day, site major
+        observer = SG.Observer(np.repeat(latitudes[first:last], len(days)),
+                               np.repeat(longitudes[first:last], len(days)))
+        block_n0 = np.tile(n0, sites)
+        dec_min, dec_max = site_declination_ranges(ephemeris, block_n0, observer.longitude)
+        block_hours, block_flags = TE.solve_events(ephemeris, block_n0, observer, dec_min, dec_max)
+        hours[first:last] = block_hours.reshape(sites, len(days), -1)
+        flags[first:last] = block_flags.reshape(sites, len(days), -1)
+    return SiteEvents(latitudes, longitudes, year, days, hours, flags)
+
+
+def check_against_cube(year=2019, sites=CHECK_SITES, ephemeris_name=EPH.DEFAULT_EPHEMERIS):
+    """
+    Compare minutes_per_category with twilight_cube's counts over the same days:
+    each site's day from local noon - 12 h to noon + 12 h, sampled CHECK_SAMPLES_PER_MINUTE times a minute.
+    :return: list of (latitude, longitude, largest day difference, largest yearly difference) in minutes
+    """
+    latitudes, longitudes = np.array(sites, dtype=np.float64).T
+    events = find_site_events(latitudes, longitudes, year, 0, TC.DAYS_PER_YEAR - 1, ephemeris_name)
+    minutes = events.minutes_per_category()
+    ephemeris = EPH.get_ephemeris(ephemeris_name)
+    n0 = SG.days_since_j2000(datetime.datetime(year, 1, 1)) + events.days.astype(np.float64)
+    # The samples sit at a different phase each day, so the up to one sample
+    # each sampled crossing gains or loses averages out over the year
+    phases = np.mod(events.days * CHECK_PHASE_STEP, 1.0)
+    samples = MINUTES_PER_DAY * CHECK_SAMPLES_PER_MINUTE
+    offsets = (np.arange(samples) + phases[:, np.newaxis]) * 24.0 / samples - 12.0
+    differences = []
+    for i, (latitude, longitude) in enumerate(sites):
+        noon = events.hours[i, :, TE.NOON]
+        sunlat, sunlon = ephemeris.sun_position(n0[:, np.newaxis] + (noon[:, np.newaxis] + offsets) / 24.0)
+        counts = TC.latitude_day_minutes(latitude, sunlat, sunlon, longitude) / float(CHECK_SAMPLES_PER_MINUTE)
+        differences.append((latitude, longitude, np.abs(minutes[i] - counts).max(),
+                            np.abs(minutes[i].sum(axis=0) - counts.sum(axis=0)).max()))
+    return differences
+
+
+def read_sites(filename):
+    """
+    Read latitude, longitude pairs from a CSV file. Lines starting with # are skipped.
+    """
+    sites = np.loadtxt(filename, delimiter=",", comments="#", ndmin=2)
+    if sites.shape[1] < 2:
+        raise Exception("Site file '%s' needs latitude, longitude on each line" % filename)
+    return sites[:, 0], sites[:, 1]
+
+
+def main_except(argv):
+    parser = OptionParser()
+
+    parser.add_option("--sites", action="store", type="string", dest="sites", default=None,
+                      help="CSV file of latitude, longitude lines", metavar="FILE")
+    parser.add_option("--random", action="store", type="int", dest="random", default=None,
+                      help="Use N random sites spread evenly over the globe", metavar="N")
+    parser.add_option("--year", action="store", type="int", dest="year", default=2019,
+                      help="Calendar year. default=2019")
+    parser.add_option("--first-day", action="store", type="int", dest="first_day", default=0,
+                      help="First day of year, 0 is January 1. default=0")
+    parser.add_option("--last-day", action="store", type="int", dest="last_day", default=364,
+                      help="Last day of year. default=364")
+    parser.add_option("--ephemeris", action="store", type="choice", dest="ephemeris",
+                      choices=list(EPH.EPHEMERIDES), default=EPH.DEFAULT_EPHEMERIS,
+                      help="Solar position model: %s. default=%s"
+                           % (", ".join(EPH.EPHEMERIDES), EPH.DEFAULT_EPHEMERIS))
+    parser.add_option("--block", action="store", type="int", dest="block", default=BLOCK_SITES,
+                      help="Sites solved together. default=%d" % BLOCK_SITES)
+    parser.add_option("-f", "--filename", action="store", type="string", dest="filename", default=None,
+                      help="Save the events and minutes per category as a .npz file", metavar="FILE")
+    parser.add_option("--check", action="store_true", dest="check", default=False,
+                      help="Compare the minutes per category of a few sites with twilight_cube.py "
+                           "minute counts over the same days and exit")
+
+    (options, args) = parser.parse_args(argv[1:])
+
+    if options.check:
+        failures = 0
+        print("Latitude, Longitude, Largest day difference, Largest year difference")
+        for latitude, longitude, day, year in check_against_cube(options.year, ephemeris_name=options.ephemeris):
+            bad = day > CHECK_DAY_MINUTES or year > CHECK_YEAR_MINUTES
+            print("%g, %g, %.1f, %.1f%s" % (latitude, longitude, day, year, "  FAIL" if bad else ""))
+            failures += bad
+        if failures:
+            raise Exception("%d sites differ from the cube by more than %g minutes a day or %g a year"
+                            % (failures, CHECK_DAY_MINUTES, CHECK_YEAR_MINUTES))
+        return
+
+    if (options.sites is None) == (options.random is None):
+        raise Exception("Specify the sites with one of --sites or --random")
+    if not 0 <= options.first_day <= options.last_day:
+        raise Exception("Days must satisfy 0 <= --first-day <= --last-day")
+    if options.block < 1:
+        raise Exception("--block must be at least 1")
+    if options.sites is not None:
+        latitudes, longitudes = read_sites(options.sites)
+    else:
+        rng = np.random.default_rng(2019)
+        latitudes = np.degrees(np.arcsin(rng.uniform(-1.0, 1.0, options.random)))
+        longitudes = rng.uniform(-180.0, 180.0, options.random)
+
+    start = time.perf_counter()
+    events = find_site_events(latitudes, longitudes, options.year, options.first_day, options.last_day,
+                              options.ephemeris, options.block)
+    elapsed = time.perf_counter() - start
+    minutes = events.minutes_per_category()
+    print("%d sites x %d days in %.2f s" % (len(events.latitudes), len(events.days), elapsed))
+    print("Mean minutes per day: %s" % ", ".join("%s %.1f" % (name, m)
+                                                 for name, m in zip(TC.CATEGORIES, minutes.mean(axis=(0, 1)))))
+    if options.filename is not None:
+        events.save(options.filename)
+
+
+def main(argv):
+    try:
+        main_except(argv)
+        return 0
+    except Exception as e:
+        traceback.print_exc()
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
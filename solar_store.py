@@ -0,0 +1,293 @@
+#!/usr/bin/python
+# solar_store - chunked on-disk store of solar zenith and azimuth angles
+#
+# A minute-resolution global cube of solar angles is time x latitude x longitude
+# values per variable: a year at one degree is 365*1440*181*360 floats, 136 GB
+# per variable in float32. It does not fit in memory, so the store keeps it on
+# disk in a directory:
+#
+#   index.json                  axes, chunk shape, variables and completed chunks
+#   zenith/T_A_O.npy           one chunk per variable, T, A, O the chunk indexes
+#   azimuth/T_A_O.npy          along time, latitude and longitude
+#
+# Chunks are plain .npy files. Computing a store writes one chunk at a time and
+# records it in the index, so an interrupted run resumes with the missing
+# chunks. Reading a slice memory-maps only the chunks it touches.
+#
+# Example: a store of 2019 at 2 degree resolution, then a slice of it
+#
+# > python solar_store.py -d solar-2019 --year 2019 --lat-step 2 --lon-step 2
+#
+#   import solar_store
+#   store = solar_store.SolarStore.open("solar-2019")
+#   boston = store.read("zenith", time=slice(0, 1440), lat=store.latitude_index(42.0),
+#                       lon=store.longitude_index(-72.0))
+#
+
+import datetime
+import json
+from optparse import OptionParser
+import os
+import sys
+import traceback
+
+import numpy as np
+
+import SG_sunpos_ultimate_azi_atan2 as SG
+import ephemeris as EPH
+
+INDEX_FILE = "index.json"
+VARIABLES = ("zenith", "azimuth")
+FORMAT_VERSION = 1
+
+
+def write_json_atomic(filename, obj):
+    # a reader or a crash never sees a half written index
+    temp = filename + ".tmp"
+    with open(temp, "w") as f:
+        json.dump(obj, f, indent=1)
+    os.replace(temp, filename)
+
+
+class SolarStore:
+    """
+    Solar zenith and azimuth angles in degrees over time x latitude x longitude,
+    kept as a directory of chunked .npy files and a JSON index.
+    """
+    def __init__(self, path, index):
+        self.path = path
+        self.index = index
+        self.start = datetime.datetime.fromisoformat(index["start"])
+        self.interval_minutes = index["interval_minutes"]
+        self.n_times = index["n_times"]
+        self.latitudes = np.array(index["latitudes"], dtype=np.float64)
+        self.longitudes = np.array(index["longitudes"], dtype=np.float64)
+        self.chunk_shape = tuple(index["chunk_shape"])
+        self.variables = tuple(index["variables"])
+        self.dtype = np.dtype(index["dtype"])
+        self.done = set(index["chunks"])
+
+    @staticmethod
+    def create(path, start, interval_minutes, n_times, latitudes, longitudes, chunk_shape=(1440, 30, 60),
+               dtype="float32", ephemeris_name=EPH.DEFAULT_EPHEMERIS):
+        """
+        Create an empty store directory.
+        :param start: datetime of the first sample, UTC
+        :param interval_minutes: minutes between samples
+        :param n_times: number of samples along time
+        :param latitudes: latitudes of the grid rows in degrees
+        :param longitudes: longitudes of the grid columns in degrees
+        :param chunk_shape: (times, latitudes, longitudes) per chunk
+        :param dtype: numpy dtype of the stored angles
+        :param ephemeris_name: solar position model used to fill the store
+        """
+        if os.path.exists(os.path.join(path, INDEX_FILE)):
+            raise Exception("Store '%s' already exists" % path)
+        for variable in VARIABLES:
+            os.makedirs(os.path.join(path, variable), exist_ok=True)
+        index = {"format_version": FORMAT_VERSION,
+                 "start": start.isoformat(),
+                 "interval_minutes": interval_minutes,
+                 "n_times": int(n_times),
+                 "latitudes": [float(lat) for lat in latitudes],
+                 "longitudes": [float(lon) for lon in longitudes],
+                 "chunk_shape": [int(c) for c in chunk_shape],
+                 "variables": list(VARIABLES),
+                 "dtype": np.dtype(dtype).str,
+                 "ephemeris": ephemeris_name,
+                 "chunks": []}
+        write_json_atomic(os.path.join(path, INDEX_FILE), index)
+        return SolarStore(path, index)
+
+    @staticmethod
+    def open(path):
+        with open(os.path.join(path, INDEX_FILE), "r") as f:
+            index = json.load(f)
+        if index.get("format_version") != FORMAT_VERSION:
+            raise Exception("Store '%s' is not format version %d" % (path, FORMAT_VERSION))
+        return SolarStore(path, index)
+
+    @property
+    def shape(self):
+        return self.n_times, len(self.latitudes), len(self.longitudes)
+
+    @property
+    def chunk_counts(self):
+        return tuple(-(-size // chunk) for size, chunk in zip(self.shape, self.chunk_shape))
+
+    def chunk_keys(self):
+        """
+        All chunk indexes (t, a, o) in time-major order
+        """
+        counts = self.chunk_counts
+        return [(t, a, o) for t in range(counts[0]) for a in range(counts[1]) for o in range(counts[2])]
+
+    def chunk_slices(self, key):
+        """
+        Slices of the full cube covered by chunk key
+        """
+        return tuple(slice(k * c, min((k + 1) * c, size)) for k, c, size in zip(key, self.chunk_shape, self.shape))
+
+    def chunk_filename(self, variable, key):
+        return os.path.join(self.path, variable, "%d_%d_%d.npy" % key)
+
+    def times_j2000(self, time_slice=slice(None)):
+        """
+        J2000.0 day numbers of the samples along the time axis
+        """
+        steps = np.arange(self.n_times)[time_slice]
+        return SG.days_since_j2000(self.start) + steps * self.interval_minutes / float(24 * 60)
+
+    def latitude_index(self, latitude):
+        return int(np.argmin(np.abs(self.latitudes - latitude)))
+
+    def longitude_index(self, longitude):
+        return int(np.argmin(np.abs(self.longitudes - longitude)))
+
+    def missing_chunks(self):
+        return [key for key in self.chunk_keys() if "%d_%d_%d" % key not in self.done]
+
+    def write_chunk(self, key, arrays):
+        """
+        Write the arrays of one chunk, a dict of variable name to array, and record it in the index
+        """
+        for variable in self.variables:
+            filename = self.chunk_filename(variable, key)
+            temp = filename + ".tmp.npy"
+            np.save(temp, np.asarray(arrays[variable], dtype=self.dtype))
+            os.replace(temp, filename)
+        self.done.add("%d_%d_%d" % key)
+        self.index["chunks"] = sorted(self.done)
+        write_json_atomic(os.path.join(self.path, INDEX_FILE), self.index)
+
+    def compute_chunk(self, key, ephemeris):
+        """
+        Compute the zenith and azimuth angles of one chunk with SG.solar_geometry_grid
+        """
+        t, a, o = self.chunk_slices(key)
+        zenith, azimuth = SG.solar_geometry_grid(self.times_j2000(t), self.latitudes[a], self.longitudes[o],
+                                                 ephemeris.sun_position)
+        return {"zenith": zenith, "azimuth": azimuth}
+
+    def fill(self, max_chunks=None, verbose=False):
+        """
+        Compute and write the chunks not yet in the store, at most max_chunks of them
+        :return: number of chunks written
+        """
+        ephemeris = EPH.get_ephemeris(self.index["ephemeris"])
+        missing = self.missing_chunks()
+        if max_chunks is not None:
+            missing = missing[:max_chunks]
+        for i, key in enumerate(missing):
+            self.write_chunk(key, self.compute_chunk(key, ephemeris))
+            if verbose:
+                print("[%d/%d] chunk %d_%d_%d" % ((i + 1, len(missing)) + key), file=sys.stderr)
+        return len(missing)
+
+    def chunk(self, variable, key):
+        """
+        One chunk as a read-only memory map
+        """
+        if "%d_%d_%d" % key not in self.done:
+            raise Exception("Chunk %d_%d_%d of store '%s' has not been computed" % (key + (self.path,)))
+        return np.load(self.chunk_filename(variable, key), mmap_mode="r")
+
+    def read(self, variable, time=slice(None), lat=slice(None), lon=slice(None)):
+        """
+        Read a slice of one variable. Each of time, lat and lon is an index or a slice
+        with step 1 or none. Only the chunks under the slice are mapped and copied.
+        """
+        if variable not in self.variables:
+            raise Exception("Store variable must be one of %s" % ", ".join(self.variables))
+        selections = []
+        for selection, size in zip((time, lat, lon), self.shape):
+            if isinstance(selection, slice):
+                start, stop, step = selection.indices(size)
+                if step != 1:
+                    raise Exception("Store slices must have step 1")
+                selections.append((start, max(start, stop), False))
+            else:
+                index = int(selection) + (size if selection < 0 else 0)
+                if not 0 <= index < size:
+                    raise IndexError("Store index %d out of range" % selection)
+                selections.append((index, index + 1, True))
+
+        out = np.empty(tuple(stop - start for start, stop, scalar in selections), dtype=self.dtype)
+        ranges = [range(start // c, -(-stop // c)) for (start, stop, scalar), c in zip(selections, self.chunk_shape)]
+        for key in ((t, a, o) for t in ranges[0] for a in ranges[1] for o in ranges[2]):
+            chunk = self.chunk(variable, key)
+            source, target = [], []
+            for k, c, (start, stop, scalar) in zip(key, self.chunk_shape, selections):
+                first, last = max(start, k * c), min(stop, (k + 1) * c)
+                source.append(slice(first - k * c, last - k * c))
+                target.append(slice(first - start, last - start))
+            out[tuple(target)] = chunk[tuple(source)]
+        return out.reshape(tuple(stop - start for start, stop, scalar in selections if not scalar))
+
+    def iter_chunks(self, variable):
+        """
+        Yield (slices, chunk) of one variable in time-major order to page through the
+        store with one chunk in memory at a time
+        """
+        for key in self.chunk_keys():
+            yield self.chunk_slices(key), self.chunk(variable, key)
+
+
+def main_except(argv):
+    parser = OptionParser()
+
+    parser.add_option("-d", "--directory", action="store", type="string", dest="directory", default=None,
+                      help="Store directory. Created if it does not exist, else resumed", metavar="DIR")
+    parser.add_option("--year", action="store", type="int", dest="year", default=2019,
+                      help="Calendar year to start at. default=2019")
+    parser.add_option("--days", action="store", type="int", dest="days", default=365,
+                      help="Number of days to store. default=365")
+    parser.add_option("--interval", action="store", type="int", dest="interval", default=1,
+                      help="Minutes between samples. default=1")
+    parser.add_option("--lat-step", action="store", type="float", dest="lat_step", default=1.0,
+                      help="Latitude step in degrees. default=1.0")
+    parser.add_option("--lon-step", action="store", type="float", dest="lon_step", default=1.0,
+                      help="Longitude step in degrees. default=1.0")
+    parser.add_option("--chunk", action="store", type="string", dest="chunk", default="1440,30,60",
+                      help="Chunk shape TIMES,LATS,LONS. default=1440,30,60", metavar="SHAPE")
+    parser.add_option("--ephemeris", action="store", type="choice", dest="ephemeris",
+                      choices=list(EPH.EPHEMERIDES), default=EPH.DEFAULT_EPHEMERIS,
+                      help="Solar position model: %s. default=%s"
+                           % (", ".join(EPH.EPHEMERIDES), EPH.DEFAULT_EPHEMERIS))
+    parser.add_option("--max-chunks", action="store", type="int", dest="max_chunks", default=None,
+                      help="Compute at most N chunks in this run", metavar="N")
+    parser.add_option("-q", "--quiet", action="store_true", dest="quiet", default=False,
+                      help="Do not print progress per chunk")
+
+    (options, args) = parser.parse_args(argv[1:])
+
+    if options.directory is None:
+        raise Exception("Specify the store directory with -d/--directory")
+
+    if os.path.exists(os.path.join(options.directory, INDEX_FILE)):
+        store = SolarStore.open(options.directory)
+    else:
+        chunk_shape = tuple(int(c) for c in options.chunk.split(","))
+        if len(chunk_shape) != 3 or min(chunk_shape) < 1:
+            raise Exception("Chunk shape '%s' is not in the form TIMES,LATS,LONS" % options.chunk)
+        latitudes = np.arange(-90.0, 90.0 + options.lat_step / 2, options.lat_step)
+        longitudes = np.arange(-180.0, 180.0, options.lon_step)
+        store = SolarStore.create(options.directory, datetime.datetime(options.year, 1, 1), options.interval,
+                                  options.days * 24 * 60 // options.interval, latitudes, longitudes,
+                                  chunk_shape, ephemeris_name=options.ephemeris)
+    written = store.fill(options.max_chunks, verbose=not options.quiet)
+    print("%s: shape %s, %d chunks written, %d missing"
+          % (options.directory, "x".join(str(s) for s in store.shape), written, len(store.missing_chunks())))
+
+
+def main(argv):
+    try:
+        main_except(argv)
+        return 0
+    except Exception as e:
+        traceback.print_exc()
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
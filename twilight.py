@@ -2,13 +2,24 @@
 # twilight
 # Use the SolarLat package to discover cool stuff about twilight.
 
+import bisect
+from concurrent.futures import ThreadPoolExecutor
 from optparse import OptionParser
 from SolarLat import *
 from PIL import Image, ImageDraw
+from PIL.PngImagePlugin import PngInfo
 import datetime
+import decimal
 import traceback
 import SG_sunpos_ultimate_azi_atan2 as SG
+import ephemeris as EPH
+import twilight_rle as RLE
+import json
+import numpy as np
+import os
 import string
+import sys
+import threading
 
 TWILIGHT_VERSION = "2.1.1"
 
@@ -16,6 +27,8 @@ SG_COMPUTE_INTERVAL_MINUTES = 1
 
 DEGREE_SYMBOL = "°"
 
+GREEN_RGB = (0, 128, 0)  # PIL "green"
+
 class Constants:
     """
     Earth orbital constants for defaults
@@ -102,6 +115,24 @@ class DisplayState:
                           "D3": "#FFFFFF"
                           }
 
+        # display codes in order of increasing zenith angle and the upper
+        # zenith angle of each code but the last, for the array methods
+        self.codes = ["L6", "L5", "L4", "L3", "L2", "L1", "C", "N", "A", "D1", "D2", "D3"]
+        self.zenith_limits_rad = np.array([self.rad_max_L6, self.rad_max_L5, self.rad_max_L4,
+                                           self.rad_max_L3, self.rad_max_L2, self.rad_max_L1,
+                                           self.rad_max_civil, self.rad_max_nautical,
+                                           self.rad_max_astronomical, self.rad_max_D1, self.rad_max_D2])
+
+        # Cosines of the limits for classifying by cos(zenith) without an arccos.
+        # zenith <= limit exactly when cos(zenith) >= cos(limit); the cosines
+        # are kept in increasing order for searching.
+        self.cos_limits_ascending = np.cos(self.zenith_limits_rad)[::-1].copy()
+        self.cos_limits_ascending_list = self.cos_limits_ascending.tolist()
+
+        # PIL colors of the codes as an array of RGB rows indexed like self.codes
+        self.palette_rgb = np.array([[int(self.color_pil[code][i:i + 2], 16) for i in (1, 3, 5)]
+                                     for code in self.codes], dtype=np.uint8)
+
         # pick a display strategy
         self.strategy = strategy
 
@@ -124,12 +155,29 @@ class DisplayState:
                 "D2" if zenith_angle_rad <= self.rad_max_D2 else \
                 "D3"
 
+    def get_display_code_cos(self, cos_zenith):
+        """
+        get_display_code classifying by the cosine of the zenith angle.
+        :param cos_zenith: cosine of the zenith angle, for example from SG.solar_cos_zenith_observer
+        :return: display code
+        """
+        return self.codes[len(self.cos_limits_ascending_list)
+                          - bisect.bisect_right(self.cos_limits_ascending_list, cos_zenith)]
+
     def get_display(self, value_rad):
         """
         :param value_rad:
         :return:
         """
-        val = self.get_display_code(value_rad)
+        return self.display_of_code(self.get_display_code(value_rad))
+
+    def get_display_cos(self, cos_zenith):
+        """
+        get_display classifying by the cosine of the zenith angle
+        """
+        return self.display_of_code(self.get_display_code_cos(cos_zenith))
+
+    def display_of_code(self, val):
         if self.strategy == 1:
             return val
         elif self.strategy == 2:
@@ -139,6 +187,23 @@ class DisplayState:
         else:
             return "you lose"
 
+    def get_display_index_array(self, zenith_angles_rad):
+        """
+        Vectorized get_display_code.
+        :param zenith_angles_rad: numpy array of zenith angles in radians
+        :return: numpy array of indexes into self.codes and self.palette_rgb
+        """
+        return np.searchsorted(self.zenith_limits_rad, zenith_angles_rad, side='left')
+
+    def get_display_index_array_cos(self, cos_zeniths):
+        """
+        get_display_index_array classifying by the cosines of the zenith angles.
+        :param cos_zeniths: numpy array of cosines of zenith angles
+        :return: numpy array of indexes into self.codes and self.palette_rgb
+        """
+        return len(self.cos_limits_ascending) - np.searchsorted(self.cos_limits_ascending, cos_zeniths,
+                                                                side='right')
+
 
 class AccumulateState:
     """
@@ -309,137 +374,11 @@ def ddoy_lbr(draw, ds, x_o, y_o, v_ticks, wid, deg1, deg2, color, boxlabel, bl2=
     draw.line((x + wid, y_top, x + wid + 2, y_top), "black")
     draw.text((x + wid + 5, y_top - 5), str(deg1), "black")
 
-def draw_titles(draw, width, l1, l2, l3):
-    title_y1 = 2
-    title_y2 = title_y1 + (1 * 12)
-    title_y3 = title_y1 + (2 * 12)
-    draw.text((2,title_y1), l1, "black")
-    draw.text((2,title_y2), l2, "black")
-    draw.text((2,title_y3), l3, "black")
-
-    # Draw source facts
-    source_info_x = width - 230
-    source_info_x2 = width - 190
-    draw.text((source_info_x, title_y1),
-              "project:",
-              "black")
-    draw.text((source_info_x2, title_y1),
-              "https://github.com/ChugR/solar-lat",
-              "black")
-    draw.text((source_info_x, title_y2),
-              "file:",
-              "black")
-    draw.text((source_info_x2, title_y2),
-              "twilight.py",
-              "black")
-    draw.text((source_info_x, title_y3),
-              "version:",
-              "black")
-    draw.text((source_info_x2, title_y3),
-              "%s" % TWILIGHT_VERSION,
-              "black")
-
-
-
-def main_show_a_year(options):
-    #
-    # mission code
-    # Show 2019 ephemeris data
-    #
-    # Display as:
-    #   .png file
-    #
-    # Settings for this run
-    # arg 1: observer's latitude [42]
-    # arg 2: time between sample points in minutes
-    #
-    # This program considers only a point at some latitude on the prime meridian north of the equator.
-    # South of the equator might work, but it hasn't been tested.
-    # There is no compensation for the fairly simple longitude correction where the longitude is
-    # not centered on the local time zone. Also, there is no accommodation for daylight savings time that
-    # shifts the plot by political DST rules.
-    #
-    # function args
-    o_lat_deg = options.o_lat
-
-    # observer location
-    o_lon_deg = 0.0  # prime meridian
-
-    ds = DisplayState(strategy=3)
-    # print ("Twilight v%2.1f Observer is at %2.1f degrees north." % (TWILIGHT_VERSION, o_lat_deg))
-
-    # image layout (in pixels)
-    l_margin = 30
-    r_margin = 10
-    t_margin = 75
-    b_margin = 10
-
-    # horizontal - one pixel per minute
-    # vertical   - 3 pixels per day
-    h_mag = 1
-    v_mag = 3
-
-    # gross generalizations: 24 hr/day, 60 min/hr, 365 day/year
-    h_points = 24 * 60
-    v_points = 365 * v_mag
-
-    W = l_margin + h_points + r_margin
-    H = t_margin + v_points + b_margin
-
-    # helpful grid lines
-    grid_color = "green"
-
-    # The PIL and draw canvas
-    img = Image.new("RGB", (int(W), int(H)), "white")
-    draw = ImageDraw.Draw(img)
-
-    # Draw the main diagram
-    base_dt = datetime.datetime(2019, 1, 1)
-    working_y = t_margin - v_mag
-    for pday in range(0, 365):
-        working_y += v_mag
-        working_x = l_margin - h_mag
-        last_x_start = None
-        last_x_end = None
-        last_color = None
-        for phour in range(0, 24):
-            for pmin in range(0, 60):
-                working_x += h_mag
-                td_minute = datetime.timedelta(days=pday, hours=phour, minutes=pmin)
-                date = base_dt + td_minute
-                sun_zenith_degrees, sun_azimuth_degrees, sun_lat, sun_lon, esd, eot = \
-                    SG.solar_geometry(date, o_lat_deg, o_lon_deg)
-                color = ds.get_display(radians(sun_zenith_degrees))
-                if last_x_start is None:
-                    # initialize accumulated colors
-                    last_x_start = working_x
-                    last_x_end = working_x
-                    last_color = color
-                    continue
-                else:
-                    if last_color == color:
-                        # accumulate another minute at this color
-                        last_x_end = working_x
-                        continue
-                    else:
-                        # emit current accumulation, start next
-                        draw.rectangle((last_x_start, working_y, last_x_end + h_mag, working_y + v_mag), last_color)
-                        last_x_start = working_x
-                        last_x_end = working_x
-                        last_color = color
-        # emit last color block accumulation
-        draw.rectangle((last_x_start, working_y, last_x_end + h_mag, working_y + v_mag), last_color)
-
-    # Draw the plot title
-    draw_titles(draw, W,
-                "Solar-lat twilight year view",
-                "Altitude of sun. Colors indicate height of sun above or below horizon",
-                "Observer on prime meridian at latitude: %0.1f" % o_lat_deg)
-
-    # Draw the legend
+def draw_legend(draw, ds, lb_left):
+    # the color legend box at the top of the year and world views:
+    # daytime phase, plot color and solar altitude
     # define legend box "lb"
     lb_top = 0
-    lb_left = 450
     lb_width = 600  # better if divisible by 12
 
     lb_n_color_boxes = 12
@@ -516,51 +455,493 @@ def main_show_a_year(options):
     draw.line((lb_left + 3 * x_inc, lb_top, lb_left + 3 * x_inc, y2), "black")
     draw.line((lb_left + 6 * x_inc, lb_top, lb_left + 6 * x_inc, y2), "black")
 
-    # draw time of day across top
-    x_hr_incr = h_points / 24
-    y_st = t_margin
-    # axis title
-    draw.text((l_margin + 3 * lb_text_margin, t_margin - 24), "GMT", "black")
-    # tick marks
-    y_h = 12  # start with a longer tick mark
-    for hr in range(0, 24, 1):
-        x = l_margin + hr * x_hr_incr
-        draw.line((x, y_st, x, y_st - y_h), "black")
-        y_h ^= 8  # toggle between longer and shorter tick mark
-        for y_o in range(t_margin, t_margin + v_points, 8):
-            draw.line((x, y_o, x, y_o + 1), grid_color)
-    # axis hour text
-    for hr in range(0, 24, 2):
-        draw.text((l_margin + hr * x_hr_incr + 3 * lb_text_margin, t_margin - 12), "%d:00" % hr, "black")
-
-    # day of year down the side
-    ddoy(draw, "2015.01.01", "Jan 1", l_margin, t_margin, v_mag, h_points, grid_color)
-    ddoy(draw, "2015.02.01", "Feb 1", l_margin, t_margin, v_mag, h_points, grid_color)
-    ddoy(draw, "2015.03.01", "Mar 1", l_margin, t_margin, v_mag, h_points, grid_color)
-    ddoy(draw, "2015.04.01", "Apr 1", l_margin, t_margin, v_mag, h_points, grid_color)
-    ddoy(draw, "2015.05.01", "May 1", l_margin, t_margin, v_mag, h_points, grid_color)
-    ddoy(draw, "2015.06.01", "Jun 1", l_margin, t_margin, v_mag, h_points, grid_color)
-    ddoy(draw, "2015.07.01", "Jul 1", l_margin, t_margin, v_mag, h_points, grid_color)
-    ddoy(draw, "2015.08.01", "Aug 1", l_margin, t_margin, v_mag, h_points, grid_color)
-    ddoy(draw, "2015.09.01", "Sep 1", l_margin, t_margin, v_mag, h_points, grid_color)
-    ddoy(draw, "2015.10.01", "Oct 1", l_margin, t_margin, v_mag, h_points, grid_color)
-    ddoy(draw, "2015.11.01", "Nov 1", l_margin, t_margin, v_mag, h_points, grid_color)
-    ddoy(draw, "2015.12.01", "Dec 1", l_margin, t_margin, v_mag, h_points, grid_color)
-
-    # little plus signs at key day times
-    dplusses(draw, "2015.03.21", l_margin, t_margin, v_mag, h_points)
-    dplusses(draw, "2015.06.21", l_margin, t_margin, v_mag, h_points)
-    dplusses(draw, "2015.09.21", l_margin, t_margin, v_mag, h_points)
-    dplusses(draw, "2015.12.21", l_margin, t_margin, v_mag, h_points)
 
+def draw_title_line(draw, line_n, text):
+    # title lines 1..3 at the top left
+    draw.text((2, 2 + ((line_n - 1) * 12)), text, "black")
+
+
+def draw_titles(draw, width, l1, l2, l3):
+    title_y1 = 2
+    title_y2 = title_y1 + (1 * 12)
+    title_y3 = title_y1 + (2 * 12)
+    draw_title_line(draw, 1, l1)
+    draw_title_line(draw, 2, l2)
+    draw_title_line(draw, 3, l3)
+
+    # Draw source facts
+    source_info_x = width - 230
+    source_info_x2 = width - 190
+    draw.text((source_info_x, title_y1),
+              "project:",
+              "black")
+    draw.text((source_info_x2, title_y1),
+              "https://github.com/ChugR/solar-lat",
+              "black")
+    draw.text((source_info_x, title_y2),
+              "file:",
+              "black")
+    draw.text((source_info_x2, title_y2),
+              "twilight.py",
+              "black")
+    draw.text((source_info_x, title_y3),
+              "version:",
+              "black")
+    draw.text((source_info_x2, title_y3),
+              "%s" % TWILIGHT_VERSION,
+              "black")
+
+
+
+class ChromeTemplate:
+    """
+    The static layers of a view - titles, legends, ticks and grids - rendered once.
+    draw_chrome(img, draw) draws everything in the view that does not change between frames.
+    Outside the plot box a frame takes the template as is. Inside the plot box it takes
+    only the pixels the chrome draws. Those are found by drawing the chrome on a white
+    and on a black background and keeping the pixels that come out the same.
+    Pixels that come out different, the antialiased edges of text, are blended
+    over the frame: on a white frame pixel the result is the pixel drawn on white.
+    """
+    def __init__(self, on_white, on_black, plot_box):
+        self.image = on_white
+        self.on_black = on_black
+        self.plot_box = plot_box
+
+        white = np.asarray(on_white)
+        black = np.asarray(on_black)
+        drawn = np.all(white == black, axis=2)
+        mask = np.ones(drawn.shape, dtype=bool)
+        left, top, right, bottom = plot_box
+        mask[top:bottom, left:right] = drawn[top:bottom, left:right]
+        self.mask = Image.fromarray(mask)
+
+        # partly drawn pixels in the plot box: not blank on white, not the same on black
+        blended = np.zeros(drawn.shape, dtype=bool)
+        blended[top:bottom, left:right] = ~drawn[top:bottom, left:right] & \
+            np.any(white[top:bottom, left:right] != 255, axis=2)
+        self.blend_yx = np.nonzero(blended)
+        self.blend_white = white[self.blend_yx].astype(np.int32)
+        self.blend_black = black[self.blend_yx].astype(np.int32)
+
+    @staticmethod
+    def draw(size, plot_box, draw_chrome):
+        on_white = Image.new("RGB", size, "white")
+        draw_chrome(on_white, ImageDraw.Draw(on_white))
+        on_black = Image.new("RGB", size, "black")
+        draw_chrome(on_black, ImageDraw.Draw(on_black))
+        return ChromeTemplate(on_white, on_black, plot_box)
+
+    def save(self, filename):
+        # the drawings on white and on black stacked in one .png, the plot box in its text
+        W, H = self.image.size
+        both = Image.new("RGB", (W, 2 * H))
+        both.paste(self.image, (0, 0))
+        both.paste(self.on_black, (0, H))
+        info = PngInfo()
+        info.add_text("plot_box", json.dumps(list(self.plot_box)))
+        # per process, so runs sharing the cache do not replace each other's partial file
+        temp = "%s.%d.tmp.png" % (filename, os.getpid())
+        both.save(temp, "PNG", pnginfo=info)
+        os.replace(temp, filename)
+
+    @staticmethod
+    def load(filename):
+        with Image.open(filename) as both:
+            both.load()
+            plot_box = tuple(json.loads(both.text["plot_box"]))
+            W, H = both.size[0], both.size[1] // 2
+            return ChromeTemplate(both.crop((0, 0, W, H)), both.crop((0, H, W, 2 * H)), plot_box)
+
+    def compose(self, img):
+        """
+        Lay the chrome over a frame whose plot area is drawn
+        """
+        img.paste(self.image, mask=self.mask)
+        if len(self.blend_yx[0]) == 0:
+            return img
+        pixels = np.array(img)
+        under = pixels[self.blend_yx].astype(np.int32)
+        over = self.blend_black + ((self.blend_white - self.blend_black) * under + 127) // 255
+        on_white = np.all(under == 255, axis=1)[:, np.newaxis]
+        pixels[self.blend_yx] = np.where(on_white, self.blend_white, over).astype(np.uint8)
+        return Image.fromarray(pixels, "RGB")
+
+
+class RenderContext:
+    """
+    State shared by every image rendered in one process: the display palette,
+    the ephemeris backend and its almanac tables, and static chrome templates.
+    With a chrome_dir the templates are also kept on disk for later processes.
+    """
+    def __init__(self, ephemeris_name=EPH.DEFAULT_EPHEMERIS, chrome_dir=None):
+        self.ds = DisplayState(strategy=3)
+        self.ephemeris = EPH.get_ephemeris(ephemeris_name)
+        self.almanacs = {}
+        self.chromes = {}
+        self.chrome_dir = chrome_dir
+
+    def almanac(self, base_dt, days=1):
+        """
+        Return solar declination and subsolar longitude in degrees for each
+        minute of the days starting at base_dt, each shaped (days, 1440)
+        """
+        key = (base_dt, days)
+        if key not in self.almanacs:
+            # the views have always taken the hour rounded to 1/1000 h from SG.solar_geometry;
+            # the rounding moves blips and color band edges by a pixel, so it is kept
+            self.almanacs[key] = self.ephemeris.sun_position(minutes_j2000(base_dt, days), rounded_hour=True)
+        return self.almanacs[key]
+
+    def chrome_filename(self, key):
+        # the version is in the name so that templates drawn by another release are not used
+        return os.path.join(self.chrome_dir, "chrome_%s_v%s.png" % ("_".join(str(k) for k in key), TWILIGHT_VERSION))
+
+    def chrome(self, key, size, plot_box, draw_chrome):
+        """
+        Return the ChromeTemplate for key, drawing it on first use
+        or loading it from the chrome_dir
+        """
+        if key not in self.chromes:
+            filename = None if self.chrome_dir is None else self.chrome_filename(key)
+            if filename is not None and os.path.exists(filename):
+                self.chromes[key] = ChromeTemplate.load(filename)
+            else:
+                self.chromes[key] = ChromeTemplate.draw(size, plot_box, draw_chrome)
+                if filename is not None:
+                    os.makedirs(self.chrome_dir, exist_ok=True)
+                    self.chromes[key].save(filename)
+        return self.chromes[key]
+
+
+def minutes_j2000(base_dt, days=1, interval=SG_COMPUTE_INTERVAL_MINUTES):
+    """
+    Return the J2000.0 day numbers of each sample in the days starting at base_dt
+    :param base_dt: datetime of midnight GMT
+    :param days: number of days
+    :param interval: minutes between samples
+    :return: numpy array shaped (days, 24*60/interval)
+    """
+    return SG.days_since_j2000(base_dt) + np.arange(days)[:, np.newaxis] + \
+        np.arange(0, 24 * 60, interval)[np.newaxis, :] / float(24 * 60)
+
+
+def year_start_dt():
+    # the year view shows the 2019 ephemeris from Jan 1
+    return datetime.datetime(2019, 1, 1)
+
+
+def day_start_dt(day):
+    # the day views of day-of-year day
+    return datetime.datetime(2019, 1, 1) + datetime.timedelta(days=(day+1))
+
+
+class SolarGrid:
+    """
+    The numbers behind a view: solar zenith and azimuth angles in degrees
+    for each minute of one day (day views) or 365 days (year view)
+    as seen by one observer.
+    """
+    VIEWS = ("year", "day")
+    DTYPE = [("zenith", "<f8"), ("azimuth", "<f8"), ("state", "i1")]
+
+    def __init__(self, view, o_lat_deg, o_lon_deg, day, start_dt, zenith, azimuth,
+                 ephemeris_name=EPH.DEFAULT_EPHEMERIS, sun=None):
+        if view not in SolarGrid.VIEWS:
+            raise Exception("Unknown solar grid view '%s'" % view)
+        self.view = view
+        self.o_lat_deg = float(o_lat_deg)
+        self.o_lon_deg = float(o_lon_deg)
+        self.day = int(day)
+        self.start_dt = start_dt
+        self._zenith = zenith
+        self._azimuth = azimuth
+        self.ephemeris_name = ephemeris_name
+        # A computed grid keeps the sun's positions and the cosines of the zenith angles.
+        # The angles themselves are computed when a view or a dump first asks for them.
+        self.sun = sun
+        self.cos_zenith = None
+        if sun is not None:
+            self.cos_zenith = SG.solar_cos_zenith_array(sun[0], sun[1], self.observer())
+
+    @staticmethod
+    def compute(ctx, view, o_lat_deg, day=0, o_lon_deg=0.0):
+        """
+        Compute the grid of a year view or of the day view of day-of-year day
+        """
+        if view == "year":
+            start_dt, days = year_start_dt(), 365
+        else:
+            start_dt, days = day_start_dt(day), 1
+        sun_lat, sun_lon = ctx.almanac(start_dt, days)
+        return SolarGrid(view, o_lat_deg, o_lon_deg, day, start_dt, None, None, ctx.ephemeris.name,
+                         (sun_lat, sun_lon))
+
+    def observer(self):
+        return SG.Observer(self.o_lat_deg, self.o_lon_deg)
+
+    def angles(self):
+        """
+        Zenith and azimuth angles in degrees, computed on first use
+        """
+        if self._zenith is None:
+            self._zenith, self._azimuth = SG.solar_angle_equations_array(self.sun[0], self.sun[1], self.observer())
+        return self._zenith, self._azimuth
+
+    @property
+    def zenith(self):
+        return self.angles()[0]
+
+    @property
+    def azimuth(self):
+        return self.angles()[1]
+
+    def states(self, ds):
+        """
+        Display state of each sample as an index into ds.codes.
+        A computed grid is classified by the cosines of its zenith angles, a loaded one by its angles.
+        """
+        if self.cos_zenith is not None:
+            return ds.get_display_index_array_cos(self.cos_zenith).astype(np.int8)
+        return ds.get_display_index_array(np.radians(self.zenith)).astype(np.int8)
+
+    def run_lengths(self, ds):
+        """
+        Display states as a twilight_rle.RunLengthYear
+        """
+        return RLE.RunLengthYear.from_states(self.states(ds), SG_COMPUTE_INTERVAL_MINUTES, ds.codes)
+
+    def metadata(self, ds):
+        return {"view": self.view,
+                "o_lat_deg": self.o_lat_deg,
+                "o_lon_deg": self.o_lon_deg,
+                "day": self.day,
+                "start": self.start_dt.isoformat(),
+                "interval_minutes": SG_COMPUTE_INTERVAL_MINUTES,
+                "ephemeris": self.ephemeris_name,
+                "state_codes": ds.codes,
+                "twilight_version": TWILIGHT_VERSION}
+
+    def save(self, filename, ds):
+        """
+        Write the grid and its display states. The format follows the file extension:
+          .npz - compressed numpy archive
+          .npy - numpy structured array with fields zenith, azimuth and state
+                 that np.load(filename, mmap_mode='r') maps without reading.
+                 The metadata goes to a filename.json sidecar.
+          .csv - one line per sample: day,minute,zenith,azimuth,state
+        """
+        meta = self.metadata(ds)
+        states = self.states(ds)
+        ext = os.path.splitext(filename)[1].lower()
+        if ext == ".npz":
+            np.savez_compressed(filename, zenith=self.zenith, azimuth=self.azimuth, state=states,
+                                metadata=json.dumps(meta))
+        elif ext == ".npy":
+            records = np.empty(self.zenith.shape, dtype=SolarGrid.DTYPE)
+            records["zenith"] = self.zenith
+            records["azimuth"] = self.azimuth
+            records["state"] = states
+            np.save(filename, records)
+            with open(filename + ".json", "w") as f:
+                json.dump(meta, f, indent=1)
+        elif ext == ".csv":
+            days, minutes = np.indices(self.zenith.shape)
+            rows = np.column_stack((days.ravel() + self.day, minutes.ravel() * SG_COMPUTE_INTERVAL_MINUTES,
+                                    self.zenith.ravel(), self.azimuth.ravel(), states.ravel()))
+            header = "# %s\nday,minute,zenith,azimuth,state" % json.dumps(meta)
+            np.savetxt(filename, rows, fmt=["%d", "%d", "%.6f", "%.6f", "%d"], delimiter=",",
+                       header=header, comments="")
+        else:
+            raise Exception("Dump file '%s' must end in .npz, .npy or .csv" % filename)
+
+    @staticmethod
+    def load(filename):
+        """
+        Read a grid written by save()
+        """
+        ext = os.path.splitext(filename)[1].lower()
+        if ext == ".npz":
+            with np.load(filename) as npz:
+                meta = json.loads(str(npz["metadata"]))
+                zenith, azimuth = npz["zenith"], npz["azimuth"]
+        elif ext == ".npy":
+            records = np.load(filename, mmap_mode='r')
+            with open(filename + ".json") as f:
+                meta = json.load(f)
+            zenith, azimuth = records["zenith"], records["azimuth"]
+        elif ext == ".csv":
+            with open(filename) as f:
+                meta = json.loads(f.readline()[1:])
+            rows = np.loadtxt(filename, delimiter=",", skiprows=2, ndmin=2)
+            shape = (-1, 24 * 60 // meta["interval_minutes"])
+            zenith, azimuth = rows[:, 2].reshape(shape), rows[:, 3].reshape(shape)
+        else:
+            raise Exception("Dump file '%s' must end in .npz, .npy or .csv" % filename)
+        if meta["interval_minutes"] != SG_COMPUTE_INTERVAL_MINUTES:
+            raise Exception("Dump file '%s' was computed at %d minute intervals"
+                            % (filename, meta["interval_minutes"]))
+        return SolarGrid(meta["view"], meta["o_lat_deg"], meta["o_lon_deg"], meta["day"],
+                         datetime.datetime.fromisoformat(meta["start"]), zenith, azimuth,
+                         meta.get("ephemeris", EPH.DEFAULT_EPHEMERIS))
+
+
+def output_image(img, options, filename):
     # Optionally save the image
-    if options.filename is not None:
-        img.save(options.filename, "PNG")
+    if filename is not None:
+        img.save(filename, "PNG")
 
     # Optionally skip autoviewing the image
     if not options.noautoview:
         img.show()
 
+
+def render_year(ctx, o_lat_deg, grid=None):
+    #
+    # mission code
+    # Show 2019 ephemeris data
+    #
+    # Display as:
+    #   .png file
+    #
+    # Settings for this run
+    # arg 1: observer's latitude [42]
+    # arg 2: time between sample points in minutes
+    #
+    # This program considers only a point at some latitude on the prime meridian north of the equator.
+    # South of the equator might work, but it hasn't been tested.
+    # There is no compensation for the fairly simple longitude correction where the longitude is
+    # not centered on the local time zone. Also, there is no accommodation for daylight savings time that
+    # shifts the plot by political DST rules.
+    #
+    # function args
+    # ctx: RenderContext shared by all renders in this process
+    # o_lat_deg: observer latitude in degrees
+    # grid: optional precomputed SolarGrid of this view
+
+    # observer location
+    o_lon_deg = 0.0  # prime meridian
+
+    ds = ctx.ds
+    # print ("Twilight v%2.1f Observer is at %2.1f degrees north." % (TWILIGHT_VERSION, o_lat_deg))
+
+    # image layout (in pixels)
+    l_margin = 30
+    r_margin = 10
+    t_margin = 75
+    b_margin = 10
+
+    # horizontal - one pixel per minute
+    # vertical   - 3 pixels per day
+    h_mag = 1
+    v_mag = 3
+
+    # gross generalizations: 24 hr/day, 60 min/hr, 365 day/year
+    h_points = 24 * 60
+    v_points = 365 * v_mag
+
+    W = l_margin + h_points + r_margin
+    H = t_margin + v_points + b_margin
+
+    # helpful grid lines
+    grid_color = "green"
+
+    # Draw the main diagram
+    # Each day is a row of v_mag pixels and each minute a column of h_mag pixels.
+    # As when drawing the days as rectangles the last day and the last minute
+    # each extend one pixel further.
+    if grid is None:
+        grid = SolarGrid.compute(ctx, "year", o_lat_deg, o_lon_deg=o_lon_deg)
+    color_index = grid.states(ds)
+    color_index = np.repeat(np.repeat(color_index, v_mag, axis=0), h_mag, axis=1)
+    color_index = np.pad(color_index, ((0, 1), (0, 1)), mode='edge')
+
+    pixels = np.full((H, W, 3), 255, dtype=np.uint8)
+    pixels[t_margin:t_margin + v_points + 1, l_margin:l_margin + h_points + 1] = ds.palette_rgb[color_index]
+    img = Image.fromarray(pixels, "RGB")
+
+    # The static legend, axes and grids
+    def draw_chrome(img, draw):
+        # Draw the plot title. The third line, the latitude, is drawn per frame.
+        draw_titles(draw, W,
+                    "Solar-lat twilight year view",
+                    "Altitude of sun. Colors indicate height of sun above or below horizon",
+                    "")
+
+        # Draw the legend
+        lb_text_margin = 2
+        draw_legend(draw, ds, 450)
+
+        # draw time of day across top
+        x_hr_incr = h_points / 24
+        y_st = t_margin
+        # axis title
+        draw.text((l_margin + 3 * lb_text_margin, t_margin - 24), "GMT", "black")
+        # tick marks
+        y_h = 12  # start with a longer tick mark
+        for hr in range(0, 24, 1):
+            x = l_margin + hr * x_hr_incr
+            draw.line((x, y_st, x, y_st - y_h), "black")
+            y_h ^= 8  # toggle between longer and shorter tick mark
+            for y_o in range(t_margin, t_margin + v_points, 8):
+                draw.line((x, y_o, x, y_o + 1), grid_color)
+        # axis hour text
+        for hr in range(0, 24, 2):
+            draw.text((l_margin + hr * x_hr_incr + 3 * lb_text_margin, t_margin - 12), "%d:00" % hr, "black")
+
+        # day of year down the side
+        ddoy(draw, "2015.01.01", "Jan 1", l_margin, t_margin, v_mag, h_points, grid_color)
+        ddoy(draw, "2015.02.01", "Feb 1", l_margin, t_margin, v_mag, h_points, grid_color)
+        ddoy(draw, "2015.03.01", "Mar 1", l_margin, t_margin, v_mag, h_points, grid_color)
+        ddoy(draw, "2015.04.01", "Apr 1", l_margin, t_margin, v_mag, h_points, grid_color)
+        ddoy(draw, "2015.05.01", "May 1", l_margin, t_margin, v_mag, h_points, grid_color)
+        ddoy(draw, "2015.06.01", "Jun 1", l_margin, t_margin, v_mag, h_points, grid_color)
+        ddoy(draw, "2015.07.01", "Jul 1", l_margin, t_margin, v_mag, h_points, grid_color)
+        ddoy(draw, "2015.08.01", "Aug 1", l_margin, t_margin, v_mag, h_points, grid_color)
+        ddoy(draw, "2015.09.01", "Sep 1", l_margin, t_margin, v_mag, h_points, grid_color)
+        ddoy(draw, "2015.10.01", "Oct 1", l_margin, t_margin, v_mag, h_points, grid_color)
+        ddoy(draw, "2015.11.01", "Nov 1", l_margin, t_margin, v_mag, h_points, grid_color)
+        ddoy(draw, "2015.12.01", "Dec 1", l_margin, t_margin, v_mag, h_points, grid_color)
+
+        # little plus signs at key day times
+        dplusses(draw, "2015.03.21", l_margin, t_margin, v_mag, h_points)
+        dplusses(draw, "2015.06.21", l_margin, t_margin, v_mag, h_points)
+        dplusses(draw, "2015.09.21", l_margin, t_margin, v_mag, h_points)
+        dplusses(draw, "2015.12.21", l_margin, t_margin, v_mag, h_points)
+
+    chrome = ctx.chrome(("year", W, H), (W, H),
+                        (l_margin, t_margin, l_margin + h_points + 1, t_margin + v_points + 1),
+                        draw_chrome)
+    img = chrome.compose(img)
+
+    draw = ImageDraw.Draw(img)
+    draw_title_line(draw, 3, "Observer on prime meridian at latitude: %0.1f" % o_lat_deg)
+
+    return img
+
+
+def options_grid(ctx, options, view, day=0):
+    """
+    Return the SolarGrid of a single view: loaded from --load-dump or computed.
+    Write it to --dump when asked.
+    """
+    if options.load_dump is not None:
+        grid = SolarGrid.load(options.load_dump)
+        if grid.view != view:
+            raise Exception("Dump file '%s' holds a %s-view grid" % (options.load_dump, grid.view))
+    else:
+        grid = SolarGrid.compute(ctx, view, options.o_lat, day)
+    if options.dump is not None:
+        grid.save(options.dump, ctx.ds)
+    return grid
+
+
+def main_show_a_year(options, ctx=None):
+    if ctx is None:
+        ctx = RenderContext(options.ephemeris, options.chrome_cache)
+    grid = options_grid(ctx, options, "year")
+    img = render_year(ctx, grid.o_lat_deg, grid)
+    output_image(img, options, options.filename)
     return 0
 
 
@@ -581,22 +962,18 @@ def polar_text_offsets(azimuth_deg):
     return result
 
 
-def main_show_a_day_polar(options):
+def render_day_polar(ctx, o_lat_deg, day, grid=None):
 
     # function args
-    o_lat_deg = options.o_lat
-    day = options.day
-    date = options.date
+    # ctx: RenderContext shared by all renders in this process
+    # o_lat_deg: observer latitude in degrees
+    # day: day of year 0..364
+    # grid: optional precomputed SolarGrid of this view
 
     # observer location
     o_lon_deg = 0.0  # prime meridian
 
-    ds = DisplayState(strategy=3)
-    if date != '':
-        day = get_doy(date)
-
-    print ("Twilight v%s Observer is at %2.1f degrees north." % (TWILIGHT_VERSION, o_lat_deg))
-    print ("  date: %s, day of year: %d" % (get_date_of_doy(day), day))
+    ds = ctx.ds
 
     l_margin = 50
     r_margin = 50
@@ -608,9 +985,6 @@ def main_show_a_day_polar(options):
 
     TIME_COLOR = "green"
 
-    img = Image.new("RGB", (W, H), "white")
-    draw = ImageDraw.Draw(img)
-
     # circle center
     xc = l_margin + radius
     yc = t_margin + radius
@@ -624,58 +998,41 @@ def main_show_a_day_polar(options):
     #   nadir is the circle center
     #   zenith is the circle circumference.
 
-    zeniths  = [0.0] * (24 * 60)
-    azimuths = [0.0] * (24 * 60)
-    colors   = [""]  * (24 * 60)
-    dcoses_az   = [0.0] * (24 * 60)
-    dsines_az   = [0.0] * (24 * 60)
-
     # compute this plot's numbers
-    base_dt = datetime.datetime(2019, 1, 1) + datetime.timedelta(days=(day+1))
-    for phour in range(0, 24):
-        for pmin in range(0, 60):
-            this_minute = phour * 60 + pmin
-            td_minute = datetime.timedelta(hours=phour, minutes=pmin)
-            date = base_dt + td_minute
-            sun_zenith_degrees, sun_azimuth_degrees, sun_lat, sun_lon, esd, eot = \
-                SG.solar_geometry(date, o_lat_deg, o_lon_deg)
-
-            assert(sun_zenith_degrees >=   0.0)
-            assert(sun_zenith_degrees <= 180.0)
-
-            color = ds.get_display(radians(sun_zenith_degrees))
-            dcos_az = cos(radians(sun_azimuth_degrees))
-            dsin_az = sin(radians(sun_azimuth_degrees))
-
-            zeniths[this_minute] = sun_zenith_degrees
-            azimuths[this_minute] = sun_azimuth_degrees
-            colors[this_minute] = color
-            dcoses_az[this_minute] = dcos_az
-            dsines_az[this_minute] = dsin_az
-
-    # plot the background colors
-    # zenith angles: 0, 15, 30, ... for each display color bound.
-    # ignore the last one
-    zas = [x + 90 for x in reversed(ds.elevations_in_deg[1:])]
-    # color codes corresponding to entries in zas
-    za_ccs = ["L6", "L5", "L4", "L3", "L2", "L1", "C", "N", "A", "D1", "D2", "D3"]
-
-    for zai in range(len(zas)):
-        za = zas[zai]
-        color = ds.color_pil[za_ccs[zai]]
-        bg_radius = int((float(za) / 180.0) * radius)
-        ulx = xc - bg_radius
-        uly = yc - bg_radius
-        lrx = xc + bg_radius
-        lry = yc + bg_radius
-        draw.ellipse((ulx, uly, lrx, lry), fill=color)
-
-    # Enclosing circle
-    ulx = xc - radius
-    uly = yc - radius
-    lrx = xc + radius
-    lry = yc + radius
-    draw.ellipse((ulx, uly, lrx, lry), fill=None, outline="black")
+    if grid is None:
+        grid = SolarGrid.compute(ctx, "day", o_lat_deg, day, o_lon_deg)
+    zeniths, azimuths = grid.zenith[0], grid.azimuth[0]
+    dcoses_az = np.cos(np.radians(azimuths))
+    dsines_az = np.sin(np.radians(azimuths))
+
+    # The static background colors, under the sun's track
+    def draw_background(img, draw):
+        # plot the background colors
+        # zenith angles: 0, 15, 30, ... for each display color bound.
+        # ignore the last one
+        zas = [x + 90 for x in reversed(ds.elevations_in_deg[1:])]
+        # color codes corresponding to entries in zas
+        za_ccs = ["L6", "L5", "L4", "L3", "L2", "L1", "C", "N", "A", "D1", "D2", "D3"]
+
+        for zai in range(len(zas)):
+            za = zas[zai]
+            color = ds.color_pil[za_ccs[zai]]
+            bg_radius = int((float(za) / 180.0) * radius)
+            ulx = xc - bg_radius
+            uly = yc - bg_radius
+            lrx = xc + bg_radius
+            lry = yc + bg_radius
+            draw.ellipse((ulx, uly, lrx, lry), fill=color)
+
+        # Enclosing circle
+        ulx = xc - radius
+        uly = yc - radius
+        lrx = xc + radius
+        lry = yc + radius
+        draw.ellipse((ulx, uly, lrx, lry), fill=None, outline="black")
+
+    img = ctx.chrome(("polar-background", W, H), (W, H), (0, 0, 0, 0), draw_background).image.copy()
+    draw = ImageDraw.Draw(img)
 
     # draw aa/el chart, time ticks and labels
     for phour in range(0, 24):
@@ -700,65 +1057,110 @@ def main_show_a_day_polar(options):
                     draw.text((xtick3 + xoff, ytick3 + yoff), "%d:00"%phour, TIME_COLOR)
                 pass
 
-    # draw azimuth angles around circle
-    for az_deg in range(0, 360, 10):
-        xtick = xc - int(sin(radians(az_deg)) * (radius - 2))
-        ytick = yc + int(cos(radians(az_deg)) * (radius - 2))
-        xtick2 = xc - int(sin(radians(az_deg)) * (radius + 2))
-        ytick2 = yc + int(cos(radians(az_deg)) * (radius + 2))
-        draw.line((xtick, ytick, xtick2, ytick2), "black", width=1)
-
-        xoff, yoff = polar_text_offsets(az_deg)
-        label = "%d%s"%(az_deg, DEGREE_SYMBOL)
-        if az_deg == 0:
-            label = label + " - N"
-        elif az_deg == 90:
-            label = "E\n" + label
-            yoff -= 12
-        elif az_deg == 180:
-            label = label + " - S"
-        elif az_deg == 270:
-            label = "W\n" + label
-
-        draw.text((xtick2 + xoff, ytick2 + yoff), label, "black")
-
-    # Draw the title and other facts
-    ttext = "Solar-lat twilight polar day view - altitude and azimuth of sun at time in GMT"
-    draw.text((W / 2, 2),
-              ttext,
-              "black",
-              anchor="ma")
-
-    draw_titles(draw, W,
-                "Solar-lat twilight polar day view",
-                "Altitude of sun. Colors indicate height of sun above or below horizon",
-                "Observer on prime meridian at latitude: %0.1f, Date: %s, Day of year: %d"
-                % (o_lat_deg, get_date_of_doy(day), day))
+    # The static azimuth scale and titles, over the sun's track.
+    # The hour labels may fall anywhere so the whole image is the plot box.
+    def draw_chrome(img, draw):
+        # draw azimuth angles around circle
+        for az_deg in range(0, 360, 10):
+            xtick = xc - int(sin(radians(az_deg)) * (radius - 2))
+            ytick = yc + int(cos(radians(az_deg)) * (radius - 2))
+            xtick2 = xc - int(sin(radians(az_deg)) * (radius + 2))
+            ytick2 = yc + int(cos(radians(az_deg)) * (radius + 2))
+            draw.line((xtick, ytick, xtick2, ytick2), "black", width=1)
+
+            xoff, yoff = polar_text_offsets(az_deg)
+            label = "%d%s"%(az_deg, DEGREE_SYMBOL)
+            if az_deg == 0:
+                label = label + " - N"
+            elif az_deg == 90:
+                label = "E\n" + label
+                yoff -= 12
+            elif az_deg == 180:
+                label = label + " - S"
+            elif az_deg == 270:
+                label = "W\n" + label
+
+            draw.text((xtick2 + xoff, ytick2 + yoff), label, "black")
+
+        # Draw the title and other facts. The third line is drawn per frame.
+        ttext = "Solar-lat twilight polar day view - altitude and azimuth of sun at time in GMT"
+        draw.text((W / 2, 2),
+                  ttext,
+                  "black",
+                  anchor="ma")
+
+        draw_titles(draw, W,
+                    "Solar-lat twilight polar day view",
+                    "Altitude of sun. Colors indicate height of sun above or below horizon",
+                    "")
+
+    chrome = ctx.chrome(("polar", W, H), (W, H), (0, 0, W, H), draw_chrome)
+    img = chrome.compose(img)
 
-    # Optionally save the image
-    if options.filename is not None:
-        img.save(options.filename, "PNG")
+    draw = ImageDraw.Draw(img)
+    draw_title_line(draw, 3, "Observer on prime meridian at latitude: %0.1f, Date: %s, Day of year: %d"
+                    % (o_lat_deg, get_date_of_doy(day), day))
 
-    # Optionally skip autoviewing the image
-    if not options.noautoview:
-        img.show()
+    return img
+
+
+def main_show_a_day_polar(options, ctx=None):
+    if ctx is None:
+        ctx = RenderContext(options.ephemeris, options.chrome_cache)
+    day = options.day
+    if options.date != '':
+        day = get_doy(options.date)
+    grid = options_grid(ctx, options, "day", day)
+
+    print ("Twilight v%s Observer is at %2.1f degrees north." % (TWILIGHT_VERSION, grid.o_lat_deg))
+    print ("  date: %s, day of year: %d" % (get_date_of_doy(grid.day), grid.day))
 
+    img = render_day_polar(ctx, grid.o_lat_deg, grid.day, grid)
+    output_image(img, options, options.filename)
     return 0
 
 
-def main_show_a_day_cartesian(options):
+_cartesian_grid_masks = {}
+
+
+def cartesian_grid_mask(W, H, l_margin, t_margin, h_points, v_points):
+    """
+    Return a W x H bilevel image masking the dotted grid in the cartesian day view.
+    The mask depends only on the image geometry so it is computed once and
+    stamped onto every frame.
+    """
+    key = (W, H, l_margin, t_margin, h_points, v_points)
+    if key not in _cartesian_grid_masks:
+        mask = np.zeros((H, W), dtype=bool)
+        x_hr_incr = h_points // 24
+        # dotted hour lines
+        for hr in range(0, 24, 1):
+            x = l_margin + hr * x_hr_incr
+            for y_o in range(t_margin, t_margin + v_points, 20):
+                mask[y_o:y_o + 2, x] = True
+        # dotted elevation lines every 10 degrees from the horizon
+        y_base = t_margin + (v_points // 2)
+        pixels_per_degree = float(v_points) / 180.0
+        for elevation in range(10, 90, 10):
+            y_off = int(float(elevation) * pixels_per_degree)
+            mask[y_base - y_off, l_margin:l_margin + h_points:20] = True
+            mask[y_base + y_off, l_margin:l_margin + h_points:20] = True
+        _cartesian_grid_masks[key] = Image.fromarray(mask)
+    return _cartesian_grid_masks[key]
+
+
+def render_day_cartesian(ctx, o_lat_deg, day, grid=None):
 
     # function args
-    o_lat_deg = options.o_lat
-    day = options.day
-    date = options.date
+    # ctx: RenderContext shared by all renders in this process
+    # o_lat_deg: observer latitude in degrees
+    # day: day of year 0..364
+    # grid: optional precomputed SolarGrid of this view
 
     # Observer location
     o_lon_deg = 0.0  # prime meridian
 
-    ds = DisplayState(strategy=3)
-    if date != '':
-        day = get_doy(date)
+    ds = ctx.ds
 
     # image layout (in pixels)
     l_margin = 50
@@ -771,135 +1173,249 @@ def main_show_a_day_cartesian(options):
     W = l_margin + h_points + r_margin
     H = t_margin + v_points + b_margin
 
-    # helpful grid lines
-    grid_color = "green"
+    # draw the diagram as a pixel array
+    # one zenith angle per minute gives one color per pixel column
+    if grid is None:
+        grid = SolarGrid.compute(ctx, "day", o_lat_deg, day, o_lon_deg)
+    sun_zenith_degrees = grid.zenith[0]
+
+    pixels = np.full((H, W, 3), 255, dtype=np.uint8)
+    xs = l_margin + np.arange(h_points)
+
+    # the colorized vertical bars, a 1440x1 band broadcast to the plot height
+    band = ds.palette_rgb[grid.states(ds)[0]]
+    pixels[t_margin:t_margin + v_points + 1, l_margin:l_margin + h_points] = band[np.newaxis, :, :]
+
+    # the blips to show the solar altitude for each minute
+    yse = t_margin + ((float(v_points) / 180.0) * sun_zenith_degrees).astype(int)
+    pixels[yse, xs] = np.where((sun_zenith_degrees <= 90)[:, np.newaxis], 0, 255)
+
+    img = Image.fromarray(pixels, "RGB")
+
+    # The static horizon, legend, axes and grids
+    def draw_chrome(img, draw):
+        # draw horizon
+        y = t_margin + v_points / 2
+        draw.line((l_margin, y, l_margin + h_points, y), "green", width=1)
+
+        # Draw the title and other facts
+        ttext = "Solar-lat twilight day view - altitude of sun vs. GMT"
+        draw.text(((l_margin + h_points + r_margin) / 2, 2),
+                  ttext,
+                  "black",
+                  anchor="ma")
+
+        draw_titles(draw, W,
+                    "Solar-lat twilight day view",
+                    "Altitude of sun. Colors indicate height of sun above or below horizon",
+                    "")
+
+        # draw fancy legend box right "lbr"
+        # the 0,0 for lbr is the upper right corner of the main drawing
+        lbr_top = t_margin
+        lbr_left = l_margin + h_points
+        lbr_l_margin = 3
+        lbr_w_boxes = 60
+
+        lbr_x_o = lbr_left + lbr_l_margin
+        lbr_y_o = lbr_top
+
+        ddoy_lbr(draw, ds, lbr_x_o, lbr_y_o, v_points, lbr_w_boxes, 90, 75, 'L6', '')
+        ddoy_lbr(draw, ds, lbr_x_o, lbr_y_o, v_points, lbr_w_boxes, 75, 60, 'L5', '')
+        ddoy_lbr(draw, ds, lbr_x_o, lbr_y_o, v_points, lbr_w_boxes, 60, 45, 'L4', '')
+        ddoy_lbr(draw, ds, lbr_x_o, lbr_y_o, v_points, lbr_w_boxes, 45, 30, 'L3', '')
+        ddoy_lbr(draw, ds, lbr_x_o, lbr_y_o, v_points, lbr_w_boxes, 30, 15, 'L2', '')
+        ddoy_lbr(draw, ds, lbr_x_o, lbr_y_o, v_points, lbr_w_boxes, 15, 0, 'L1', '')
+        ddoy_lbr(draw, ds, lbr_x_o, lbr_y_o, v_points, lbr_w_boxes, 0, -6, 'C', 'civil')
+        ddoy_lbr(draw, ds, lbr_x_o, lbr_y_o, v_points, lbr_w_boxes, -6, -12, 'N', 'nautical')
+        ddoy_lbr(draw, ds, lbr_x_o, lbr_y_o, v_points, lbr_w_boxes, -12, -18, 'A', 'astro-', 'nomical')
+        ddoy_lbr(draw, ds, lbr_x_o, lbr_y_o, v_points, lbr_w_boxes, -18, -42, 'D1', '')
+        ddoy_lbr(draw, ds, lbr_x_o, lbr_y_o, v_points, lbr_w_boxes, -42, -66, 'D2', '')
+        ddoy_lbr(draw, ds, lbr_x_o, lbr_y_o, v_points, lbr_w_boxes, -66, -90, 'D3', '')
+        ddoy_lbr(draw, ds, lbr_x_o, lbr_y_o, v_points, lbr_w_boxes, -90, -90, 'D3', '')
+
+        draw.text((lbr_x_o + 5, lbr_y_o - 24), "twilight", "black")
+        draw.text((lbr_x_o + 5, lbr_y_o - 12), "condition", "black")
+
+        draw.line((lbr_x_o, lbr_y_o, lbr_x_o + lbr_w_boxes, lbr_y_o), "black")
+        draw.line((lbr_x_o, lbr_y_o - 26, lbr_x_o + lbr_w_boxes, lbr_y_o - 26), "black")
+        draw.line((lbr_x_o, lbr_y_o - 26, lbr_x_o, lbr_y_o + v_points / 2), "black")
+        draw.line((lbr_x_o + lbr_w_boxes, lbr_y_o - 26, lbr_x_o + lbr_w_boxes, lbr_y_o + v_points / 2), "black")
+
+        # draw time of day across top
+        x_hr_incr = h_points / 24
+        y_st = t_margin
+        y_h = 12
+        for hr in range(0, 24, 1):
+            x = l_margin + hr * x_hr_incr
+            draw.line((x, y_st, x, y_st - y_h), "black")
+            y_h ^= 8
+        for hr in range(0, 24, 2):
+            draw.text((l_margin + hr * x_hr_incr + 3 * 1, t_margin - 12), "%d:00" % hr, "black")
+
+        # draw solar altitude legend down the side
+        dalt(draw,  90, " zenith", l_margin, t_margin, v_points)
+        dalt(draw,  80, "     80", l_margin, t_margin, v_points)
+        dalt(draw,  70, "     70", l_margin, t_margin, v_points)
+        dalt(draw,  60, "     60", l_margin, t_margin, v_points)
+        dalt(draw,  50, "     50", l_margin, t_margin, v_points)
+        dalt(draw,  40, "     40", l_margin, t_margin, v_points)
+        dalt(draw,  30, "     30", l_margin, t_margin, v_points)
+        dalt(draw,  20, "     20", l_margin, t_margin, v_points)
+        dalt(draw,  10, "     10", l_margin, t_margin, v_points)
+        dalt(draw,  00, "horizon", l_margin, t_margin, v_points)
+        dalt(draw, -10, "    -10", l_margin, t_margin, v_points)
+        dalt(draw, -20, "    -20", l_margin, t_margin, v_points)
+        dalt(draw, -30, "    -30", l_margin, t_margin, v_points)
+        dalt(draw, -40, "    -40", l_margin, t_margin, v_points)
+        dalt(draw, -50, "    -50", l_margin, t_margin, v_points)
+        dalt(draw, -60, "    -60", l_margin, t_margin, v_points)
+        dalt(draw, -70, "    -70", l_margin, t_margin, v_points)
+        dalt(draw, -80, "    -80", l_margin, t_margin, v_points)
+        dalt(draw, -90, "  nadir", l_margin, t_margin, v_points)
+
+        # stamp the dotted graph grids
+        img.paste(GREEN_RGB, mask=cartesian_grid_mask(W, H, l_margin, t_margin, h_points, v_points))
+
+    chrome = ctx.chrome(("cartesian", W, H), (W, H),
+                        (l_margin, t_margin, l_margin + h_points, t_margin + v_points + 1),
+                        draw_chrome)
+    img = chrome.compose(img)
 
-    img = Image.new("RGB", (W, H), "white")
     draw = ImageDraw.Draw(img)
+    draw_title_line(draw, 3, "Observer on prime meridian at latitude: %0.1f, Date: %s, Day of year: %d" %
+                    (o_lat_deg, get_date_of_doy(day), day))
 
-    # draw the diagram
-    base_dt = datetime.datetime(2019, 1, 1) + datetime.timedelta(days=(day+1))
-    for minute in range(0, 24 * 60):
-        # get solar geometry for this minute
-        td_minute = datetime.timedelta(minutes=minute)
-        date = base_dt + td_minute
-        sun_zenith_degrees, sun_azimuth_degrees, sun_lat, sun_lon, esd, eot = \
-            SG.solar_geometry(date, o_lat_deg, o_lon_deg)
-
-        # draw the colorized vertical bar for this minute
-        color = ds.get_display(radians(sun_zenith_degrees))
-        x = l_margin + minute
-        draw.line((x, t_margin, x, t_margin + v_points), color, width=1)
-
-        # draw the blip to show the solar altitude for this minute
-        color = "black" if sun_zenith_degrees <= 90 else "white"
-        yse = t_margin + int((float(v_points) / 180.0) * sun_zenith_degrees)
-
-        draw.line((x, yse, x, yse), color, width=1)
-
-    # draw horizon
-    y = t_margin + v_points / 2
-    draw.line((l_margin, y, l_margin + h_points, y), "green", width=1)
-
-    # Draw the title and other facts
-    ttext = "Solar-lat twilight day view - altitude of sun vs. GMT"
-    draw.text(((l_margin + h_points + r_margin) / 2, 2),
-              ttext,
-              "black",
-              anchor="ma")
-
-    draw_titles(draw, W,
-                "Solar-lat twilight day view",
-                "Altitude of sun. Colors indicate height of sun above or below horizon",
-                "Observer on prime meridian at latitude: %0.1f, Date: %s, Day of year: %d" %
-                (o_lat_deg, get_date_of_doy(day), day)
-                )
-
-    # draw fancy legend box right "lbr"
-    # the 0,0 for lbr is the upper right corner of the main drawing
-    lbr_top = t_margin
-    lbr_left = l_margin + h_points
-    lbr_l_margin = 3
-    lbr_w_boxes = 60
-
-    lbr_x_o = lbr_left + lbr_l_margin
-    lbr_y_o = lbr_top
-
-    ddoy_lbr(draw, ds, lbr_x_o, lbr_y_o, v_points, lbr_w_boxes, 90, 75, 'L6', '')
-    ddoy_lbr(draw, ds, lbr_x_o, lbr_y_o, v_points, lbr_w_boxes, 75, 60, 'L5', '')
-    ddoy_lbr(draw, ds, lbr_x_o, lbr_y_o, v_points, lbr_w_boxes, 60, 45, 'L4', '')
-    ddoy_lbr(draw, ds, lbr_x_o, lbr_y_o, v_points, lbr_w_boxes, 45, 30, 'L3', '')
-    ddoy_lbr(draw, ds, lbr_x_o, lbr_y_o, v_points, lbr_w_boxes, 30, 15, 'L2', '')
-    ddoy_lbr(draw, ds, lbr_x_o, lbr_y_o, v_points, lbr_w_boxes, 15, 0, 'L1', '')
-    ddoy_lbr(draw, ds, lbr_x_o, lbr_y_o, v_points, lbr_w_boxes, 0, -6, 'C', 'civil')
-    ddoy_lbr(draw, ds, lbr_x_o, lbr_y_o, v_points, lbr_w_boxes, -6, -12, 'N', 'nautical')
-    ddoy_lbr(draw, ds, lbr_x_o, lbr_y_o, v_points, lbr_w_boxes, -12, -18, 'A', 'astro-', 'nomical')
-    ddoy_lbr(draw, ds, lbr_x_o, lbr_y_o, v_points, lbr_w_boxes, -18, -42, 'D1', '')
-    ddoy_lbr(draw, ds, lbr_x_o, lbr_y_o, v_points, lbr_w_boxes, -42, -66, 'D2', '')
-    ddoy_lbr(draw, ds, lbr_x_o, lbr_y_o, v_points, lbr_w_boxes, -66, -90, 'D3', '')
-    ddoy_lbr(draw, ds, lbr_x_o, lbr_y_o, v_points, lbr_w_boxes, -90, -90, 'D3', '')
-
-    draw.text((lbr_x_o + 5, lbr_y_o - 24), "twilight", "black")
-    draw.text((lbr_x_o + 5, lbr_y_o - 12), "condition", "black")
-
-    draw.line((lbr_x_o, lbr_y_o, lbr_x_o + lbr_w_boxes, lbr_y_o), "black")
-    draw.line((lbr_x_o, lbr_y_o - 26, lbr_x_o + lbr_w_boxes, lbr_y_o - 26), "black")
-    draw.line((lbr_x_o, lbr_y_o - 26, lbr_x_o, lbr_y_o + v_points / 2), "black")
-    draw.line((lbr_x_o + lbr_w_boxes, lbr_y_o - 26, lbr_x_o + lbr_w_boxes, lbr_y_o + v_points / 2), "black")
-
-    # draw time of day across top
-    x_hr_incr = h_points / 24
-    y_st = t_margin
-    y_h = 12
-    for hr in range(0, 24, 1):
-        x = l_margin + hr * x_hr_incr
-        draw.line((x, y_st, x, y_st - y_h), "black")
-        y_h ^= 8
-    for hr in range(0, 24, 2):
-        draw.text((l_margin + hr * x_hr_incr + 3 * 1, t_margin - 12), "%d:00" % hr, "black")
-
-    # draw solar altitude legend down the side
-    dalt(draw,  90, " zenith", l_margin, t_margin, v_points)
-    dalt(draw,  80, "     80", l_margin, t_margin, v_points)
-    dalt(draw,  70, "     70", l_margin, t_margin, v_points)
-    dalt(draw,  60, "     60", l_margin, t_margin, v_points)
-    dalt(draw,  50, "     50", l_margin, t_margin, v_points)
-    dalt(draw,  40, "     40", l_margin, t_margin, v_points)
-    dalt(draw,  30, "     30", l_margin, t_margin, v_points)
-    dalt(draw,  20, "     20", l_margin, t_margin, v_points)
-    dalt(draw,  10, "     10", l_margin, t_margin, v_points)
-    dalt(draw,  00, "horizon", l_margin, t_margin, v_points)
-    dalt(draw, -10, "    -10", l_margin, t_margin, v_points)
-    dalt(draw, -20, "    -20", l_margin, t_margin, v_points)
-    dalt(draw, -30, "    -30", l_margin, t_margin, v_points)
-    dalt(draw, -40, "    -40", l_margin, t_margin, v_points)
-    dalt(draw, -50, "    -50", l_margin, t_margin, v_points)
-    dalt(draw, -60, "    -60", l_margin, t_margin, v_points)
-    dalt(draw, -70, "    -70", l_margin, t_margin, v_points)
-    dalt(draw, -80, "    -80", l_margin, t_margin, v_points)
-    dalt(draw, -90, "  nadir", l_margin, t_margin, v_points)
-
-    # draw graph grids
-    for hr in range(0, 24, 1):
-        x = l_margin + hr * x_hr_incr
-        for y_o in range(t_margin, t_margin + v_points, 20):
-            draw.line((x, y_o, x, y_o + 1), grid_color)
-    y_base = t_margin + (v_points / 2)
-    for elevation in range(10, 90, 10):  # elevation degrees from horizon
-        pixels_per_degree = float(v_points) / 180.0
-        y_off = int(float(elevation) * pixels_per_degree)
-        for x_o in range(l_margin, l_margin + h_points, 20):
-            draw.line((x_o, y_base - y_off, x_o, y_base - y_off), grid_color)
-            draw.line((x_o, y_base + y_off, x_o, y_base + y_off), grid_color)
+    return img
 
-    # Optionally save the image
-    if options.filename is not None:
-        img.save(options.filename, "PNG")
 
-    # Optionally skip autoviewing the image
-    if not options.noautoview:
-        img.show()
+def main_show_a_day_cartesian(options, ctx=None):
+    if ctx is None:
+        ctx = RenderContext(options.ephemeris, options.chrome_cache)
+    day = options.day
+    if options.date != '':
+        day = get_doy(options.date)
+    grid = options_grid(ctx, options, "day", day)
+    img = render_day_cartesian(ctx, grid.o_lat_deg, grid.day, grid)
+    output_image(img, options, options.filename)
+    return 0
+
+
+def world_instant(options, day=None):
+    """
+    The UTC instant of a world view: --date or day of year (2019 ephemeris) at --utc
+    """
+    try:
+        utc = datetime.datetime.strptime(options.utc, "%H:%M")
+    except ValueError:
+        raise Exception("The --utc option must be in format 'HH:MM', not '%s'" % options.utc)
+    if day is None and options.date != '':
+        date = datetime.datetime.strptime(options.date, '%Y.%m.%d')
+    else:
+        date = year_start_dt() + datetime.timedelta(days=options.day if day is None else day)
+    return date + datetime.timedelta(hours=utc.hour, minutes=utc.minute)
+
+
+def parse_world_size(size_string):
+    """
+    Given "WIDTHxHEIGHT" return the map size in pixels
+    """
+    try:
+        width, height = [int(n) for n in size_string.lower().split("x")]
+    except ValueError:
+        raise Exception("World size '%s' is not in the form WIDTHxHEIGHT" % size_string)
+    if width < 1300 or height < 180:
+        raise Exception("World size '%s' must be at least 1300x180 to fit the titles and legend" % size_string)
+    return width, height
+
+
+def render_world(ctx, when, map_w=3600, map_h=1800):
+
+    # function args
+    # ctx: RenderContext shared by all renders in this process
+    # when: UTC datetime of the view
+    # map_w, map_h: size of the equirectangular map in pixels
 
+    ds = ctx.ds
+
+    # image layout (in pixels)
+    l_margin = 40
+    r_margin = 10
+    t_margin = 75
+    b_margin = 20
+
+    W = l_margin + map_w + r_margin
+    H = t_margin + map_h + b_margin
+
+    # helpful grid lines every 30 degrees
+    grid_color = "green"
+    grid_deg = 30
+
+    # The subsolar point at this instant. Every pixel center of the
+    # map is classified by the cosine of its solar zenith angle.
+    sun_lat, sun_lon = ctx.ephemeris.sun_position(SG.days_since_j2000(when))
+    sun_lat, sun_lon = float(sun_lat), (float(sun_lon) + 180.0) % 360.0 - 180.0
+    lats = 90.0 - (np.arange(map_h) + 0.5) * 180.0 / map_h
+    lons = -180.0 + (np.arange(map_w) + 0.5) * 360.0 / map_w
+    cos_zenith = SG.solar_cos_zenith_grid(sun_lat, sun_lon, lats, lons)
+
+    pixels = np.full((H, W, 3), 255, dtype=np.uint8)
+    pixels[t_margin:t_margin + map_h, l_margin:l_margin + map_w] = \
+        ds.palette_rgb[ds.get_display_index_array_cos(cos_zenith)]
+    img = Image.fromarray(pixels, "RGB")
+
+    def x_of_lon(lon):
+        return l_margin + (lon + 180.0) * map_w / 360.0
+
+    def y_of_lat(lat):
+        return t_margin + (90.0 - lat) * map_h / 180.0
+
+    # The static legend, axes and grids
+    def draw_chrome(img, draw):
+        # Draw the plot title. The third line, the time, is drawn per frame.
+        draw_titles(draw, W,
+                    "Solar-lat twilight world view",
+                    "Altitude of sun. Colors indicate height of sun above or below horizon",
+                    "")
+
+        # Draw the legend
+        draw_legend(draw, ds, 450)
+
+        # dotted latitude and longitude lines with labels
+        for lat in range(-90 + grid_deg, 90, grid_deg):
+            y = y_of_lat(lat)
+            for x in range(l_margin, l_margin + map_w, 8):
+                draw.line((x, y, x + 1, y), grid_color)
+            draw.text((2, y - 6), "%d%s" % (lat, DEGREE_SYMBOL), "black")
+        for lon in range(-180, 181, grid_deg):
+            x = x_of_lon(lon)
+            for y in range(t_margin, t_margin + map_h, 8):
+                draw.line((x, y, x, y + 1), grid_color)
+            draw.text((x - 10, t_margin + map_h + 4), "%d%s" % (lon, DEGREE_SYMBOL), "black")
+
+        draw.rectangle((l_margin - 1, t_margin - 1, l_margin + map_w, t_margin + map_h), outline="black")
+
+    chrome = ctx.chrome(("world", W, H), (W, H),
+                        (l_margin, t_margin, l_margin + map_w, t_margin + map_h),
+                        draw_chrome)
+    img = chrome.compose(img)
+
+    # the subsolar point and the time
+    draw = ImageDraw.Draw(img)
+    x, y = x_of_lon(sun_lon), y_of_lat(sun_lat)
+    draw.ellipse((x - 6, y - 6, x + 6, y + 6), outline="black", width=2)
+    draw_title_line(draw, 3, "UTC %s - sun overhead at latitude %0.1f, longitude %0.1f"
+                    % (when.strftime("%Y-%m-%d %H:%M"), sun_lat, sun_lon))
+
+    return img
+
+
+def main_show_a_world(options, ctx=None):
+    if ctx is None:
+        ctx = RenderContext(options.ephemeris, options.chrome_cache)
+    map_w, map_h = parse_world_size(options.world_size)
+    img = render_world(ctx, world_instant(options), map_w, map_h)
+    output_image(img, options, options.filename)
     return 0
 
 
@@ -919,6 +1435,186 @@ def check_problematic_filename(filename):
     return True
 
 
+def parse_range(range_string, value_type):
+    """
+    Given "START:STOP" or "START:STOP:STEP" return the list of values
+    from START to STOP inclusive. STEP defaults to 1.
+    Values are rounded to the decimal places written in START and STEP
+    so that "-1:1:0.1" gives 0.3 and not 0.30000000000000004.
+    """
+    fields = range_string.split(":")
+    if len(fields) not in (2, 3):
+        raise Exception("Range '%s' is not in the form START:STOP[:STEP]" % range_string)
+    start = value_type(fields[0])
+    stop = value_type(fields[1])
+    step = value_type(fields[2]) if len(fields) == 3 else value_type(1)
+    if step <= 0:
+        raise Exception("Range '%s' step must be positive" % range_string)
+    count = int(round((stop - start) / step)) + 1
+    if value_type is int:
+        return [start + i * step for i in range(max(count, 0))]
+    places = max(max(-decimal.Decimal(f.strip()).as_tuple().exponent, 0) for f in fields[0::2])
+    return [round(start + i * step, places) for i in range(max(count, 0))]
+
+
+def batch_filename(template, lat, day, index):
+    """
+    Fill in the filename template for one image of a batch.
+    The template may use {lat}, {day} and {index}. Whole number latitudes
+    are integers so a template like 'twilight_year_{lat:03d}.png' works.
+    """
+    if float(lat).is_integer():
+        lat = int(lat)
+    return template.format(lat=lat, day=day, index=index)
+
+
+class ImageWriteError(Exception):
+    """
+    Writing one image failed. filename names it.
+    """
+    def __init__(self, filename, error):
+        super().__init__("Writing '%s' failed: %s" % (filename, error))
+        self.filename = filename
+
+
+class ImageWriter:
+    """
+    Encode and write .png files on background threads while the next frame renders.
+    PIL's zlib encoder releases the GIL so encoding overlaps the numpy and drawing work.
+    At most max_pending images wait to be written: write() blocks beyond that.
+    An error writing an image is raised as ImageWriteError by the next write() or by close(),
+    one error per call. The call can be repeated to go on with the other images.
+    """
+    def __init__(self, threads=1, max_pending=4):
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="png")
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.futures = []
+
+    def save(self, img, filename):
+        try:
+            img.save(filename, "PNG")
+        except Exception as e:
+            raise ImageWriteError(filename, e) from e
+        finally:
+            self.slots.release()
+
+    def raise_errors(self):
+        for future in [f for f in self.futures if f.done()]:
+            self.futures.remove(future)
+            future.result()
+
+    def write(self, img, filename):
+        self.raise_errors()
+        self.slots.acquire()
+        self.futures.append(self.executor.submit(self.save, img, filename))
+
+    def close(self):
+        """
+        Wait for every image to be written
+        """
+        while self.futures:
+            self.futures.pop(0).result()
+        self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # already failing: drop the waiting images and keep the first error
+            for future in self.futures:
+                future.cancel()
+            self.executor.shutdown(wait=True)
+
+
+def main_batch(options):
+    """
+    Render every latitude in --o-lat-range and, in day-view or world-view, every day
+    in --day-range in this one process. The renders share almanac tables, the display
+    palette and the static chrome of each view.
+    A frame that fails to render or write is reported as 'FAILED filename' and the
+    batch goes on. Return the list of failed filenames.
+    """
+    per_day = options.showDay or options.world
+    lats = [options.o_lat]
+    if options.o_lat_range is not None:
+        lats = parse_range(options.o_lat_range, float)
+    days = [get_doy(options.date) if options.date != '' else options.day]
+    if options.day_range is not None:
+        if not per_day:
+            raise Exception("The --day-range option is valid only in --show-day day view or --world view")
+        days = parse_range(options.day_range, int)
+
+    template = options.filename_template
+    if template is None:
+        if options.world:
+            template = "twilight_world_{day:03d}.png"
+        elif not options.showDay:
+            template = "twilight_year_lat_{lat}.png"
+        elif options.polar:
+            template = "twilight_day_polar_{day:03d}_lat_{lat}.png"
+        else:
+            template = "twilight_day_{day:03d}_lat_{lat}.png"
+
+    targets = []
+    for lat in lats:
+        for day in (days if per_day else [None]):
+            filename = batch_filename(template, lat, day, options.first_index + len(targets))
+            if not check_problematic_filename(filename):
+                raise Exception("Batch filename '%s' is limited to alphanumeric characters "
+                                "with no directory traversals" % filename)
+            targets.append((lat, day, filename))
+
+    ctx = RenderContext(options.ephemeris, options.chrome_cache)
+    if options.world:
+        map_w, map_h = parse_world_size(options.world_size)
+    failed = []
+
+    def write_failed(e):
+        print(e, file=sys.stderr)
+        print("FAILED %s" % e.filename)
+        failed.append(e.filename)
+
+    with ImageWriter(options.writers) as writer:
+        for i, (lat, day, filename) in enumerate(targets):
+            try:
+                if options.world:
+                    img = render_world(ctx, world_instant(options, day), map_w, map_h)
+                elif not options.showDay:
+                    img = render_year(ctx, lat)
+                elif options.polar:
+                    img = render_day_polar(ctx, lat, day)
+                else:
+                    img = render_day_cartesian(ctx, lat, day)
+            except Exception:
+                traceback.print_exc()
+                print("FAILED %s" % filename)
+                failed.append(filename)
+                continue
+            while True:
+                try:
+                    writer.write(img, filename)
+                    break
+                except ImageWriteError as e:
+                    # an earlier frame's write failed; this one is not queued yet
+                    write_failed(e)
+            print("[%d/%d] %s" % (i + 1, len(targets), filename))
+        while True:
+            try:
+                writer.close()
+                break
+            except ImageWriteError as e:
+                write_failed(e)
+
+    if failed:
+        print("%d of %d frames failed:" % (len(failed), len(targets)))
+        for filename in failed:
+            print("  %s" % filename)
+    return failed
+
+
 def main_except(argv):
     parser = OptionParser()
 
@@ -936,11 +1632,54 @@ def main_except(argv):
     parser.add_option("--date", action="store", dest="date", default="",
                       help="In day-view, which day of year to view. Use format 'YYYY.MM.DD'. "
                            "Use -d/--day or --date but not both.")
+    parser.add_option("--world", action="store_true", dest="world", default=False,
+                      help="Show world-view, a map of day, twilight and night over the earth at one instant")
+    parser.add_option("--utc", action="store", type="string", dest="utc", default="12:00",
+                      help="In world-view, the UTC time of day in format 'HH:MM'. default=12:00")
+    parser.add_option("--world-size", action="store", type="string", dest="world_size", default="3600x1800",
+                      help="In world-view, the map size in pixels WIDTHxHEIGHT. default=3600x1800")
     # Output options
     parser.add_option("-f", "--filename", action="store", type="string", dest="filename",
                       help="When specified, write image to .png FILE", metavar="FILE", default=None)
     parser.add_option("--no-autoview", action="store_true", dest="noautoview", default=False,
                       help="Do not automatically spawn system image viewer for generated image")
+    # Model options
+    parser.add_option("--ephemeris", action="store", type="choice", dest="ephemeris",
+                      choices=list(EPH.EPHEMERIDES), default=EPH.DEFAULT_EPHEMERIS,
+                      help="Solar position model: %s. default=%s"
+                           % (", ".join(EPH.EPHEMERIDES), EPH.DEFAULT_EPHEMERIS))
+    parser.add_option("--chebyshev", action="store", type="string", dest="chebyshev", default=None, metavar="FILE",
+                      help="Use the chebyshev ephemeris with coefficients written by "
+                           "ephemeris.py --fit-chebyshev to .npz FILE")
+    parser.add_option("--chrome-cache", action="store", type="string", dest="chrome_cache", default=None,
+                      metavar="DIR",
+                      help="Keep the static titles, legends and grids of each view as images in DIR "
+                           "and reuse them in later runs")
+    # Data options
+    parser.add_option("--dump", action="store", type="string", dest="dump", default=None, metavar="FILE",
+                      help="Write the zenith/azimuth grid and display states behind the view to FILE. "
+                           "FILE ending in .npz is a compressed archive, .npy a memory-mappable "
+                           "structured array with a FILE.json sidecar, .csv text.")
+    parser.add_option("--load-dump", action="store", type="string", dest="load_dump", default=None,
+                      metavar="FILE",
+                      help="Render the view from the grid in a --dump FILE instead of computing it. "
+                           "The latitude and day come from FILE.")
+    # Batch options
+    parser.add_option("--o-lat-range", action="store", type="string", dest="o_lat_range", default=None,
+                      help="Render one image per observer latitude in range START:STOP[:STEP], "
+                           "for example -90:90:1", metavar="RANGE")
+    parser.add_option("--day-range", action="store", type="string", dest="day_range", default=None,
+                      help="In day-view, render one image per day in range FIRST:LAST[:STEP], "
+                           "for example 0:364", metavar="RANGE")
+    parser.add_option("--filename-template", action="store", type="string", dest="filename_template",
+                      default=None, metavar="TEMPLATE",
+                      help="In a batch, name image files with TEMPLATE using {lat}, {day} and {index}. "
+                           "For example 'twilight_year_{lat:03d}.png'")
+    parser.add_option("--first-index", action="store", type="int", dest="first_index", default=0,
+                      help="In a batch, the {index} of the first image. default=0")
+    parser.add_option("--writers", action="store", type="int", dest="writers", default=1,
+                      help="In a batch, threads that encode and write images while the next one renders. "
+                           "default=1")
 
     # version info
     parser.add_option("-v", "--version", action="store_true", dest="showversion", default=False,
@@ -953,13 +1692,51 @@ def main_except(argv):
         print("V%s" % TWILIGHT_VERSION)
         return
 
+    if options.world:
+        if options.showDay or options.polar:
+            raise Exception("The --world option is a view of its own and not valid with --show-day or --polar")
+        if options.o_lat_range is not None:
+            raise Exception("The --world view is not for one observer; --o-lat-range does not apply")
+        if options.dump is not None or options.load_dump is not None:
+            raise Exception("The --dump and --load-dump options do not apply to --world view")
+
+    if options.chrome_cache is not None and not check_problematic_filename(options.chrome_cache):
+        raise Exception("The --chrome-cache option is limited to alphanumeric characters "
+                        "with no directory traversals")
+
+    # batches and single views alike render with the saved coefficients
+    if options.chebyshev is not None:
+        if not check_problematic_filename(options.chebyshev):
+            raise Exception("The --chebyshev option is limited to alphanumeric characters "
+                            "with no directory traversals")
+        if options.ephemeris not in (EPH.DEFAULT_EPHEMERIS, EPH.ChebyshevEphemeris.name):
+            raise Exception("--chebyshev selects the chebyshev ephemeris, not '%s'" % options.ephemeris)
+        options.ephemeris = EPH.get_ephemeris(EPH.ChebyshevEphemeris.name, options.chebyshev).name
+
+    if options.o_lat_range is not None or options.day_range is not None:
+        if options.filename is not None:
+            raise Exception("Use --filename-template and not --filename with --o-lat-range or --day-range")
+        if options.dump is not None or options.load_dump is not None:
+            raise Exception("The --dump and --load-dump options render a single view, not a batch")
+        if not options.showDay and options.polar:
+            raise Exception("The --polar option is valid only in --show-day day view")
+        if options.writers < 1:
+            raise Exception("--writers must be at least 1")
+        return 1 if main_batch(options) else 0
+
     # If filename given then limit it to plain characters in CWD
     if options.filename is not None:
         if not check_problematic_filename(options.filename):
             raise Exception("The --file option is limited to alphanumeric characters with no directory traversals")
+    for dump_file in (options.dump, options.load_dump):
+        if dump_file is not None and not check_problematic_filename(dump_file):
+            raise Exception("The --dump and --load-dump options are limited to alphanumeric characters "
+                            "with no directory traversals")
 
     #
-    if options.showDay:
+    if options.world:
+        main_show_a_world(options)
+    elif options.showDay:
         if options.polar:
             main_show_a_day_polar(options)
         else:
@@ -972,8 +1749,7 @@ def main_except(argv):
 
 def main(argv):
     try:
-        main_except(argv)
-        return 0
+        return main_except(argv) or 0
     #    except ExitStatus, e:
     #        return e.status
     except Exception as e:
@@ -982,4 +1758,4 @@ def main(argv):
 
 
 if __name__ == "__main__":
-    main(sys.argv)
\ No newline at end of file
+    sys.exit(main(sys.argv))
\ No newline at end of file
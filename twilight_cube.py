@@ -0,0 +1,340 @@
+#!/usr/bin/python
+# twilight_cube - minutes of day/twilight/night for every latitude and day of a year
+#
+# The cube is a numpy array of minutes with shape (latitudes, days, categories).
+# The categories are day, civil, nautical and astronomical twilight, and night.
+# Each day holds 1440 one-minute samples so the five categories of a day sum to 1440.
+#
+# Computing the cube is the expensive part. Once it is saved as a .npz file
+# yearly totals, maxima, seasonal splits and monthly sums are numpy reductions
+# that return instantly.
+#
+# Example: compute the cube for 2019 on a 1 degree latitude grid and save it
+#
+# > python twilight_cube.py --year 2019 --lat-step 1.0 -f twilight-cube-2019.npz
+#
+
+from concurrent.futures import ProcessPoolExecutor
+from optparse import OptionParser
+import sys
+import traceback
+
+import numpy as np
+
+import SG_sunpos_ultimate_azi_atan2 as SG
+import ephemeris as EPH
+import shared_array as SA
+
+# Category order of the last cube axis
+CATEGORIES = ["Daylight", "Twilight-civil", "Twilight-nautical", "Twilight-astronomical", "Night"]
+DAY, CIVIL, NAUTICAL, ASTRONOMICAL, NIGHT = range(len(CATEGORIES))
+
+# Upper zenith angle of each category but the last. A sample at exactly
+# the limit belongs to the brighter category.
+ZENITH_LIMITS_DEG = [90.0, 96.0, 102.0, 108.0]
+
+# Days whose culmination zeniths fall within this many degrees of a limit
+# are counted minute by minute rather than trusted to the shortcut
+SHORTCUT_MARGIN_DEG = 1e-6
+
+MINUTES_PER_DAY = 24 * 60
+DAYS_PER_YEAR = 365
+
+# First day of each month in a non-leap year
+MONTH_START_DAYS = [0, 31, 59, 90, 120, 151, 181, 212, 243, 273, 304, 334, 365]
+
+
+def categorize_zeniths(zeniths, zenith_limits=ZENITH_LIMITS_DEG):
+    """
+    Map zenith angles in degrees to category indexes 0..4
+    """
+    return np.digitize(zeniths, zenith_limits, right=True)
+
+
+def categorize_cos_zeniths(cos_zeniths, zenith_limits=ZENITH_LIMITS_DEG):
+    """
+    categorize_zeniths given the cosines of the zenith angles, without an arccos.
+    The cosines of the limits decrease, and zenith <= limit exactly when cos(zenith) >= cos(limit).
+    """
+    return np.digitize(cos_zeniths, np.cos(np.radians(zenith_limits)), right=False)
+
+
+def minutes_per_category(categories):
+    """
+    Given category indexes shaped (days, minutes) return the
+    count of minutes per category shaped (days, 5).
+    """
+    counts = np.empty(categories.shape[:-1] + (len(CATEGORIES),), dtype=np.uint16)
+    for cat in range(len(CATEGORIES)):
+        counts[..., cat] = np.count_nonzero(categories == cat, axis=-1)
+    return counts
+
+
+def year_almanac(year, days=DAYS_PER_YEAR, ephemeris_name=EPH.DEFAULT_EPHEMERIS):
+    """
+    Solar declination and subsolar longitude for every minute of a year.
+    These do not depend on the observer so one table serves every latitude.
+    :return: sunlat, sunlon in degrees, each shaped (days, 1440)
+    """
+    return EPH.get_ephemeris(ephemeris_name).sun_position(EPH.year_minutes_j2000(year, days))
+
+
+def latitude_day_minutes(latitude, sunlat, sunlon, longitude=0.0, zenith_limits=ZENITH_LIMITS_DEG):
+    """
+    Count the minutes per category for one observer.
+    :param latitude: observer latitude in degrees, or an SG.Observer
+    :param sunlat: solar declinations shaped (days, minutes) from year_almanac
+    :param sunlon: subsolar longitudes shaped (days, minutes) from year_almanac
+    :param longitude: observer longitude in degrees. Not used with an SG.Observer
+    :param zenith_limits: upper zenith angle in degrees of day, civil, nautical and astronomical twilight
+    :return: numpy array of minutes shaped (days, 5)
+    """
+    observer = SG.as_observer(latitude, longitude)
+
+    # A day whose highest and lowest sun fall in one category is all that category.
+    # Near the poles that is most days, and they need no per-minute zenith angles.
+    zenith_min, zenith_max = SG.culmination_zeniths(observer.latitude, sunlat.min(axis=-1), sunlat.max(axis=-1))
+    first = categorize_zeniths(zenith_min - SHORTCUT_MARGIN_DEG, zenith_limits)
+    last = categorize_zeniths(zenith_max + SHORTCUT_MARGIN_DEG, zenith_limits)
+    uniform = first == last
+
+    minutes = np.zeros(sunlat.shape[:-1] + (len(CATEGORIES),), dtype=np.uint16)
+    minutes[uniform, first[uniform]] = sunlat.shape[-1]
+    mixed = ~uniform
+    if np.any(mixed):
+        cos_zeniths = SG.solar_cos_zenith_array(sunlat[mixed], sunlon[mixed], observer)
+        minutes[mixed] = minutes_per_category(categorize_cos_zeniths(cos_zeniths, zenith_limits))
+    return minutes
+
+
+def compute_cube(latitudes, year, longitude=0.0, days=DAYS_PER_YEAR, verbose=False,
+                 ephemeris_name=EPH.DEFAULT_EPHEMERIS, jobs=1, minutes_filename=None,
+                 zenith_limits=ZENITH_LIMITS_DEG):
+    """
+    Compute a TwilightCube for a list of latitudes.
+    :param latitudes: observer latitudes in degrees
+    :param year: calendar year
+    :param longitude: observer longitude in degrees
+    :param days: days in the year to compute
+    :param verbose: print progress per latitude
+    :param ephemeris_name: solar position model
+    :param jobs: number of worker processes. They share the almanac and write
+                 the minutes in place, see compute_cube_parallel.
+    :param minutes_filename: optional .npy file to hold the minutes. The cube's
+                 minutes are then a memory map of that file.
+    :param zenith_limits: upper zenith angle in degrees of day, civil, nautical and astronomical twilight
+    :return: TwilightCube
+    """
+    latitudes = np.asarray(latitudes, dtype=np.float64)
+    if jobs > 1:
+        return compute_cube_parallel(latitudes, year, longitude, days, verbose, ephemeris_name, jobs,
+                                     minutes_filename, zenith_limits)
+    sunlat, sunlon = year_almanac(year, days, ephemeris_name)
+    shape = (len(latitudes), days, len(CATEGORIES))
+    if minutes_filename is None:
+        minutes = np.empty(shape, dtype=np.uint16)
+    else:
+        minutes = SA.create_npy(minutes_filename, shape, np.uint16)
+    for i, latitude in enumerate(latitudes):
+        minutes[i] = latitude_day_minutes(SG.Observer(latitude, longitude), sunlat, sunlon,
+                                          zenith_limits=zenith_limits)
+        if verbose:
+            print("latitude %6.2f done" % latitude, file=sys.stderr)
+    return TwilightCube(latitudes, year, minutes, longitude, ephemeris_name)
+
+
+def compute_tile(sunlat_spec, sunlon_spec, minutes_spec, latitudes, first, longitude, zenith_limits):
+    """
+    Worker process task: fill the minutes of latitudes into rows first.. of the shared minutes array
+    """
+    sunlat, sunlat_handle = SA.attach(sunlat_spec)
+    sunlon, sunlon_handle = SA.attach(sunlon_spec)
+    minutes, minutes_handle = SA.attach(minutes_spec)
+    for i, latitude in enumerate(latitudes):
+        minutes[first + i] = latitude_day_minutes(SG.Observer(latitude, longitude), sunlat, sunlon,
+                                                  zenith_limits=zenith_limits)
+    if minutes_handle is None:
+        minutes.flush()
+    del sunlat, sunlon, minutes
+    for handle in (sunlat_handle, sunlon_handle, minutes_handle):
+        if handle is not None:
+            handle.close()
+    return latitudes
+
+
+def compute_cube_parallel(latitudes, year, longitude, days, verbose, ephemeris_name, jobs, minutes_filename,
+                          zenith_limits=ZENITH_LIMITS_DEG):
+    """
+    compute_cube with the latitudes split into tiles over jobs worker processes.
+    The almanac is computed once into shared memory that every worker reads.
+    The workers write their tiles of minutes in place, into shared memory or into
+    minutes_filename, so no result arrays are pickled back.
+    Shared memory is freed on return; its minutes are copied out into the cube once.
+    """
+    sunlat, sunlon = year_almanac(year, days, ephemeris_name)
+    shape = (len(latitudes), days, len(CATEGORIES))
+    tiles = np.array_split(np.arange(len(latitudes)), min(len(latitudes), jobs * 4))
+    with SA.SharedArray(sunlat.shape, sunlat.dtype) as shared_sunlat, \
+            SA.SharedArray(sunlon.shape, sunlon.dtype) as shared_sunlon:
+        shared_sunlat.array[:] = sunlat
+        shared_sunlon.array[:] = sunlon
+        del sunlat, sunlon
+        if minutes_filename is None:
+            shared_minutes = SA.SharedArray(shape, np.uint16)
+            minutes_spec = shared_minutes.spec()
+        else:
+            SA.create_npy(minutes_filename, shape, np.uint16).flush()
+            minutes_spec = SA.npy_spec(minutes_filename)
+        try:
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                futures = [pool.submit(compute_tile, shared_sunlat.spec(), shared_sunlon.spec(), minutes_spec,
+                                       latitudes[tile], int(tile[0]), longitude, zenith_limits)
+                           for tile in tiles if len(tile)]
+                for future in futures:
+                    for latitude in future.result():
+                        if verbose:
+                            print("latitude %6.2f done" % latitude, file=sys.stderr)
+            if minutes_filename is None:
+                minutes = shared_minutes.array.copy()
+            else:
+                minutes = np.load(minutes_filename, mmap_mode="r+")
+        finally:
+            if minutes_filename is None:
+                shared_minutes.close()
+    return TwilightCube(latitudes, year, minutes, longitude, ephemeris_name)
+
+
+def twilight_minutes(minutes):
+    """
+    Given minutes with categories on the last axis return total twilight minutes
+    """
+    return minutes[..., CIVIL] + minutes[..., NAUTICAL] + minutes[..., ASTRONOMICAL]
+
+
+def latitude_range(lat_start, lat_stop, lat_step):
+    """
+    Inclusive range of latitudes from lat_start to lat_stop
+    """
+    count = int(round((lat_stop - lat_start) / lat_step)) + 1
+    return lat_start + lat_step * np.arange(count)
+
+
+class TwilightCube:
+    """
+    Minutes of day, civil, nautical and astronomical twilight, and night
+    for each latitude and day of one year.
+    """
+    def __init__(self, latitudes, year, minutes, longitude=0.0, ephemeris_name=EPH.DEFAULT_EPHEMERIS):
+        self.latitudes = np.asarray(latitudes, dtype=np.float64)
+        self.year = year
+        self.longitude = longitude
+        self.minutes = minutes
+        self.ephemeris_name = ephemeris_name
+
+    def save(self, filename):
+        np.savez_compressed(filename,
+                            latitudes=self.latitudes,
+                            year=self.year,
+                            longitude=self.longitude,
+                            minutes=self.minutes,
+                            ephemeris=self.ephemeris_name,
+                            categories=np.array(CATEGORIES))
+
+    @staticmethod
+    def load(filename):
+        with np.load(filename) as npz:
+            ephemeris_name = str(npz["ephemeris"]) if "ephemeris" in npz else EPH.DEFAULT_EPHEMERIS
+            return TwilightCube(npz["latitudes"], int(npz["year"]), npz["minutes"], float(npz["longitude"]),
+                                ephemeris_name)
+
+    def latitude_index(self, latitude):
+        """
+        Index of the cube latitude nearest to the given latitude
+        """
+        return int(np.argmin(np.abs(self.latitudes - latitude)))
+
+    def totals(self, first_day=0, last_day=None):
+        """
+        Minutes per latitude and category summed over days first_day..last_day inclusive.
+        :return: numpy array shaped (latitudes, 5)
+        """
+        if last_day is None:
+            last_day = self.minutes.shape[1] - 1
+        return self.minutes[:, first_day:last_day + 1, :].sum(axis=1, dtype=np.int64)
+
+    def monthly_totals(self):
+        """
+        Minutes per latitude, month and category.
+        :return: numpy array shaped (latitudes, 12, 5)
+        """
+        return np.add.reduceat(self.minutes, MONTH_START_DAYS[:-1], axis=1, dtype=np.int64)
+
+    def yearly_report_rows(self):
+        """
+        Yield (latitude, day, twilight, night, civil, nautical, astronomical) per latitude
+        """
+        totals = self.totals()
+        twilight = twilight_minutes(totals)
+        for i, latitude in enumerate(self.latitudes):
+            yield (latitude, totals[i, DAY], twilight[i], totals[i, NIGHT],
+                   totals[i, CIVIL], totals[i, NAUTICAL], totals[i, ASTRONOMICAL])
+
+    def extremes(self, values, largest=True):
+        """
+        Latitude and value of the first maximum (or minimum) of a per-latitude array
+        """
+        i = int(np.argmax(values)) if largest else int(np.argmin(values))
+        return self.latitudes[i], values[i]
+
+
+def main_except(argv):
+    parser = OptionParser()
+
+    parser.add_option("--year", action="store", type="int", dest="year", default=2019,
+                      help="Calendar year to compute. default=2019")
+    parser.add_option("--lat-start", action="store", type="float", dest="lat_start", default=-90.0,
+                      help="First latitude in degrees. default=-90.0")
+    parser.add_option("--lat-stop", action="store", type="float", dest="lat_stop", default=90.0,
+                      help="Last latitude in degrees. default=90.0")
+    parser.add_option("--lat-step", action="store", type="float", dest="lat_step", default=1.0,
+                      help="Latitude step in degrees. default=1.0")
+    parser.add_option("--ephemeris", action="store", type="choice", dest="ephemeris",
+                      choices=list(EPH.EPHEMERIDES), default=EPH.DEFAULT_EPHEMERIS,
+                      help="Solar position model: %s. default=%s"
+                           % (", ".join(EPH.EPHEMERIDES), EPH.DEFAULT_EPHEMERIS))
+    parser.add_option("--chebyshev", action="store", type="string", dest="chebyshev", default=None, metavar="FILE",
+                      help="Use the chebyshev ephemeris with coefficients written by "
+                           "ephemeris.py --fit-chebyshev to .npz FILE")
+    parser.add_option("-f", "--filename", action="store", type="string", dest="filename",
+                      help="Write the cube to .npz FILE", metavar="FILE", default=None)
+    parser.add_option("-j", "--jobs", action="store", type="int", dest="jobs", default=1,
+                      help="Number of worker processes. default=1")
+    parser.add_option("-q", "--quiet", action="store_true", dest="quiet", default=False,
+                      help="Do not print progress per latitude")
+
+    (options, args) = parser.parse_args(argv[1:])
+
+    if options.filename is None:
+        raise Exception("Specify an output .npz file with -f/--filename")
+    if options.chebyshev is not None:
+        if options.ephemeris not in (EPH.DEFAULT_EPHEMERIS, EPH.ChebyshevEphemeris.name):
+            raise Exception("--chebyshev selects the chebyshev ephemeris, not '%s'" % options.ephemeris)
+        options.ephemeris = EPH.get_ephemeris(EPH.ChebyshevEphemeris.name, options.chebyshev).name
+
+    latitudes = latitude_range(options.lat_start, options.lat_stop, options.lat_step)
+    cube = compute_cube(latitudes, options.year, verbose=not options.quiet, ephemeris_name=options.ephemeris,
+                        jobs=options.jobs)
+    cube.save(options.filename)
+
+
+def main(argv):
+    try:
+        main_except(argv)
+        return 0
+    except Exception as e:
+        traceback.print_exc()
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,350 @@
+#!/usr/bin/python
+# twilight_events - dawn, sunrise, solar noon, sunset and dusk times for each day
+#
+# For one observer and a range of days of a year this finds the UTC times of
+#   astronomical, nautical and civil dawn, sunrise, solar noon,
+#   sunset, and civil, nautical and astronomical dusk.
+# The zenith angles are those of the views: 108, 102, 96 and 90 degrees.
+#
+# Rather than scanning the 1440 minutes of each day the times are solved for
+# directly. The sun crosses zenith angle Z at the hour angle H0 where
+#   cos(Z) = sin(lat) sin(dec) + cos(lat) cos(dec) cos(H0)
+# Declination and equation of time are evaluated at the estimated crossing,
+# H0 recomputed and the time updated until it moves less than a millisecond.
+# Each event starts from the same day's solar noon and all days are solved
+# at once as numpy arrays. A year of events for one site takes milliseconds.
+#
+# Days on which the sun stays above or below a zenith angle have no crossing.
+# They are flagged as sun up or sun down for that zenith angle.
+# Within a fraction of a degree of the poles the sun circles almost level and
+# crosses a zenith angle only as the declination changes during the day.
+# Those few crossings are not timed; the day is flagged by the declination.
+#
+# On the day the sun starts or stops crossing there may be only one crossing.
+# The missing event is given as the state the other leaves the sun in: after a
+# rise with no set it is up, after a set with no rise it is down. It is taken
+# from the zenith angle 12 hours after noon, which near the poles is right even
+# when the sun wobbles across the angle more than once that day.
+#
+# Example: events at 42.6 degrees north for March 2019
+#
+# > python twilight_events.py -o 42.6 --year 2019 --first-day 59 --last-day 89
+#
+# Check the up and down of one-crossing days against the sun's zenith angle:
+#
+# > python twilight_events.py --check
+#
+
+import datetime
+from optparse import OptionParser
+import sys
+import traceback
+
+import numpy as np
+
+import SG_sunpos_ultimate_azi_atan2 as SG
+import ephemeris as EPH
+
+EVENTS = ["Astronomical dawn", "Nautical dawn", "Civil dawn", "Sunrise", "Noon",
+          "Sunset", "Civil dusk", "Nautical dusk", "Astronomical dusk"]
+NOON = EVENTS.index("Noon")
+
+# Zenith angle of each crossing. Dawn event i pairs with dusk event len(EVENTS) - 1 - i.
+EVENT_ZENITHS_DEG = [108.0, 102.0, 96.0, 90.0]
+
+# Per day and zenith angle flags
+CROSSES = 0
+SUN_UP_ALL_DAY = 1
+SUN_DOWN_ALL_DAY = -1
+# only one of dawn and dusk, after which the sun stays up or down
+SUN_UP_AFTER_CROSSING = 2
+SUN_DOWN_AFTER_CROSSING = -2
+
+# The declination range of a day is taken from its two midnights. Near a
+# solstice the declination peaks between them by far less than this.
+DECLINATION_MARGIN_DEG = 0.01
+
+MAX_ITERATIONS = 20
+TOLERANCE_HOURS = 1.0 / 3600000  # one millisecond
+
+# Latitudes with one-crossing days for --check. Every minute of the last
+# CHECK_HOURS of a one-crossing day that is after its crossing must have the
+# sun on the side it is given.
+CHECK_LATITUDES = [89.9, 80.0, 72.0, 66.5, 60.0, -60.0, -66.5, -72.0, -80.0, -89.9]
+CHECK_HOURS = 0.5
+
+
+def cos_hour_angle(delta, cos_zenith, observer):
+    """
+    Cosine of the hour angle at which the sun is at a given zenith angle.
+    Above 1 the sun never gets that high, below -1 it never gets that low.
+    :param delta: solar declination in degrees
+    :param cos_zenith: cosine of the zenith angle
+    :param observer: SG.Observer
+    """
+    PHIs = np.radians(delta)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (cos_zenith - observer.sin_lat * np.sin(PHIs)) / (observer.cos_lat * np.cos(PHIs))
+
+
+def solve_crossing(ephemeris, n0, observer, cos_zenith, side, hours):
+    """
+    Iterate the UTC hour of one crossing on every day.
+    Each day stops iterating once its time moves less than TOLERANCE_HOURS.
+    :param ephemeris: Ephemeris backend
+    :param n0: J2000.0 day numbers of midnight UTC of each day
+    :param observer: SG.Observer, one for all days or arrays of one per day
+    :param cos_zenith: cosine of the zenith angle, not used for noon
+    :param side: -1 for dawn, +1 for dusk, 0 for solar noon
+    :param hours: starting estimates in hours from midnight UTC
+    :return: hours, and cosine of the hour angle at the result (None for noon)
+    """
+    hours = np.array(hours, dtype=np.float64)
+    c = None if side == 0 else np.empty_like(hours)
+    active = np.arange(len(hours))
+    for i in range(MAX_ITERATIONS):
+        active_observer = observer.take(active)
+        delta, esd, eot = ephemeris.almanac(n0[active] + hours[active] / 24.0)
+        if side == 0:
+            hour_angle = 0.0
+        else:
+            c_active = cos_hour_angle(delta, cos_zenith, active_observer)
+            c[active] = c_active
+            hour_angle = side * np.degrees(np.arccos(np.clip(np.nan_to_num(c_active), -1.0, 1.0)))
+        # sunlon = -15 (hour - 12 + eot / 15) and the hour angle is longitude - sunlon
+        new_hours = 12.0 + (hour_angle - active_observer.longitude - eot) / 15.0
+        moved = np.abs(new_hours - hours[active])
+        hours[active] = new_hours
+        active = active[moved >= TOLERANCE_HOURS]
+        if len(active) == 0:
+            break
+    return hours, c
+
+
+def find_events(latitude, longitude=0.0, year=2019, first_day=0, last_day=364,
+                ephemeris_name=EPH.DEFAULT_EPHEMERIS):
+    """
+    Find the dawn, sunrise, noon, sunset and dusk times of days first_day..last_day of year.
+    :param latitude: observer latitude in degrees, or an SG.Observer
+    :param longitude: observer longitude in degrees. Not used with an SG.Observer
+    :param year: calendar year
+    :param first_day: first day of year, 0 is January 1
+    :param last_day: last day of year, inclusive
+    :param ephemeris_name: solar position model
+    :return: EventTable
+    """
+    observer = SG.as_observer(latitude, longitude)
+    ephemeris = EPH.get_ephemeris(ephemeris_name)
+    days = np.arange(first_day, last_day + 1)
+    n0 = SG.days_since_j2000(datetime.datetime(year, 1, 1)) + days.astype(np.float64)
+    dec_min, dec_max = declination_ranges(ephemeris, n0)
+    hours, flags = solve_events(ephemeris, n0, observer, dec_min, dec_max)
+    return EventTable(observer.latitude, observer.longitude, year, days, hours, flags)
+
+
+def declination_ranges(ephemeris, n0):
+    """
+    Least and greatest declination of each day from its two midnights, widened by DECLINATION_MARGIN_DEG
+    :param n0: J2000.0 day numbers of midnight UTC of consecutive days
+    """
+    dec_midnight = ephemeris.almanac(np.append(n0, n0[-1] + 1.0))[0]
+    return (np.minimum(dec_midnight[:-1], dec_midnight[1:]) - DECLINATION_MARGIN_DEG,
+            np.maximum(dec_midnight[:-1], dec_midnight[1:]) + DECLINATION_MARGIN_DEG)
+
+
+def solve_events(ephemeris, n0, observer, dec_min, dec_max):
+    """
+    Solve the events of a series of observer days.
+    :param ephemeris: Ephemeris backend
+    :param n0: J2000.0 day numbers of midnight UTC of each day
+    :param observer: SG.Observer, one for all days or arrays of one per day
+    :param dec_min: least declination of each day in degrees
+    :param dec_max: greatest declination of each day in degrees
+    :return: hours shaped (days, 9) and flags shaped (days, 4) as in EventTable
+    """
+    hours = np.full((len(n0), len(EVENTS)), np.nan)
+    flags = np.zeros((len(n0), len(EVENT_ZENITHS_DEG)), dtype=np.int8)
+
+    noon, c = solve_crossing(ephemeris, n0, observer, None, 0, np.full(len(n0), 12.0))
+    hours[:, NOON] = noon
+
+    # Zenith angles outside the day's culmination zeniths are not crossed and need no solving
+    zenith_min, zenith_max = SG.culmination_zeniths(observer.latitude, dec_min, dec_max)
+
+    for i, zenith in enumerate(EVENT_ZENITHS_DEG):
+        flags[zenith_min > zenith, i] = SUN_DOWN_ALL_DAY
+        flags[zenith_max < zenith, i] = SUN_UP_ALL_DAY
+        todo = np.flatnonzero(flags[:, i] == CROSSES)
+        if len(todo) == 0:
+            continue
+        cos_zenith = np.cos(np.radians(zenith))
+        crosses = np.zeros(len(todo), dtype=bool)
+        for side, event in ((-1, i), (1, len(EVENTS) - 1 - i)):
+            crossing, c = solve_crossing(ephemeris, n0[todo], observer.take(todo), cos_zenith, side, noon[todo])
+            hours[todo, event] = np.where(np.abs(c) <= 1.0, crossing, np.nan)
+            crosses |= np.abs(c) <= 1.0
+        # c above 1: the sun never climbs to the zenith angle, below -1: never sinks to it.
+        flags[todo, i] = np.where(crosses, CROSSES, np.where(c > 1.0, SUN_DOWN_ALL_DAY, SUN_UP_ALL_DAY))
+        # On the day the sun starts or stops crossing there may be a dawn without a dusk or the reverse.
+        # The sun's side of the zenith angle at the end of the day says which.
+        one = todo[crosses & (np.isnan(hours[todo, i]) != np.isnan(hours[todo, len(EVENTS) - 1 - i]))]
+        if len(one):
+            zenith_end = ephemeris.solar_geometry(n0[one] + (noon[one] + 12.0) / 24.0, observer.take(one))[0]
+            flags[one, i] = np.where(zenith_end < zenith, SUN_UP_AFTER_CROSSING, SUN_DOWN_AFTER_CROSSING)
+    return hours, flags
+
+
+class EventTable:
+    """
+    Event times of a range of days for one observer.
+    hours is shaped (days, 9) in EVENTS order: float hours from 00:00 UTC of each day,
+    NaN where the sun does not cross. Far from the prime meridian a time may fall
+    below 0 or above 24, on the UTC day before or after.
+    flags is shaped (days, 4) in EVENT_ZENITHS_DEG order: CROSSES, SUN_UP_ALL_DAY or SUN_DOWN_ALL_DAY,
+    or SUN_UP_AFTER_CROSSING or SUN_DOWN_AFTER_CROSSING on a day with only one of dawn and dusk.
+    """
+    def __init__(self, latitude, longitude, year, days, hours, flags):
+        self.latitude = latitude
+        self.longitude = longitude
+        self.year = year
+        self.days = days
+        self.hours = hours
+        self.flags = flags
+
+    def date_of(self, day):
+        return datetime.date(self.year, 1, 1) + datetime.timedelta(days=int(day))
+
+    def event_hours(self, event):
+        """
+        Hours of one event by name for every day
+        """
+        return self.hours[:, EVENTS.index(event)]
+
+    def missing_state(self, row, event):
+        """
+        'up' or 'down' for an event the sun does not cross on the day in row.
+        On a day with one crossing of the event's zenith angle the sun stays
+        as that crossing leaves it: up after a rise and down after a set.
+        """
+        flag = self.flags[row, min(event, len(EVENTS) - 1 - event)]
+        return "up" if flag in (SUN_UP_ALL_DAY, SUN_UP_AFTER_CROSSING) else "down"
+
+    def one_crossing_days(self):
+        """
+        Yield (row, missing event, existing event) of each zenith angle crossed only once in a day
+        """
+        for row in range(len(self.days)):
+            for i in range(len(EVENT_ZENITHS_DEG)):
+                dawn, dusk = i, len(EVENTS) - 1 - i
+                if np.isnan(self.hours[row, dawn]) != np.isnan(self.hours[row, dusk]):
+                    yield (row, dawn, dusk) if np.isnan(self.hours[row, dawn]) else (row, dusk, dawn)
+
+    def csv_rows(self):
+        """
+        Yield CSV lines: day, date, then each event as HH:MM:SS UTC,
+        'up' or 'down' when the sun does not cross, see missing_state
+        """
+        yield "Day, Date, " + ", ".join(EVENTS)
+        for row, day in enumerate(self.days):
+            fields = ["%d" % day, self.date_of(day).isoformat()]
+            for event, hours in enumerate(self.hours[row]):
+                if np.isnan(hours):
+                    fields.append(self.missing_state(row, event))
+                else:
+                    fields.append(format_hours(hours))
+            yield ", ".join(fields)
+
+
+def check_one_crossing_days(year=2019, latitudes=CHECK_LATITUDES, ephemeris_name=EPH.DEFAULT_EPHEMERIS):
+    """
+    On every day with one crossing of a zenith angle, sample the sun's zenith angle each minute
+    of the last CHECK_HOURS before noon + 12 h that is after the crossing, and compare it
+    with the missing event's up or down.
+    :return: list of (latitude, day, missing event, state, samples on the wrong side)
+    """
+    ephemeris = EPH.get_ephemeris(ephemeris_name)
+    results = []
+    for latitude in latitudes:
+        table = find_events(latitude, 0.0, year, 0, 364, ephemeris_name)
+        n0 = SG.days_since_j2000(datetime.datetime(year, 1, 1)) + table.days.astype(np.float64)
+        for row, missing, existing in table.one_crossing_days():
+            end = table.hours[row, NOON] + 12.0
+            hours = end - np.arange(int(CHECK_HOURS * 60)) / 60.0
+            hours = hours[hours > table.hours[row, existing]]
+            zenith = ephemeris.solar_geometry(n0[row] + hours / 24.0, latitude, 0.0)[0]
+            limit = EVENT_ZENITHS_DEG[min(missing, len(EVENTS) - 1 - missing)]
+            state = table.missing_state(row, missing)
+            wrong = np.count_nonzero(zenith > limit) if state == "up" else np.count_nonzero(zenith < limit)
+            results.append((latitude, int(table.days[row]), EVENTS[missing], state, int(wrong)))
+    return results
+
+
+def format_hours(hours):
+    seconds = int(round(hours * 3600))
+    sign = "-" if seconds < 0 else ""
+    seconds = abs(seconds)
+    return "%s%02d:%02d:%02d" % (sign, seconds // 3600, (seconds // 60) % 60, seconds % 60)
+
+
+def main_except(argv):
+    parser = OptionParser()
+
+    parser.add_option("-o", "--o-lat", action="store", type="float", dest="o_lat", default=42.6,
+                      help="Observer latitude in degrees north. default=42.6")
+    parser.add_option("--o-lon", action="store", type="float", dest="o_lon", default=0.0,
+                      help="Observer longitude in degrees east. default=0.0")
+    parser.add_option("--year", action="store", type="int", dest="year", default=2019,
+                      help="Calendar year. default=2019")
+    parser.add_option("--first-day", action="store", type="int", dest="first_day", default=0,
+                      help="First day of year, 0 is January 1. default=0")
+    parser.add_option("--last-day", action="store", type="int", dest="last_day", default=364,
+                      help="Last day of year. default=364")
+    parser.add_option("--ephemeris", action="store", type="choice", dest="ephemeris",
+                      choices=list(EPH.EPHEMERIDES), default=EPH.DEFAULT_EPHEMERIS,
+                      help="Solar position model: %s. default=%s"
+                           % (", ".join(EPH.EPHEMERIDES), EPH.DEFAULT_EPHEMERIS))
+    parser.add_option("-f", "--filename", action="store", type="string", dest="filename", default=None,
+                      help="Write the CSV to FILE instead of the console", metavar="FILE")
+    parser.add_option("--check", action="store_true", dest="check", default=False,
+                      help="Check the up and down of one-crossing days at the CHECK_LATITUDES "
+                           "against the sun's zenith angle")
+
+    (options, args) = parser.parse_args(argv[1:])
+
+    if options.check:
+        results = check_one_crossing_days(options.year, ephemeris_name=options.ephemeris)
+        print("Latitude, Day, Missing event, State, Wrong samples")
+        for latitude, day, event, state, wrong in results:
+            print("%g, %d, %s, %s, %d%s" % (latitude, day, event, state, wrong, "  FAIL" if wrong else ""))
+        failures = sum(1 for result in results if result[-1])
+        if failures:
+            raise Exception("%d of %d one-crossing days have the sun on the wrong side" % (failures, len(results)))
+        return
+
+    if not -90.0 <= options.o_lat <= 90.0:
+        raise Exception("Observer latitude must be in -90..90")
+    if not 0 <= options.first_day <= options.last_day:
+        raise Exception("Days must satisfy 0 <= --first-day <= --last-day")
+
+    table = find_events(options.o_lat, options.o_lon, options.year, options.first_day, options.last_day,
+                        options.ephemeris)
+    out = sys.stdout if options.filename is None else open(options.filename, "w")
+    try:
+        for line in table.csv_rows():
+            print(line, file=out)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+def main(argv):
+    try:
+        main_except(argv)
+        return 0
+    except Exception as e:
+        traceback.print_exc()
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,247 @@
+#!/usr/bin/python
+# twilight_index - precomputed event times and durations for instant lookups
+#
+# "When does civil dusk end at 42.6 degrees on day 69?" takes thousands of solar
+# geometry evaluations to answer from scratch. The index answers it from a table
+# built once: for every latitude on a fine grid and every day of a year it holds
+# the nine event times of twilight_events.py and the minutes of each
+# twilight_cube.py category. A query reads the two latitude rows around the
+# asked latitude and interpolates between them.
+#
+# The table is a float32 .npy file, shaped (latitudes, days, 14), that queries
+# memory-map: a query touches two rows and the file is never read whole.
+# Its metadata, including the measured interpolation error, goes to a .json sidecar.
+#
+# The error bound is measured when the index is built. Every latitude halfway
+# between two rows, where linear interpolation is least accurate, is solved
+# exactly and compared with the interpolated values. Near the latitudes where
+# the sun starts or stops crossing a zenith angle the times change steeply with
+# latitude and the error grows, so the bound is also given for |latitude| <= 60.
+#
+# The table is for observers on the prime meridian. A query at another longitude
+# shifts the times by longitude / 15 hours; the declination and equation of time
+# at the shifted times differ by well under a minute of event time.
+#
+# Example: build a 0.1 degree index of 2019, then look up a day
+#
+# > python twilight_index.py --build --year 2019 --lat-step 0.1 -f twilight-index-2019.npy
+# > python twilight_index.py -f twilight-index-2019.npy --query 42.6,69
+#
+
+import json
+from optparse import OptionParser
+import sys
+import time
+import traceback
+
+import numpy as np
+
+import ephemeris as EPH
+import site_batch as SB
+import twilight_cube as TC
+import twilight_events as TE
+
+# Last axis: the event hours in TE.EVENTS order, then minutes in TC.CATEGORIES order
+COLUMNS = TE.EVENTS + TC.CATEGORIES
+MINUTES_COLUMN = len(TE.EVENTS)
+
+# Latitudes where the error bound is also stated on its own
+TEMPERATE_LATITUDE = 60.0
+
+
+def build_table(latitudes, year, ephemeris_name):
+    """
+    Event hours and category minutes shaped (latitudes, days, 14) for observers on the prime meridian
+    """
+    events = SB.find_site_events(latitudes, 0.0, year, 0, TC.DAYS_PER_YEAR - 1, ephemeris_name)
+    return np.concatenate((events.hours, events.minutes_per_category()), axis=-1).astype(np.float32)
+
+
+class TwilightIndex:
+    """
+    Event times and category minutes over a latitude x day grid, interpolated in latitude.
+    """
+    def __init__(self, table, meta):
+        self.table = table
+        self.meta = meta
+        self.lat_first = meta["lat_first"]
+        self.lat_step = meta["lat_step"]
+
+    @staticmethod
+    def build(year=2019, lat_step=0.1, ephemeris_name=EPH.DEFAULT_EPHEMERIS):
+        """
+        Compute the index and measure its interpolation error
+        """
+        count = int(round(180.0 / lat_step)) + 1
+        latitudes = np.linspace(-90.0, 90.0, count)
+        table = build_table(latitudes, year, ephemeris_name)
+        meta = {"year": year, "ephemeris": ephemeris_name, "lat_first": -90.0, "lat_step": 180.0 / (count - 1),
+                "lat_count": count, "days": TC.DAYS_PER_YEAR, "columns": COLUMNS,
+                "time_unit": "hours from 00:00 UTC", "duration_unit": "minutes"}
+        index = TwilightIndex(table, meta)
+        index.meta["error"] = index.measure_error()
+        return index
+
+    def measure_error(self):
+        """
+        Largest differences between interpolated and exact values at the latitudes halfway between rows
+        """
+        middles = self.lat_first + (np.arange(self.meta["lat_count"] - 1) + 0.5) * self.lat_step
+        exact = build_table(middles, self.meta["year"], self.meta["ephemeris"])
+        interpolated = self.lookup(middles[:, None], np.arange(self.meta["days"])[None, :])
+        difference = np.abs(interpolated - exact)
+        # a crossing in only one of the two, appearing or disappearing between the rows
+        unmatched = np.isnan(interpolated) != np.isnan(exact)
+        temperate = np.abs(middles) <= TEMPERATE_LATITUDE
+
+        def bounds(rows, columns, scale):
+            # the unmatched crossings are counted separately
+            d = difference[rows, :, columns]
+            finite = d[np.isfinite(d)] * scale
+            return {"max": float(finite.max()) if finite.size else 0.0,
+                    "p99.9": float(np.percentile(finite, 99.9)) if finite.size else 0.0,
+                    "unmatched": int(np.count_nonzero(unmatched[rows, :, columns]))}
+
+        everywhere = slice(None)
+        times, minutes = slice(None, MINUTES_COLUMN), slice(MINUTES_COLUMN, None)
+        return {"time_seconds": bounds(everywhere, times, 3600.0),
+                "time_seconds_temperate": bounds(temperate, times, 3600.0),
+                "duration_minutes": bounds(everywhere, minutes, 1.0),
+                "duration_minutes_temperate": bounds(temperate, minutes, 1.0)}
+
+    def save(self, filename):
+        """
+        Write the table to filename, a .npy file, and the metadata to filename.json
+        """
+        if not filename.endswith(".npy"):
+            raise Exception("Index file '%s' must end in .npy" % filename)
+        np.save(filename, self.table)
+        with open(filename + ".json", "w") as f:
+            json.dump(self.meta, f, indent=1)
+
+    @staticmethod
+    def load(filename):
+        """
+        Memory-map an index written by save()
+        """
+        with open(filename + ".json", "r") as f:
+            meta = json.load(f)
+        return TwilightIndex(np.load(filename, mmap_mode="r"), meta)
+
+    def rows(self, latitude):
+        """
+        Lower row index and the weight of the row above it for latitudes in degrees
+        """
+        x = (np.clip(latitude, -90.0, 90.0) - self.lat_first) / self.lat_step
+        i = np.minimum(np.floor(x).astype(np.int64), self.meta["lat_count"] - 2)
+        return i, x - i
+
+    def lookup(self, latitude, day):
+        """
+        All 14 columns interpolated in latitude. latitude and day broadcast;
+        the result is shaped broadcast(latitude, day) + (14,).
+        Where a time exists in only one of the two rows the nearer row's value is taken,
+        so a crossing appears or disappears halfway between the rows.
+        """
+        i, w = self.rows(np.asarray(latitude, dtype=np.float64))
+        day = np.asarray(day, dtype=np.int64)
+        if np.any(day < 0) or np.any(day >= self.meta["days"]):
+            raise IndexError("Day must be in 0..%d" % (self.meta["days"] - 1))
+        below = np.asarray(self.table[i, day], dtype=np.float64)
+        above = np.asarray(self.table[i + 1, day], dtype=np.float64)
+        w = w[..., None]
+        value = below + (above - below) * w
+        nearer = np.where(w < 0.5, below, above)
+        return np.where(np.isnan(below) | np.isnan(above), nearer, value)
+
+    def event_hours(self, latitude, day, event, longitude=0.0):
+        """
+        UTC hours of one event by name, NaN when the sun does not cross that day
+        """
+        return self.lookup(latitude, day)[..., TE.EVENTS.index(event)] - np.asarray(longitude) / 15.0
+
+    def minutes(self, latitude, day, category):
+        """
+        Minutes of one twilight_cube category by name
+        """
+        return self.lookup(latitude, day)[..., MINUTES_COLUMN + TC.CATEGORIES.index(category)]
+
+    def query(self, latitude, day, column):
+        """
+        One value of one column by index for one latitude and day, without numpy overhead
+        """
+        x = (min(max(latitude, -90.0), 90.0) - self.lat_first) / self.lat_step
+        i = min(int(x), self.meta["lat_count"] - 2)
+        w = x - i
+        below = float(self.table[i, day, column])
+        above = float(self.table[i + 1, day, column])
+        if below != below or above != above:  # NaN
+            return below if w < 0.5 else above
+        return below + (above - below) * w
+
+
+def print_error(meta):
+    for name, bound in meta["error"].items():
+        print("%-27s max %9.3f  99.9%% %8.3f  crossings unmatched %d"
+              % (name, bound["max"], bound["p99.9"], bound["unmatched"]))
+
+
+def main_except(argv):
+    parser = OptionParser()
+
+    parser.add_option("-f", "--filename", action="store", type="string", dest="filename", default=None,
+                      help="Index .npy file. Metadata is in FILE.json", metavar="FILE")
+    parser.add_option("--build", action="store_true", dest="build", default=False,
+                      help="Build the index and write it to FILE")
+    parser.add_option("--year", action="store", type="int", dest="year", default=2019,
+                      help="Calendar year of a new index. default=2019")
+    parser.add_option("--lat-step", action="store", type="float", dest="lat_step", default=0.1,
+                      help="Latitude step of a new index in degrees. default=0.1")
+    parser.add_option("--ephemeris", action="store", type="choice", dest="ephemeris",
+                      choices=list(EPH.EPHEMERIDES), default=EPH.DEFAULT_EPHEMERIS,
+                      help="Solar position model: %s. default=%s"
+                           % (", ".join(EPH.EPHEMERIDES), EPH.DEFAULT_EPHEMERIS))
+    parser.add_option("--query", action="store", type="string", dest="query", default=None,
+                      help="Print the events and minutes at LAT,DAY", metavar="LAT,DAY")
+    parser.add_option("--o-lon", action="store", type="float", dest="o_lon", default=0.0,
+                      help="Observer longitude of --query in degrees east. default=0.0")
+
+    (options, args) = parser.parse_args(argv[1:])
+
+    if options.filename is None:
+        raise Exception("Specify the index file with -f/--filename")
+    if options.build:
+        if not 0.0 < options.lat_step <= 10.0:
+            raise Exception("--lat-step must be in 0..10")
+        start = time.perf_counter()
+        index = TwilightIndex.build(options.year, options.lat_step, options.ephemeris)
+        index.save(options.filename)
+        print("Built %d latitudes x %d days in %.1f s, %d bytes. Interpolation error:"
+              % (index.meta["lat_count"], index.meta["days"], time.perf_counter() - start, index.table.nbytes))
+        print_error(index.meta)
+    else:
+        index = TwilightIndex.load(options.filename)
+        if options.query is None:
+            print_error(index.meta)
+    if options.query is not None:
+        lat, day = options.query.split(",")
+        lat, day = float(lat), int(day)
+        values = index.lookup(lat, day)
+        for event in TE.EVENTS:
+            hours = values[TE.EVENTS.index(event)] - options.o_lon / 15.0
+            print("%-22s %s" % (event, "-" if np.isnan(hours) else TE.format_hours(hours)))
+        for k, category in enumerate(TC.CATEGORIES):
+            print("%-22s %.1f minutes" % (category, values[MINUTES_COLUMN + k]))
+
+
+def main(argv):
+    try:
+        main_except(argv)
+        return 0
+    except Exception as e:
+        traceback.print_exc()
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,199 @@
+#!/usr/bin/python
+# twilight_rle - run-length encoded display states of a year
+#
+# A year view is 365 rows of 1440 display states, one per minute, but a row
+# changes state only 10 to 30 times. RunLengthYear keeps, per day, only the
+# minute at which each run of one state begins and that state. A year at
+# one latitude then takes tens of kilobytes instead of half a megabyte of
+# states or several megabytes of zenith angles, so thousands of
+# latitude-years fit in memory.
+#
+# The runs rasterize to any width, count minutes per state without expanding
+# and serialize to a few kilobytes.
+#
+# Example: encode the year view at 42.6 degrees and print its size
+#
+# > python twilight_rle.py -o 42.6
+#
+
+import json
+from optparse import OptionParser
+import struct
+import sys
+import traceback
+import zlib
+
+import numpy as np
+
+MAGIC = b"SLRL"
+HEADER = struct.Struct("<4sHHHII")  # magic, version, days, samples per day, interval minutes, runs
+VERSION = 1
+
+
+class RunLengthYear:
+    """
+    Runs of display states for days x samples.
+    Day d's runs are starts[offsets[d]:offsets[d + 1]] and codes[offsets[d]:offsets[d + 1]]:
+    the sample at which each run begins and its state. Each day's first run starts at sample 0.
+    """
+    def __init__(self, offsets, starts, codes, samples, interval_minutes=1, state_codes=None):
+        """
+        :param offsets: index of each day's first run, and the total number of runs, shaped (days + 1,)
+        :param starts: first sample of each run
+        :param codes: state of each run
+        :param samples: samples per day
+        :param interval_minutes: minutes between samples
+        :param state_codes: optional names of the states, indexed by code
+        """
+        self.offsets = offsets
+        self.starts = starts
+        self.codes = codes
+        self.samples = samples
+        self.interval_minutes = interval_minutes
+        self.state_codes = state_codes
+
+    @staticmethod
+    def from_states(states, interval_minutes=1, state_codes=None):
+        """
+        Encode a dense array of small non-negative state codes shaped (days, samples)
+        """
+        states = np.asarray(states)
+        days, samples = states.shape
+        if samples > np.iinfo(np.uint16).max:
+            raise Exception("At most %d samples per day can be run-length encoded" % np.iinfo(np.uint16).max)
+        begins = np.ones(states.shape, dtype=bool)
+        begins[:, 1:] = states[:, 1:] != states[:, :-1]
+        day_of_run, starts = np.nonzero(begins)
+        offsets = np.zeros(days + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.count_nonzero(begins, axis=1))
+        return RunLengthYear(offsets, starts.astype(np.uint16), states[day_of_run, starts].astype(np.uint8),
+                             samples, interval_minutes, state_codes)
+
+    @property
+    def days(self):
+        return len(self.offsets) - 1
+
+    @property
+    def nbytes(self):
+        """
+        Bytes held by the run arrays
+        """
+        return self.offsets.nbytes + self.starts.nbytes + self.codes.nbytes
+
+    def day(self, day):
+        """
+        Return (starts, codes) of one day's runs
+        """
+        first, last = self.offsets[day], self.offsets[day + 1]
+        return self.starts[first:last], self.codes[first:last]
+
+    def run_days(self):
+        """
+        Day of each run
+        """
+        return np.repeat(np.arange(self.days), np.diff(self.offsets))
+
+    def run_lengths(self):
+        """
+        Samples in each run
+        """
+        ends = np.empty(len(self.starts), dtype=np.int64)
+        ends[:-1] = self.starts[1:]
+        ends[self.offsets[1:] - 1] = self.samples
+        return ends - self.starts
+
+    def rasterize(self, width):
+        """
+        States shaped (days, width). Column x shows the state at the sample under
+        the center of the column, so width == samples reproduces the encoded states.
+        """
+        columns = ((np.arange(width) + 0.5) * self.samples / width).astype(np.int64)
+        keys = self.run_days() * self.samples + self.starts
+        queries = np.arange(self.days)[:, np.newaxis] * self.samples + columns[np.newaxis, :]
+        return self.codes[np.searchsorted(keys, queries, side="right") - 1]
+
+    def to_states(self):
+        return self.rasterize(self.samples)
+
+    def minutes_per_state(self, n_states=None):
+        """
+        Minutes of each state per day shaped (days, n_states)
+        """
+        if n_states is None:
+            n_states = len(self.state_codes) if self.state_codes is not None else int(self.codes.max()) + 1
+        counts = np.bincount(self.run_days() * n_states + self.codes, weights=self.run_lengths(),
+                             minlength=self.days * n_states)
+        return counts.reshape(self.days, n_states).astype(np.int64) * self.interval_minutes
+
+    def to_bytes(self):
+        """
+        Serialize as a fixed header, the JSON state names, then the zlib compressed
+        runs per day (uint16), run starts (uint16) and run codes (uint8)
+        """
+        names = json.dumps(self.state_codes).encode("utf-8")
+        runs = np.diff(self.offsets).astype("<u2").tobytes() + \
+            self.starts.astype("<u2").tobytes() + self.codes.astype("u1").tobytes()
+        return HEADER.pack(MAGIC, VERSION, self.days, self.samples, self.interval_minutes, len(self.starts)) + \
+            struct.pack("<I", len(names)) + names + zlib.compress(runs, 9)
+
+    @staticmethod
+    def from_bytes(data):
+        magic, version, days, samples, interval_minutes, n_runs = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise Exception("Not version %d run-length year data" % VERSION)
+        at = HEADER.size
+        (names_length,) = struct.unpack_from("<I", data, at)
+        at += 4
+        state_codes = json.loads(data[at:at + names_length].decode("utf-8"))
+        runs = zlib.decompress(data[at + names_length:])
+        runs_per_day = np.frombuffer(runs, dtype="<u2", count=days)
+        starts = np.frombuffer(runs, dtype="<u2", count=n_runs, offset=2 * days).astype(np.uint16)
+        codes = np.frombuffer(runs, dtype="u1", count=n_runs, offset=2 * days + 2 * n_runs).copy()
+        offsets = np.zeros(days + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(runs_per_day)
+        return RunLengthYear(offsets, starts, codes, samples, interval_minutes, state_codes)
+
+    def save(self, filename):
+        with open(filename, "wb") as f:
+            f.write(self.to_bytes())
+
+    @staticmethod
+    def load(filename):
+        with open(filename, "rb") as f:
+            return RunLengthYear.from_bytes(f.read())
+
+
+def main_except(argv):
+    import twilight as TW
+
+    parser = OptionParser()
+
+    parser.add_option("-o", "--o-lat", action="store", type="float", dest="o_lat",
+                      default=TW.Constants.OBSERVER_LAT_DEG,
+                      help="Observer latitude in degrees north. default=%s" % TW.Constants.OBSERVER_LAT_DEG)
+    parser.add_option("-f", "--filename", action="store", type="string", dest="filename", default=None,
+                      help="Write the run-length encoded year view states to FILE", metavar="FILE")
+
+    (options, args) = parser.parse_args(argv[1:])
+
+    ctx = TW.RenderContext()
+    grid = TW.SolarGrid.compute(ctx, "year", options.o_lat)
+    year = grid.run_lengths(ctx.ds)
+    data = year.to_bytes()
+    print("%d days, %d runs, %d bytes in memory, %d bytes serialized, %d bytes of dense states"
+          % (year.days, len(year.starts), year.nbytes, len(data), grid.cos_zenith.size))
+    if options.filename is not None:
+        year.save(options.filename)
+
+
+def main(argv):
+    try:
+        main_except(argv)
+        return 0
+    except Exception as e:
+        traceback.print_exc()
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))